@@ -1,23 +1,23 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from core.deadlines import budget
+from core.llm import get_provider
+from core.risk import RISK_SCHEMA, build_risk_prompt, llm_error, parse_analysis
+from core.tokens import RISK_TOKEN_BUDGET, fit_prompt
+
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini AI
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Configure the LLM provider (Gemini unless LLM_PROVIDER selects the local stub)
+llm = get_provider()
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
-        print("do_POST method called")
-        print(f"GEMINI_API_KEY: {os.getenv('GEMINI_API_KEY')}")
         try:
-            if not GEMINI_API_KEY:
+            if not llm.configured:
                 self.send_response(500)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
@@ -39,80 +39,21 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps(response).encode())
                 return
             
-            prompt = f"""You are an expert legal analyst specializing in contract risk assessment. Analyze the following contract document and identify potential risk factors.
-
-Contract Document:
-{text}
-
-Please provide a comprehensive risk analysis in the following JSON format:
-{{
-    "overall_risk_level": "Low/Medium/High",
-    "risk_categories": [
-        {{
-            "category": "Financial Risk",
-            "level": "Low/Medium/High",
-            "description": "Brief description of the risk",
-            "specific_clauses": ["List of specific problematic clauses or sections"],
-            "recommendations": ["List of recommended actions or mitigations"]
-        }}
-    ],
-    "key_concerns": ["List of the most critical issues"],
-    "missing_protections": ["List of protections that should be included but are missing"],
-    "summary": "Brief overall assessment and recommendations"
-}}
-
-Focus on these risk categories:
-1. Financial Risk (payment terms, penalties, liability caps)
-2. Performance Risk (delivery obligations, service levels, warranties)
-3. Legal/Compliance Risk (regulatory requirements, indemnification, governing law)
-4. Operational Risk (termination clauses, force majeure, data security)
-5. Reputation Risk (confidentiality, non-disparagement, publicity)
-6. Intellectual Property Risk (IP ownership, licensing, infringement)
+            prompt, token_budget = fit_prompt(build_risk_prompt, text, RISK_TOKEN_BUDGET, None, llm)
 
-Be thorough but concise. Only return valid JSON."""
-
-            model = genai.GenerativeModel("gemini-1.5-flash-latest")
-            response_obj = model.generate_content(prompt)
-            answer = response_obj.text if hasattr(response_obj, 'text') else str(response_obj)
-            
-            # Try to parse as JSON, if it fails return as text
-            try:
-                # Clean the response to extract JSON
-                answer = answer.strip()
-                if answer.startswith("```json"):
-                    answer = answer[7:]
-                if answer.endswith("```"):
-                    answer = answer[:-3]
-                answer = answer.strip()
-                
-                parsed_response = json.loads(answer)
-                analysis = parsed_response
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return as structured text
-                analysis = {"raw_analysis": answer}
+            # JSON mode with the RiskAnalysis schema; anything malformed is repaired locally
+            with budget("analysis"):
+                answer = llm.generate(prompt, schema=RISK_SCHEMA)
+            analysis = parse_analysis(answer)
             
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            response = {"analysis": analysis}
+            response = {"analysis": analysis, "token_budget": token_budget}
             self.wfile.write(json.dumps(response).encode())
             
         except Exception as e:
-            error_message = str(e)
-            
-            # Handle specific API errors
-            status_code = 500
-            if "429" in error_message or "quota" in error_message.lower() or "rate limit" in error_message.lower():
-                status_code = 429
-                error_message = "🚫 API Rate Limit Exceeded: You've reached the free tier limit for Gemini API. Please wait a few minutes before trying again."
-            elif "401" in error_message or "unauthorized" in error_message.lower():
-                status_code = 401
-                error_message = "🔑 API Key Error: Please check that your Gemini API key is valid and properly configured."
-            elif "403" in error_message or "forbidden" in error_message.lower():
-                status_code = 403
-                error_message = "🚫 API Access Denied: Your API key may not have permission to access the Gemini API."
-            else:
-                error_message = f"🤖 AI Error: {error_message}"
+            status_code, error_message = llm_error(e)
             
             self.send_response(status_code)
             self.send_header('Content-type', 'application/json')
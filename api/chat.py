@@ -1,28 +1,29 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from core.context_cache import get_context_cache
+from core.deadlines import budget
+from core.llm import get_provider
+from core.risk import llm_error
+from core.router import record_route, route_question
+from core.sessions import CHAT_HISTORY_TURNS, format_history, get_sessions
+from core.tokens import CHAT_TOKEN_BUDGET, fit_prompt
+
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini AI
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Configure the LLM provider (Gemini unless LLM_PROVIDER selects the local stub)
+llm = get_provider()
+
+# Vercel returns the response only when the handler returns, so a fold delays its turn by an LLM
+# call. Turns are folded in batches: once this many are past CHAT_HISTORY_TURNS, not every turn.
+FOLD_BATCH_TURNS = 4
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         try:
-            if not GEMINI_API_KEY:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                response = {"error": "Gemini API key not configured"}
-                self.wfile.write(json.dumps(response).encode())
-                return
-            
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             data = json.loads(post_data.decode())
@@ -38,40 +39,64 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps(response).encode())
                 return
             
-            prompt = f"""You are an expert document assistant. Here is the extracted document data:
+            # Recent turns verbatim plus a running summary of older ones keep follow-ups in context
+            sessions = get_sessions()
+            session = sessions.resume(data.get('session_id'), text) if sessions else None
+            history = format_history(session)
+            
+            # Lookups ("when does it expire?") are answered from the document itself, with a citation
+            route, answer, citation = route_question(text, question)
+            if answer is None and not llm.configured:
+                self.send_response(500)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                response = {"error": "Gemini API key not configured"}
+                self.wfile.write(json.dumps(response).encode())
+                return
+            
+            # Long documents are cached provider-side once; every question then sends only itself
+            context_cache = get_context_cache()
+            if answer is not None:
+                token_budget = None
+            elif context_cache and context_cache.cacheable(text):
+                with budget("chat"):
+                    answer, token_budget = context_cache.answer(text, question, history)
+                route["path"] = "context_cache"
+            else:
+                def build_prompt(document):
+                    return f"""You are an expert document assistant. Here is the extracted document data:
 
-{text}
+{document}
 
-User question: {question}
+{history}User question: {question}
 
 Please provide a helpful, accurate, and detailed answer based on the document content."""
 
-            model = genai.GenerativeModel("gemini-1.5-flash-latest")
-            response_obj = model.generate_content(prompt)
-            answer = response_obj.text if hasattr(response_obj, 'text') else str(response_obj)
+                prompt, token_budget = fit_prompt(build_prompt, text, CHAT_TOKEN_BUDGET, question, llm)
+
+                with budget("chat"):
+                    answer = llm.generate(prompt)
+            
+            record_route(route)
+            if session:
+                sessions.add_turn(session["id"], question, answer)
             
+            body = json.dumps({"answer": answer, "token_budget": token_budget, "route": route, "citation": citation,
+                               "session_id": session["id"] if session else None}).encode()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            response = {"answer": answer}
-            self.wfile.write(json.dumps(response).encode())
+            self.wfile.write(body)
+            self.wfile.flush()
             
-        except Exception as e:
-            error_message = str(e)
+            # Fold old turns into the summary after the body is written. A server that honours
+            # Content-Length has answered by now; on Vercel this turn waits, hence the batches.
+            if session and llm.configured and len(session["turns"]) + 1 >= CHAT_HISTORY_TURNS + FOLD_BATCH_TURNS:
+                sessions.fold(session["id"], llm)
             
-            # Handle specific API errors
-            status_code = 500
-            if "429" in error_message or "quota" in error_message.lower() or "rate limit" in error_message.lower():
-                status_code = 429
-                error_message = "🚫 API Rate Limit Exceeded: You've reached the free tier limit for Gemini API. Please wait a few minutes before trying again."
-            elif "401" in error_message or "unauthorized" in error_message.lower():
-                status_code = 401
-                error_message = "🔑 API Key Error: Please check that your Gemini API key is valid and properly configured."
-            elif "403" in error_message or "forbidden" in error_message.lower():
-                status_code = 403
-                error_message = "🚫 API Access Denied: Your API key may not have permission to access the Gemini API."
-            else:
-                error_message = f"🤖 AI Error: {error_message}"
+        except Exception as e:
+            status_code, error_message = llm_error(e)
             
             self.send_response(status_code)
             self.send_header('Content-type', 'application/json')
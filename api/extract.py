@@ -1,29 +1,37 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import os
-import tempfile
 import base64
-from docx import Document
-from PyPDF2 import PdfReader
+from urllib.parse import parse_qs, urlparse
 from dotenv import load_dotenv
 
+from core.extraction import PageRangeError, UnsupportedFormat, check_format, extract_pages, page_count
+from core.normalize import normalize_pages
+from core.pdf_text import check_backend
+from core.terms import extract_terms
+
 # Load environment variables
 load_dotenv()
 
-def extract_text_from_pdf(file_path):
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
-
-def extract_text_from_docx(file_path):
-    doc = Document(file_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         try:
+            # Optional ?first_page=&last_page= range (e.g. a quick preview)
+            query = parse_qs(urlparse(self.path).query)
+            first_page = int(query.get('first_page', ['1'])[0])
+            last_page = int(query['last_page'][0]) if 'last_page' in query else None
+            page_range = (first_page, last_page) if first_page > 1 or last_page is not None else None
+            # Optional ?pdf_backend= for this document's text layer (core.pdf_text)
+            pdf_backend = query['pdf_backend'][0] if 'pdf_backend' in query else None
+            if pdf_backend is not None:
+                try:
+                    check_backend(pdf_backend)
+                except ValueError as e:
+                    self.send_response(400)
+                    self.send_header('Content-type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"error": str(e)}).encode())
+                    return
+            
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
             
@@ -39,43 +47,42 @@ class handler(BaseHTTPRequestHandler):
                         lines = part.split(b'\r\n')
                         file_content = b'\r\n'.join(lines[4:-1])  # Remove headers and boundary
                         
-                        # Determine file type from filename
-                        filename_line = [line for line in lines if b'filename=' in line][0]
-                        filename = filename_line.decode().split('filename="')[1].split('"')[0]
-                        
-                        # Save to temp file and extract text
-                        suffix = os.path.splitext(filename)[-1].lower()
-                        
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                            tmp.write(file_content)
-                            tmp.flush()
-                            file_path = tmp.name
+                        # Determine file type from its content; the filename may be wrong
+                        try:
+                            fmt = check_format(file_content)
+                        except UnsupportedFormat as e:
+                            self.send_response(400)
+                            self.send_header('Content-type', 'application/json')
+                            self.end_headers()
+                            self.wfile.write(json.dumps({"error": str(e)}).encode())
+                            break
                         
+                        # Extract straight from the request body; no temp file
                         try:
-                            if suffix == ".pdf":
-                                text = extract_text_from_pdf(file_path)
-                            elif suffix == ".docx":
-                                text = extract_text_from_docx(file_path)
-                            else:
-                                raise ValueError("Unsupported file type")
+                            pages = extract_pages(file_content, fmt, page_range=page_range, pdf_backend=pdf_backend)
+                            count = page_count(file_content, fmt, pdf_backend) if page_range else len(pages)
+                            text, normalization = normalize_pages(pages)
+                            first = max(first_page, 1)
                             
                             self.send_response(200)
                             self.send_header('Content-type', 'application/json')
                             self.end_headers()
-                            response = {"text": text}
+                            response = {"text": text, "normalization": normalization,
+                                        "terms": extract_terms(text), "page_count": count,
+                                        "first_page": first, "last_page": first + len(pages) - 1}
                             self.wfile.write(json.dumps(response).encode())
                             
+                        except PageRangeError as e:
+                            self.send_response(400)
+                            self.send_header('Content-type', 'application/json')
+                            self.end_headers()
+                            self.wfile.write(json.dumps({"error": str(e)}).encode())
                         except Exception as e:
                             self.send_response(500)
                             self.send_header('Content-type', 'application/json')
                             self.end_headers()
                             response = {"error": str(e)}
                             self.wfile.write(json.dumps(response).encode())
-                        finally:
-                            try:
-                                os.unlink(file_path)
-                            except:
-                                pass
                         break
             else:
                 self.send_response(400)
@@ -1,30 +1,58 @@
 # Force rebuild
-from fastapi import FastAPI, UploadFile, File, Form, Request
+from fastapi import BackgroundTasks, FastAPI, UploadFile, File, Form, Request
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import tempfile
 import os
 import pandas as pd
-from docx import Document
-from PyPDF2 import PdfReader
-import pytesseract
-from pdf2image import convert_from_path
 from PIL import Image
-import google.generativeai as genai
+from typing import Optional
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import json
+import asyncio
+
+from core.admission import install_admission_control
+from core.clauses import build_review_prompt, get_library
+from core.context_cache import get_context_cache
+from core.deadlines import install_deadlines
+from core.extraction import PageRangeError, UnsupportedFormat, check_format, extract_pages, page_count
+from core.health import install_readiness_api
+from core.jobs import install_job_api
+from core.llm import get_provider
+from core.metrics import instrument_app
+from core.normalize import normalize_pages
+from core.pdf_text import check_backend
+from core.profiling import install_profiling
+from core.risk import RISK_SCHEMA, install_risk_stream_api, llm_error, parse_analysis, prepare_analysis
+from core.router import record_route, route_question
+from core.sessions import format_history, get_sessions
+from core.store import get_store, install_store_api
+from core.terms import extract_terms
+from core.timing import stage
+from core.tokens import CHAT_TOKEN_BUDGET, RISK_TOKEN_BUDGET, fit_prompt
 
 # Load environment variables
 load_dotenv()
 
 app = FastAPI(title="Contracts.AI", description="Contract Risk Analysis & Document Chat")
-
-# Configure Gemini AI
+install_admission_control(app)
+instrument_app(app)
+install_deadlines(app)
+install_profiling(app)
+store = get_store()
+install_store_api(app, store)
+# Background extraction jobs need a long-lived process; Vercel freezes functions between requests
+if not os.getenv("VERCEL"):
+    install_job_api(app, store=store)
+
+# Configure the LLM provider (Gemini unless LLM_PROVIDER selects the local stub)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+llm = get_provider()
+install_risk_stream_api(app, llm, store)
+install_readiness_api(app, llm, store)
+context_cache = get_context_cache()
+sessions = get_sessions()
 
 # Mount static files and templates - handle if directories don't exist
 try:
@@ -41,30 +69,14 @@ except:
 class ChatRequest(BaseModel):
     text: str
     question: str
+    session_id: Optional[str] = None
 
 class RiskAnalysisRequest(BaseModel):
     text: str
 
-def extract_text_from_pdf(file_path):
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
-
-def extract_text_from_pdf_ocr(file_path):
-    try:
-        images = convert_from_path(file_path)
-        text = ""
-        for img in images:
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            text += pytesseract.image_to_string(img)
-        return text
-    except Exception as e:
-        raise Exception(f"OCR processing failed: {str(e)}. Make sure Tesseract and Poppler are installed.")
-
-
+class ClauseCompareRequest(BaseModel):
+    text: str
+    explain: bool = False
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -318,178 +330,182 @@ async def home(request: Request):
             </script>
         </body>
         </html>
-        ")
+        """)
 
 @app.post("/extract")
-async def extract(file: UploadFile = File(...)):
+async def extract(file: UploadFile = File(...), first_page: int = 1, last_page: Optional[int] = None,
+                  pdf_backend: Optional[str] = None):
     if not file:
         return JSONResponse({"error": "No file uploaded"}, status_code=400)
     
-    suffix = os.path.splitext(file.filename)[-1].lower()
-    
-    if suffix not in [".pdf", ".docx"]:
-        return JSONResponse({"error": "Unsupported file type. Only PDF and DOCX files are supported."}, status_code=400)
+    # Parsed straight from the upload's spooled file (memory-mapped once large); no temp copy
+    source = file.file
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp.flush()
-        file_path = tmp.name
+    # Route by content, not by file name
+    try:
+        fmt = check_format(source)
+    except UnsupportedFormat as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    # ?pdf_backend= reads this document's text layer with another backend (core.pdf_text)
+    if pdf_backend is not None:
+        try:
+            check_backend(pdf_backend)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
     
     try:
-        if suffix == ".pdf":
-            text = extract_text_from_pdf(file_path)
-            if not text.strip():
-                text = extract_text_from_pdf_ocr(file_path)
-        elif suffix == ".docx":
-            text = extract_text_from_docx(file_path)
-        else:
-            return JSONResponse({"error": "Unsupported file type."}, status_code=400)
+        # A page range (e.g. a quick preview) extracts only those pages
+        partial = first_page > 1 or last_page is not None
+        page_range = (first_page, last_page) if partial else None
+        # Off the event loop: parsing and OCR are CPU-bound
+        pages = await asyncio.to_thread(extract_pages, source, fmt, page_range=page_range, pdf_backend=pdf_backend)
+        count = await asyncio.to_thread(page_count, source, fmt, pdf_backend) if partial else len(pages)
+    except PageRangeError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
     except Exception as e:
         return JSONResponse({"error": f"Error extracting text: {str(e)}"}, status_code=500)
-    finally:
-        try:
-            os.unlink(file_path)
-        except:
-            pass
     
-    return {"text": text}
+    with stage("normalize"):
+        text, normalization = await asyncio.to_thread(normalize_pages, pages)
+    # Key terms (parties, dates, amounts, durations) locally, without an LLM call; a regex pass
+    # over the whole text, so off the event loop for long documents
+    with stage("terms"):
+        terms = await asyncio.to_thread(extract_terms, text)
+    document_id = None
+    # Only whole documents are stored
+    if store and not partial:
+        with stage("store_write"):
+            document_id = await asyncio.to_thread(store.save_document, text, file.filename, len(pages))
+    first = max(first_page, 1)
+    return {"text": text, "normalization": normalization, "terms": terms, "document_id": document_id,
+            "page_count": count, "first_page": first, "last_page": first + len(pages) - 1}
+
+async def record_turn(session, req, answer, token_budget, background_tasks, route, citation=None):
+    record_route(route)
+    result = {"answer": answer, "token_budget": token_budget, "route": route, "citation": citation}
+    if session is None:
+        return dict(result, session_id=None)
+    await asyncio.to_thread(sessions.add_turn, session["id"], req.question, answer)
+    # Fold old turns into the summary after the response is sent
+    if llm.configured:
+        background_tasks.add_task(sessions.fold, session["id"], llm)
+    return dict(result, session_id=session["id"])
 
 @app.post("/chat")
-async def chat(req: ChatRequest):
-    if not GEMINI_API_KEY:
-        return JSONResponse(
-            {"error": "Gemini API key not configured. Please check your environment variables."}, 
-            status_code=500
-        )
-    
+async def chat(req: ChatRequest, background_tasks: BackgroundTasks):
     try:
-        prompt = """You are an expert document assistant. Here is the extracted document data:
-
-{req.text}
+        # Recent turns verbatim plus a running summary of older ones keep follow-ups in context
+        session = await asyncio.to_thread(sessions.resume, req.session_id, req.text) if sessions else None
+        history = format_history(session)
 
-User question: {req.question}
+        # Lookups ("when does it expire?") are answered from the document itself, with a citation
+        with stage("route"):
+            route, answer, citation = await asyncio.to_thread(route_question, req.text, req.question)
+        if answer is not None:
+            return await record_turn(session, req, answer, None, background_tasks, route, citation)
 
-Please provide a helpful, accurate, and detailed answer based on the document content.""".format(req=req)
-
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
-        response = model.generate_content(prompt)
-        answer = response.text if hasattr(response, 'text') else str(response)
-        return {"answer": answer}
-    except Exception as e:
-        error_message = str(e)
-        
-        # Handle specific API errors
-        if "429" in error_message or "quota" in error_message.lower() or "rate limit" in error_message.lower():
-            return JSONResponse(
-                {"error": "🚫 API Rate Limit Exceeded: You've reached the free tier limit for Gemini API. Please wait a few minutes before trying again."},
-                status_code=429
-            )
-        elif "401" in error_message or "unauthorized" in error_message.lower():
-            return JSONResponse(
-                {"error": "🔑 API Key Error: Please check that your Gemini API key is valid and properly configured."},
-                status_code=401
-            )
-        elif "403" in error_message or "forbidden" in error_message.lower():
-            return JSONResponse(
-                {"error": "🚫 API Access Denied: Your API key may not have permission to access the Gemini API."},
-                status_code=403
-            )
-        else:
+        if not llm.configured:
             return JSONResponse(
-                {"error": f"🤖 AI Error: {error_message}"},
+                {"error": "Gemini API key not configured. Please check your environment variables."}, 
                 status_code=500
             )
 
+        # Long documents are cached provider-side once; every question then sends only itself
+        if context_cache and context_cache.cacheable(req.text):
+            answer, token_budget = await context_cache.aanswer(req.text, req.question, history)
+            route["path"] = "context_cache"
+            return await record_turn(session, req, answer, token_budget, background_tasks, route)
+
+        def build_prompt(document):
+            return """You are an expert document assistant. Here is the extracted document data:
+
+{document}
+
+{history}User question: {req.question}
+
+Please provide a helpful, accurate, and detailed answer based on the document content.""".format(document=document, history=history, req=req)
+
+        with stage("prompt_build"):
+            prompt, token_budget = await asyncio.to_thread(
+                fit_prompt, build_prompt, req.text, CHAT_TOKEN_BUDGET, req.question, llm
+            )
+
+        with stage("llm_round_trip"):
+            answer = await llm.agenerate(prompt)
+        return await record_turn(session, req, answer, token_budget, background_tasks, route)
+    except Exception as e:
+        status_code, error_message = llm_error(e)
+        return JSONResponse({"error": error_message}, status_code=status_code)
+
 @app.post("/analyze-risks")
 async def analyze_risks(req: RiskAnalysisRequest):
-    if not GEMINI_API_KEY:
+    if not llm.configured:
         return JSONResponse(
             {"error": "Gemini API key not configured. Please check your environment variables."}, 
             status_code=500
         )
     
     try:
-        prompt = """You are an expert legal analyst specializing in contract risk assessment. Analyze the following contract document and identify potential risk factors.
-
-Contract Document:
-{req.text}
-
-Please provide a comprehensive risk analysis in the following JSON format:
-{{
-    "overall_risk_level": "Low/Medium/High",
-    "risk_categories": [
-        {{
-            "category": "Financial Risk",
-            "level": "Low/Medium/High",
-            "description": "Brief description of the risk",
-            "specific_clauses": ["List of specific problematic clauses or sections"],
-            "recommendations": ["List of recommended actions or mitigations"]
-        }}
-    ],
-    "key_concerns": ["List of the most critical issues"],
-    "missing_protections": ["List of protections that should be included but are missing"],
-    "summary": "Brief overall assessment and recommendations"
-}}
-
-Focus on these risk categories:
-1. Financial Risk (payment terms, penalties, liability caps)
-2. Performance Risk (delivery obligations, service levels, warranties)
-3. Legal/Compliance Risk (regulatory requirements, indemnification, governing law)
-4. Operational Risk (termination clauses, force majeure, data security)
-5. Reputation Risk (confidentiality, non-disparagement, publicity)
-6. Intellectual Property Risk (IP ownership, licensing, infringement)
-
-Be thorough but concise. Only return valid JSON.""".format(req=req)
-
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
-        response = model.generate_content(prompt)
-        answer = response.text if hasattr(response, 'text') else str(response)
-        
-        # Try to parse as JSON, if it fails return as text
-        try:
-            # Clean the response to extract JSON
-            answer = answer.strip()
-            if answer.startswith("```json"):
-                answer = answer[7:]
-            if answer.endswith("```"):
-                answer = answer[:-3]
-            answer = answer.strip()
-            
-            parsed_response = json.loads(answer)
-            return {"analysis": parsed_response}
-        except json.JSONDecodeError:
-            # If JSON parsing fails, return as structured text
-            return {"analysis": {"raw_analysis": answer}}
+        # Near-duplicates of an analyzed contract reuse its analysis and send only the changed sections
+        plan = await prepare_analysis(req.text, llm, store)
+        if "analysis" in plan:
+            return plan
+
+        # JSON mode with the RiskAnalysis schema; anything malformed is repaired locally
+        with stage("llm_round_trip"):
+            answer = await llm.agenerate(plan["prompt"], schema=RISK_SCHEMA)
+
+        with stage("risk_json_parse"):
+            analysis = parse_analysis(answer)
+        if store and "raw_analysis" not in analysis:
+            with stage("store_write"):
+                await asyncio.to_thread(store.save_analysis, req.text, analysis)
+        return {"analysis": analysis, "token_budget": plan["token_budget"], "near_duplicate": plan["near_duplicate"]}
             
     except Exception as e:
-        error_message = str(e)
-        
-        # Handle specific API errors
-        if "429" in error_message or "quota" in error_message.lower() or "rate limit" in error_message.lower():
-            return JSONResponse(
-                {"error": "🚫 API Rate Limit Exceeded: You've reached the free tier limit for Gemini API. Please wait a few minutes before trying again."},
-                status_code=429
-            )
-        elif "401" in error_message or "unauthorized" in error_message.lower():
-            return JSONResponse(
-                {"error": "🔑 API Key Error: Please check that your Gemini API key is valid and properly configured."},
-                status_code=401
-            )
-        elif "403" in error_message or "forbidden" in error_message.lower():
-            return JSONResponse(
-                {"error": "🚫 API Access Denied: Your API key may not have permission to access the Gemini API."},
-                status_code=403
-            )
-        else:
-            return JSONResponse(
-                {"error": f"🤖 AI Error: {error_message}"},
-                status_code=500
+        status_code, error_message = llm_error(e)
+        return JSONResponse({"error": error_message}, status_code=status_code)
+
+@app.post("/clauses/compare")
+async def compare_clauses(req: ClauseCompareRequest):
+    library = await asyncio.to_thread(get_library)
+    if library is None:
+        return JSONResponse(
+            {"error": "Clause library not found. Set CLAUSE_LIBRARY_PATH to a JSON list of approved clauses."},
+            status_code=500
+        )
+
+    # Local similarity scoring; the LLM only sees clauses that deviate from the library
+    with stage("clause_compare"):
+        clauses, summary = await asyncio.to_thread(library.compare, req.text)
+    result = {"clauses": clauses, "summary": summary, "review": None, "token_budget": None}
+    deviations = [clause for clause in clauses if clause["status"] == "deviation"]
+    if not (req.explain and deviations):
+        return result
+
+    if not llm.configured:
+        return JSONResponse(
+            {"error": "Gemini API key not configured. Please check your environment variables."}, 
+            status_code=500
+        )
+    
+    try:
+        build_prompt, document = build_review_prompt(deviations, library)
+        with stage("prompt_build"):
+            prompt, result["token_budget"] = await asyncio.to_thread(
+                fit_prompt, build_prompt, document, RISK_TOKEN_BUDGET, None, llm
             )
 
+        with stage("llm_round_trip"):
+            result["review"] = await llm.agenerate(prompt)
+        return result
+    except Exception as e:
+        status_code, error_message = llm_error(e)
+        return JSONResponse({"error": error_message}, status_code=status_code)
+
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "gemini_configured": bool(GEMINI_API_KEY)}
+    return {"status": "healthy", "gemini_configured": bool(GEMINI_API_KEY), "llm_provider": llm.name}
 
 # For Vercel deployment
 from mangum import Mangum
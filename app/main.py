@@ -1,22 +1,28 @@
 import streamlit as st
 import pandas as pd
-import tempfile
 import os
-from docx import Document
-from PyPDF2 import PdfReader
-from PIL import Image
-import pytesseract
-import google.generativeai as genai
+import sys
+import threading
 from dotenv import load_dotenv
 
+# `streamlit run app/main.py` only puts app/ on sys.path; the shared core package lives one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.context_cache import get_context_cache
+from core.deadlines import budget
+from core.extraction import UnsupportedFormat, check_format, extract_pages, supported_suffixes
+from core.llm import get_provider
+from core.normalize import normalize_pages
+from core.router import record_route, route_question
+from core.sessions import format_history, get_sessions
+from core.tables import describe_schema, infer_types
+from core.tokens import CHAT_TOKEN_BUDGET, fit_prompt
+
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini AI
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+# Configure the LLM provider (Gemini unless LLM_PROVIDER selects the local stub)
+llm = get_provider()
+if not llm.configured:
     st.error("⚠️ GEMINI_API_KEY not found in .env file. Please check your configuration.")
     st.stop()
 
@@ -31,49 +37,20 @@ if "chat_history" not in st.session_state:
 
 # File upload section
 st.header("📄 Document Upload")
-uploaded_file = st.file_uploader("Upload a PDF or Word file", type=["pdf", "docx"])
+uploaded_file = st.file_uploader(
+    "Upload a PDF, Word, text or image file", type=[suffix.lstrip(".") for suffix in supported_suffixes()]
+)
 
 @st.cache_data
-def extract_text_from_pdf(file):
-    reader = PdfReader(file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
-
-def extract_text_from_pdf_ocr(file):
-    images = []
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(file.read())
-        tmp.flush()
-        try:
-            from pdf2image import convert_from_path
-            images = convert_from_path(tmp.name)
-        except Exception as e:
-            st.error(f"Error converting PDF to images: {e}")
-            os.unlink(tmp.name)
-            return ""
-    text = ""
-    for img in images:
-        # Convert to RGB just in case
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        try:
-            text += pytesseract.image_to_string(img)
-        except Exception as e:
-            st.error(f"OCR error: {e}")
-    os.unlink(tmp.name)
-    return text
-
-@st.cache_data
-def extract_text_from_docx(file):
-    doc = Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
+def extract_document(content):
+    """Pages of an upload, routed by its content (see core.extraction); cached per file content."""
+    return extract_pages(content, check_format(content))
 
 def text_to_dataframe_with_header(text):
+    """The table the user picks out of ``text``, with typed columns, and its schema (see core.tables)."""
     lines = [l.strip() for l in text.splitlines() if l.strip()]
     if not lines:
-        return pd.DataFrame()
+        return pd.DataFrame(), []
     st.write("Preview of extracted lines:")
     for idx, line in enumerate(lines[:10]):
         st.write(f"{idx+1}: {line}")
@@ -101,33 +78,26 @@ def text_to_dataframe_with_header(text):
         # Auto split on whitespace
         columns = [h.strip() for h in header.split()]
         data = [l.split() for i, l in enumerate(lines) if i != header_idx]
-    df = pd.DataFrame(data, columns=columns)
-    return df
+    return infer_types(pd.DataFrame(data, columns=columns))
 
 if uploaded_file:
-    file_type = uploaded_file.name.split(".")[-1].lower()
-    
     with st.spinner("Extracting text from document..."):
-        if file_type == "pdf":
-            try:
-                text = extract_text_from_pdf(uploaded_file)
-                if not text.strip():
-                    uploaded_file.seek(0)
-                    text = extract_text_from_pdf_ocr(uploaded_file)
-            except Exception:
-                uploaded_file.seek(0)
-                text = extract_text_from_pdf_ocr(uploaded_file)
-        elif file_type == "docx":
-            text = extract_text_from_docx(uploaded_file)
-        else:
-            st.error("Unsupported file type.")
+        try:
+            pages = extract_document(uploaded_file.getvalue())
+        except UnsupportedFormat as e:
+            st.error(str(e))
+            st.stop()
+        except Exception as e:
+            st.error(f"Error extracting text: {e}")
             st.stop()
+        text, normalization = normalize_pages(pages)
     
     # Store extracted text in session state
     st.session_state.extracted_text = text
     
     # Display success message
     st.success(f"✅ Successfully extracted text from {uploaded_file.name}")
+    st.caption(f"Normalization removed {normalization['reduction_pct']}% of the raw extracted characters.")
     
     # Show extracted text in an expandable section
     with st.expander("📄 View Extracted Text", expanded=False):
@@ -143,6 +113,11 @@ if st.session_state.extracted_text:
             st.markdown(f"**👤 You:** {question}")
             st.markdown(f"**🤖 AI:** {answer}")
             st.markdown("---")
+
+    if st.session_state.get("last_token_budget"):
+        usage = st.session_state.last_token_budget
+        note = " (document trimmed to the most relevant sections)" if usage["fitted"] else ""
+        st.caption(f"Last prompt: {usage['prompt_tokens']:,} of {usage['budget']:,} tokens{note}")
     
     # Chat input
     question = st.text_input("Ask a question about your document:", 
@@ -152,22 +127,52 @@ if st.session_state.extracted_text:
         if question.strip():
             with st.spinner("AI is analyzing your document..."):
                 try:
-                    # Create prompt for Gemini
-                    prompt = f"""You are an expert document assistant. Here is the extracted document data:
-
-{st.session_state.extracted_text}
-
-User question: {question}
+                    # Recent turns verbatim plus a running summary of older ones keep follow-ups in context
+                    sessions = get_sessions()
+                    session = sessions.resume(
+                        st.session_state.get("chat_session_id"), st.session_state.extracted_text
+                    ) if sessions else None
+                    history = format_history(session)
+
+                    # Lookups ("when does it expire?") are answered from the document itself, with a citation
+                    route, answer, _ = route_question(st.session_state.extracted_text, question)
+                    # Long documents are cached provider-side once; every question then sends only itself
+                    context_cache = get_context_cache()
+                    if answer is not None:
+                        token_budget = None
+                    elif context_cache and context_cache.cacheable(st.session_state.extracted_text):
+                        with budget("chat"):
+                            answer, token_budget = context_cache.answer(st.session_state.extracted_text, question, history)
+                        route["path"] = "context_cache"
+                    else:
+                        # Create prompt for Gemini, fitted to the token budget
+                        def build_prompt(document):
+                            return f"""You are an expert document assistant. Here is the extracted document data:
+
+{document}
+
+{history}User question: {question}
 
 Please provide a helpful, accurate, and detailed answer based on the document content."""
 
-                    # Generate response using Gemini
-                    model = genai.GenerativeModel("gemini-1.5-flash-latest")
-                    response = model.generate_content(prompt)
-                    answer = response.text if hasattr(response, 'text') else str(response)
+                        prompt, token_budget = fit_prompt(
+                            build_prompt, st.session_state.extracted_text, CHAT_TOKEN_BUDGET, question, llm
+                        )
+
+                        # Generate response using the configured LLM provider
+                        with budget("chat"):
+                            answer = llm.generate(prompt)
+                    record_route(route)
+                    st.session_state.last_token_budget = token_budget
+                    note = "\n\n*⚡ Answered from the document, without an AI call.*" if route["path"] == "local" else ""
                     
                     # Add to chat history
-                    st.session_state.chat_history.append((question, answer))
+                    st.session_state.chat_history.append((question, answer + note))
+                    if session:
+                        st.session_state.chat_session_id = session["id"]
+                        sessions.add_turn(session["id"], question, answer)
+                        # Fold old turns into the summary without holding up the answer
+                        threading.Thread(target=sessions.fold, args=(session["id"], llm), daemon=True).start()
                     
                     # Rerun to show the new chat
                     st.rerun()
@@ -180,6 +185,7 @@ Please provide a helpful, accurate, and detailed answer based on the document co
     # Clear chat button
     if st.button("🗑️ Clear Chat History"):
         st.session_state.chat_history = []
+        st.session_state.chat_session_id = None
         st.rerun()
 
 else:
@@ -188,9 +194,10 @@ else:
 # Data extraction section (optional)
 if st.session_state.extracted_text:
     with st.expander("📊 Extract Data as Table (Optional)", expanded=False):
-        df = text_to_dataframe_with_header(st.session_state.extracted_text)
+        df, schema = text_to_dataframe_with_header(st.session_state.extracted_text)
         if not df.empty:
             st.dataframe(df)
+            st.caption("Column types: " + "; ".join(describe_schema(schema)))
         else:
             st.info("No tabular data detected in the document.")
 
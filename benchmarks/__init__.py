@@ -0,0 +1 @@
+"""Performance benchmarks for contracts.ai (run from the repository root)."""
@@ -0,0 +1,219 @@
+"""Extraction benchmarks over the synthetic contract corpus.
+
+Every (document, extractor) pair runs in a fresh process so that peak RSS is
+attributable to that extractor alone. Results are written as JSON and can be
+diffed against a previous run with ``--compare``::
+
+    python -m benchmarks.bench_extraction --sizes 1,10,100 --out before.json
+    # ... change an extractor ...
+    python -m benchmarks.bench_extraction --sizes 1,10,100 --out after.json --compare before.json
+
+Fidelity is scored against the corpus's ground truth: ``word_f1`` counts the
+words recovered, whatever their order; ``order_f1`` counts pairs of adjacent
+words, so merged words and text read out of order lower it.
+``--pdf-backends all`` runs the PDF text layer through every installed
+backend (``core.pdf_text``), as ``pdf:<backend>``.
+"""
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, DEFAULT_SIZES, KINDS, build_corpus, ground_truth
+
+# Which extractors a document kind is pushed through. Scanned PDFs go through
+# the text-layer probe first because that is what /extract does before OCR.
+EXTRACTORS = {
+    "text_pdf": ("pdf",),
+    "layout_pdf": ("pdf",),
+    "scanned_pdf": ("pdf", "pdf_ocr"),
+    "docx": ("docx",),
+}
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _f1(found, expected):
+    overlap = sum((found & expected).values())
+    total = sum(found.values()) + sum(expected.values())
+    return 2 * overlap / total if total else 1.0
+
+
+def fidelity(text, truth):
+    """``word_f1`` and ``order_f1`` of ``text`` against the ground ``truth`` (1.0 is a perfect copy)."""
+    words, expected = text.split(), truth.split()
+    return {
+        "word_f1": _f1(collections.Counter(words), collections.Counter(expected)),
+        "order_f1": _f1(collections.Counter(zip(words, words[1:])), collections.Counter(zip(expected, expected[1:]))),
+    }
+
+
+def _run_case(extractor, path):
+    """Executed in a child process: run one extractor over one document."""
+    from core import extraction
+
+    name, _, backend = extractor.partition(":")
+    func = {
+        "pdf": extraction.extract_text_from_pdf,
+        "pdf_ocr": extraction.extract_text_from_pdf_ocr,
+        "docx": extraction.extract_text_from_docx,
+    }[name]
+    options = {"backend": backend} if backend else {}
+    rss_before = _peak_rss_mb()
+    timings = {}
+    start = time.perf_counter()
+    text = func(path, timings=timings, **options)
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "stages": timings,
+        "chars": len(text),
+        "fidelity": fidelity(text, ground_truth(path)),
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_case(extractor, path):
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(_run_case, extractor, path).result()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _extractors(kind, pdf_backends):
+    for extractor in EXTRACTORS[kind]:
+        if extractor == "pdf" and pdf_backends:
+            yield from (f"pdf:{backend}" for backend in pdf_backends)
+        else:
+            yield extractor
+
+
+def run(kinds, sizes, repeat, corpus_dir, pdf_backends=()):
+    results = []
+    for kind, pages, path in build_corpus(corpus_dir, kinds, sizes):
+        for extractor in _extractors(kind, pdf_backends):
+            runs = [run_case(extractor, path) for _ in range(repeat)]
+            seconds = statistics.median(r["seconds"] for r in runs)
+            stages = {
+                name: statistics.median(r["stages"].get(name, 0.0) for r in runs)
+                for name in runs[0]["stages"]
+            }
+            peaks = [r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None]
+            result = {
+                "kind": kind,
+                "pages": pages,
+                "extractor": extractor,
+                "bytes": os.path.getsize(path),
+                "repeat": repeat,
+                "seconds": seconds,
+                "pages_per_sec": pages / seconds if seconds else None,
+                "stages": stages,
+                "chars": runs[0]["chars"],
+                "fidelity": runs[0]["fidelity"],
+                "peak_rss_mb": max(peaks) if peaks else None,
+                "rss_before_mb": runs[0]["rss_before_mb"],
+            }
+            results.append(result)
+            print(
+                f"{kind:12s} {pages:5d}p {extractor:12s} {seconds:9.3f}s "
+                f"{result['pages_per_sec'] or 0:9.1f} pages/s  "
+                f"words {result['fidelity']['word_f1']:6.1%} order {result['fidelity']['order_f1']:6.1%}  "
+                f"peak {result['peak_rss_mb'] or 0:7.1f} MB",
+                file=sys.stderr,
+            )
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def _key(result):
+    return (result["kind"], result["pages"], result["extractor"])
+
+
+def compare(baseline, current):
+    """Print the pages/sec, fidelity and peak RSS change for every case present in both runs."""
+    before = {_key(r): r for r in baseline["results"]}
+    out = sys.stderr
+    print(f"baseline {baseline['meta'].get('commit')} -> current {current['meta'].get('commit')}", file=out)
+    print(f"{'case':34s} {'pages/s':>20s} {'change':>8s} {'order F1':>16s} {'peak MB':>18s}", file=out)
+    for result in current["results"]:
+        old = before.get(_key(result))
+        if old is None or not old["pages_per_sec"] or not result["pages_per_sec"]:
+            continue
+        change = result["pages_per_sec"] / old["pages_per_sec"] - 1
+        case = "{}/{}/{}".format(*_key(result))
+        # Reports from before fidelity scoring have none
+        order = f"{old['fidelity']['order_f1']:6.1%} -> {result['fidelity']['order_f1']:6.1%}" if "fidelity" in old else ""
+        print(
+            f"{case:34s} {old['pages_per_sec']:9.1f} -> {result['pages_per_sec']:8.1f} "
+            f"{change:+8.1%} {order:>16s} {old['peak_rss_mb'] or 0:8.1f} -> {result['peak_rss_mb'] or 0:7.1f}",
+            file=out,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the document text extractors.")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="comma separated document kinds")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma separated page counts")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="where generated documents are cached")
+    parser.add_argument("--pdf-backends", default="",
+                        help="comma separated PDF text backends to compare, or 'all' installed ones "
+                             "(default: the configured one)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    pdf_backends = [b for b in args.pdf_backends.split(",") if b]
+    if pdf_backends == ["all"]:
+        from core import pdf_text
+
+        pdf_backends = pdf_text.available()
+    report = run(
+        args.kinds.split(","), [int(s) for s in args.sizes.split(",")], args.repeat, args.corpus, pdf_backends
+    )
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Deterministic synthetic contract corpus for the extraction benchmarks.
+
+Four document kinds are generated, each at several page counts:
+
+* ``text_pdf``    - PDF with a real text layer (Helvetica, one content stream per page)
+* ``layout_pdf``  - the same text laid out the way many PDF generators write it: every line
+  positioned on its own, words set apart by kerning instead of spaces, the page footer
+  drawn first and a fee table drawn column by column
+* ``scanned_pdf`` - image-only PDF, every page a grayscale JPEG "scan" of the text
+* ``docx``        - Word document with headings, clause paragraphs and a fee table per page
+
+The PDFs are written by hand so the generator needs nothing beyond Pillow and
+python-docx. Every document is accompanied by a ``.txt`` file holding the
+ground-truth text, which the benchmarks use to score extraction fidelity.
+"""
+import io
+import os
+import random
+
+from docx import Document
+from PIL import Image, ImageDraw, ImageFont
+
+KINDS = ("text_pdf", "layout_pdf", "scanned_pdf", "docx")
+DEFAULT_SIZES = (1, 10, 100, 1000)
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+LINES_PER_PAGE = 44
+LINE_WIDTH = 88
+PAGE_WIDTH_PT = 612
+PAGE_HEIGHT_PT = 792
+# x positions of the fee table's columns in layout_pdf
+TABLE_COLUMNS_PT = (54, 250, 420)
+# Helvetica's space width, in thousandths of an em; layout_pdf shifts words apart by it
+SPACE_ADVANCE = 278
+SCAN_DPI = 150
+
+PARTIES = [
+    "Northwind Traders LLC", "Contoso Holdings Inc.", "Fabrikam Logistics GmbH",
+    "Tailspin Toys Ltd.", "Adventure Works Corp.", "Wide World Importers",
+    "Litware Systems S.A.", "Proseware Analytics plc",
+]
+CLAUSE_TITLES = [
+    "Definitions", "Term and Renewal", "Fees and Payment", "Confidentiality",
+    "Intellectual Property", "Warranties", "Limitation of Liability",
+    "Indemnification", "Termination", "Force Majeure", "Data Protection",
+    "Governing Law", "Notices", "Assignment", "Entire Agreement",
+]
+SENTENCES = [
+    "{a} shall pay {b} the fees set out in Schedule {n} within {d} days of the invoice date.",
+    "This Agreement commences on the Effective Date and continues for an initial term of {n} years.",
+    "Either party may terminate this Agreement on {d} days written notice to the other party.",
+    "{b} shall indemnify {a} against all losses arising from any breach of this clause.",
+    "The aggregate liability of {a} shall not exceed {amount} in any contract year.",
+    "Late payments accrue interest at {p} percent per annum above the base rate.",
+    "Each party shall keep the Confidential Information of the other party strictly confidential.",
+    "All Intellectual Property Rights in the Deliverables vest in {a} upon creation.",
+    "{b} warrants that the Services will be performed with reasonable skill and care.",
+    "Neither party is liable for any delay caused by an event of Force Majeure.",
+    "This Agreement is governed by the laws of England and Wales.",
+    "Any notice shall be delivered by hand or sent by recorded delivery to the registered office.",
+    "{b} shall process Personal Data only on the documented instructions of {a}.",
+    "The Service Levels in Schedule {n} apply from the first day of the second month.",
+]
+
+
+def _wrap(text, width=LINE_WIDTH):
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def contract_pages(pages, seed=0):
+    """Return ``pages`` lists of text lines making up a synthetic contract."""
+    rng = random.Random(seed)
+    a, b = rng.sample(PARTIES, 2)
+    result = []
+    clause_no = 0
+    for page_no in range(1, pages + 1):
+        lines = [f"MASTER SERVICES AGREEMENT - {a} / {b}", ""]
+        while len(lines) < LINES_PER_PAGE - 2:
+            clause_no += 1
+            title = CLAUSE_TITLES[(clause_no - 1) % len(CLAUSE_TITLES)]
+            body = " ".join(
+                rng.choice(SENTENCES).format(
+                    a=a, b=b, n=rng.randint(1, 9), d=rng.choice((14, 30, 45, 60, 90)),
+                    p=rng.choice((2, 4, 8)), amount=f"USD {rng.randint(1, 99) * 10000:,}",
+                )
+                for _ in range(rng.randint(2, 4))
+            )
+            lines.append(f"{clause_no}. {title.upper()}")
+            lines.extend(_wrap(f"{clause_no}.1 {body}"))
+            lines.append("")
+        lines = lines[:LINES_PER_PAGE - 2]
+        lines.extend(["", f"Confidential - Page {page_no} of {pages}"])
+        result.append(lines)
+    return result
+
+
+def _fee_table(page_no):
+    return (("Item", "Unit price", "Quantity"),
+            ("Licence", "USD 1,200.00", str(page_no)),
+            ("Support", "USD 300.00", "12"),
+            ("Training", "USD 950.00", "2"))
+
+
+def with_fee_tables(pages):
+    """``pages`` with a fee table before each footer; table rows are tuples of cells."""
+    result = []
+    for page_no, lines in enumerate(pages, start=1):
+        rows = _fee_table(page_no)
+        body = lines[:LINES_PER_PAGE - len(rows) - 3]
+        result.append(body + [""] + list(rows) + lines[-2:])
+    return result
+
+
+def line_text(line):
+    """A line as read: table rows have their cells in order, separated by spaces."""
+    return " ".join(line) if isinstance(line, tuple) else line
+
+
+def _pdf_escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class _PdfWriter:
+    """Minimal streaming PDF writer: pages are emitted as they are added."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 4  # 1 = catalog, 2 = page tree, 3 = font
+        self.fh.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    def _allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.fh.tell()
+        self.fh.write(f"{obj_id} 0 obj\n".encode())
+        self.fh.write(body)
+        if stream is not None:
+            self.fh.write(b"\nstream\n")
+            self.fh.write(stream)
+            self.fh.write(b"\nendstream")
+        self.fh.write(b"\nendobj\n")
+
+    def _page(self, content, resources):
+        page_id, content_id = self._allocate(), self._allocate()
+        self._object(content_id, f"<< /Length {len(content)} >>".encode(), content)
+        self._object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH_PT} {PAGE_HEIGHT_PT}] "
+            f"/Resources {resources} /Contents {content_id} 0 R >>"
+        ).encode())
+        self.page_ids.append(page_id)
+
+    def add_text_page(self, lines):
+        ops = ["BT", "/F1 10 Tf", "14 TL", f"54 {PAGE_HEIGHT_PT - 54} Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        self._page("\n".join(ops).encode("latin-1"), "<< /Font << /F1 3 0 R >> >>")
+
+    def add_layout_page(self, lines):
+        def show(x, y, text):
+            words = f" -{SPACE_ADVANCE} ".join(f"({_pdf_escape(word)})" for word in text.split(" "))
+            return f"BT /F1 10 Tf 1 0 0 1 {x} {y} Tm [{words}] TJ ET"
+
+        top = PAGE_HEIGHT_PT - 54
+        *body, footer = lines
+        ops = [show(54, top - 14 * len(body), footer)]
+        rows = []
+        for number, line in enumerate(body):
+            if isinstance(line, tuple):
+                rows.append((top - 14 * number, line))
+            elif line:
+                ops.append(show(54, top - 14 * number, line))
+        for column, x in enumerate(TABLE_COLUMNS_PT):
+            ops.extend(show(x, y, cells[column]) for y, cells in rows)
+        self._page("\n".join(ops).encode("latin-1"), "<< /Font << /F1 3 0 R >> >>")
+
+    def add_image_page(self, jpeg, width, height):
+        image_id = self._allocate()
+        self._object(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>"
+        ).encode(), jpeg)
+        content = f"q {PAGE_WIDTH_PT} 0 0 {PAGE_HEIGHT_PT} 0 0 cm /Im0 Do Q".encode()
+        self._page(content, f"<< /XObject << /Im0 {image_id} 0 R >> >>")
+
+    def close(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_at = self.fh.tell()
+        size = self.next_id
+        self.fh.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, size):
+            self.fh.write(f"{self.offsets[obj_id]:010d} 00000 n \n".encode())
+        self.fh.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode())
+
+
+def _scan_font():
+    size = SCAN_DPI * 10 // 72
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only ships the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def _render_scan(lines, font):
+    width = PAGE_WIDTH_PT * SCAN_DPI // 72
+    height = PAGE_HEIGHT_PT * SCAN_DPI // 72
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    margin = 54 * SCAN_DPI // 72
+    leading = 14 * SCAN_DPI // 72
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * leading), line, fill=0, font=font)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=75)
+    return buf.getvalue(), width, height
+
+
+def write_text_pdf(path, pages):
+    with open(path, "wb") as fh:
+        writer = _PdfWriter(fh)
+        for lines in pages:
+            writer.add_text_page(lines)
+        writer.close()
+
+
+def write_layout_pdf(path, pages):
+    with open(path, "wb") as fh:
+        writer = _PdfWriter(fh)
+        for lines in pages:
+            writer.add_layout_page(lines)
+        writer.close()
+
+
+def write_scanned_pdf(path, pages):
+    font = _scan_font()
+    with open(path, "wb") as fh:
+        writer = _PdfWriter(fh)
+        for lines in pages:
+            writer.add_image_page(*_render_scan(lines, font))
+        writer.close()
+
+
+def write_docx(path, pages):
+    doc = Document()
+    for page_no, lines in enumerate(pages, start=1):
+        doc.add_heading(lines[0], level=2)
+        for line in lines[1:]:
+            if line:
+                doc.add_paragraph(line)
+        table = doc.add_table(rows=4, cols=3)
+        for row, cells in enumerate(_fee_table(page_no)):
+            for col, value in enumerate(cells):
+                table.cell(row, col).text = value
+        if page_no < len(pages):
+            doc.add_page_break()
+    doc.save(path)
+
+
+WRITERS = {"text_pdf": write_text_pdf, "layout_pdf": write_layout_pdf, "scanned_pdf": write_scanned_pdf,
+           "docx": write_docx}
+EXTENSIONS = {"text_pdf": ".pdf", "layout_pdf": ".pdf", "scanned_pdf": ".pdf", "docx": ".docx"}
+# Kinds whose pages carry more than the contract text
+CONTENT = {"layout_pdf": with_fee_tables}
+
+
+def document_path(corpus_dir, kind, pages):
+    return os.path.join(corpus_dir, f"{kind}_{pages:04d}{EXTENSIONS[kind]}")
+
+
+def ensure_document(corpus_dir, kind, pages, seed=0):
+    """Generate ``kind`` at ``pages`` pages unless it is already on disk."""
+    path = document_path(corpus_dir, kind, pages)
+    truth_path = os.path.splitext(path)[0] + ".txt"
+    if not (os.path.exists(path) and os.path.exists(truth_path)):
+        os.makedirs(corpus_dir, exist_ok=True)
+        content = contract_pages(pages, seed=seed)
+        content = CONTENT.get(kind, lambda pages: pages)(content)
+        WRITERS[kind](path, content)
+        with open(truth_path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join("\n".join(map(line_text, lines)) for lines in content))
+    return path
+
+
+def ground_truth(path):
+    with open(os.path.splitext(path)[0] + ".txt", encoding="utf-8") as fh:
+        return fh.read()
+
+
+def build_corpus(corpus_dir=DEFAULT_CORPUS_DIR, kinds=KINDS, sizes=DEFAULT_SIZES, seed=0):
+    return [(kind, pages, ensure_document(corpus_dir, kind, pages, seed=seed))
+            for kind in kinds for pages in sizes]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate the synthetic contract corpus.")
+    parser.add_argument("--out", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    args = parser.parse_args()
+    for kind, pages, path in build_corpus(args.out, args.kinds.split(","),
+                                          [int(s) for s in args.sizes.split(",")]):
+        print(f"{kind:12s} {pages:5d} pages  {path}")
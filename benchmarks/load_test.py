@@ -0,0 +1,153 @@
+"""Async load generator for the FastAPI apps.
+
+Drives ``/chat`` and ``/analyze-risks`` with a fixed number of concurrent
+clients and reports throughput and p50/p95/p99 latency. By default the app is
+imported in-process with ``LLM_PROVIDER=stub`` so no Gemini quota is used::
+
+    python -m benchmarks.load_test --app api.index:app --concurrency 32 --requests 2000
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --scenario chat
+
+Stub behaviour is tuned with the ``STUB_LLM_*`` environment variables (see
+``core.llm.StubProvider``). Requires ``httpx``.
+"""
+import argparse
+import asyncio
+import collections
+import importlib
+import json
+import math
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.corpus import contract_pages
+
+QUESTIONS = [
+    "What is the governing law of this agreement?",
+    "When can either party terminate?",
+    "Summarise the payment terms.",
+    "Who owns the intellectual property in the deliverables?",
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def build_requests(scenario, document_text):
+    """Return an endless iterator of (path, json_body) for the scenario."""
+    chat = [("/chat", {"text": document_text, "question": q}) for q in QUESTIONS]
+    risks = [("/analyze-risks", {"text": document_text})]
+    pool = {"chat": chat, "analyze-risks": risks, "mixed": chat * 2 + risks}[scenario]
+    i = 0
+    while True:
+        yield pool[i % len(pool)]
+        i += 1
+
+
+async def _client(client, requests, remaining, samples, deadline):
+    while time.perf_counter() < deadline:
+        if remaining[0] <= 0:
+            return
+        remaining[0] -= 1
+        path, body = next(requests)
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, json=body)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        samples.append((path, status, time.perf_counter() - start))
+
+
+async def run_load(client, scenario, concurrency, total_requests, duration, document_text):
+    requests = build_requests(scenario, document_text)
+    remaining = [total_requests]
+    samples = []
+    started = time.perf_counter()
+    deadline = started + duration if duration else float("inf")
+    await asyncio.gather(*(
+        _client(client, requests, remaining, samples, deadline) for _ in range(concurrency)
+    ))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    by_path = collections.defaultdict(list)
+    for path, status, latency in samples:
+        by_path[path].append((status, latency))
+    by_path["all"] = [(status, latency) for _, status, latency in samples]
+
+    report = {"elapsed_sec": elapsed, "endpoints": {}}
+    for path, rows in by_path.items():
+        ok = sorted(latency for status, latency in rows if status == 200)
+        statuses = collections.Counter(str(status) for status, _ in rows)
+        report["endpoints"][path] = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "throughput_rps": len(rows) / elapsed if elapsed else None,
+            "status_counts": dict(statuses),
+            "p50_ms": (percentile(ok, 50) or 0) * 1000,
+            "p95_ms": (percentile(ok, 95) or 0) * 1000,
+            "p99_ms": (percentile(ok, 99) or 0) * 1000,
+        }
+    return report
+
+
+def _load_app(target):
+    os.environ.setdefault("LLM_PROVIDER", "stub")
+    module_name, _, attr = target.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "app")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test /chat and /analyze-risks.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--app", default="api.index:app", help="ASGI app to drive in-process (module:attr)")
+    target.add_argument("--url", help="base URL of a running server instead of an in-process app")
+    parser.add_argument("--scenario", choices=("chat", "analyze-risks", "mixed"), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="total requests to send")
+    parser.add_argument("--duration", type=float, default=0, help="stop after this many seconds (0 = no limit)")
+    parser.add_argument("--pages", type=int, default=5, help="size of the synthetic contract sent with each request")
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    document_text = "\n".join("\n".join(lines) for lines in contract_pages(args.pages))
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=None)
+    else:
+        transport = httpx.ASGITransport(app=_load_app(args.app))
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None)
+
+    async def _run():
+        async with client:
+            return await run_load(
+                client, args.scenario, args.concurrency, args.requests, args.duration, document_text
+            )
+
+    samples, elapsed = asyncio.run(_run())
+    report = summarize(samples, elapsed)
+    report["config"] = {k: v for k, v in vars(args).items() if k != "out"}
+
+    for path, stats in sorted(report["endpoints"].items()):
+        print(
+            f"{path:16s} {stats['requests']:6d} req {stats['throughput_rps']:8.1f} req/s  "
+            f"p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  "
+            f"{stats['status_counts']}",
+            file=sys.stderr,
+        )
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared document processing used by the API, desktop and Streamlit front ends."""
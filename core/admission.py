@@ -0,0 +1,259 @@
+"""Admission control: bounded concurrency and bounded queues per kind of work.
+
+Requests are sorted into pools by route:
+
+- ``extract``: ``POST /extract`` and ``POST /extract/jobs`` (parsing and OCR use CPU and memory);
+- ``chat``: ``POST /chat``;
+- ``analysis``: ``POST /analyze-risks``, ``/analyze-risks/stream`` and ``/clauses/compare``.
+
+Each pool runs at most ``*_CONCURRENCY`` requests and queues at most
+``*_QUEUE`` more. ``chat`` and ``analysis`` also share ``LLM_CONCURRENCY``
+slots (the Gemini quota). When both are waiting for one, chat goes first,
+so bulk analysis cannot starve interactive questions.
+
+Overload is answered early instead of piling up. A request that finds its
+pool's queue full, or waits longer than ``ADMISSION_MAX_WAIT_SECONDS``,
+gets ``503`` at once, with ``Retry-After`` estimated from the pool's recent
+request durations. One client (by address) may have at most
+``CLIENT_CONCURRENCY`` requests running or queued across all pools; beyond
+that it gets ``429``.
+
+Slots are held until the response body has been sent, so streaming
+responses count for their whole length. Limits are per process: with
+several workers (``core.serve``) the server admits that many times more.
+``ADMISSION=off`` disables the layer.
+"""
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import time
+
+from core import metrics
+
+ADMISSION = os.getenv("ADMISSION", "on").lower() != "off"
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "4"))
+EXTRACT_QUEUE = int(os.getenv("EXTRACT_QUEUE", "16"))
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "8"))
+CHAT_QUEUE = int(os.getenv("CHAT_QUEUE", "32"))
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+ANALYSIS_QUEUE = int(os.getenv("ANALYSIS_QUEUE", "16"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+CLIENT_CONCURRENCY = int(os.getenv("CLIENT_CONCURRENCY", "8"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "20"))
+
+# Retry-After bounds, in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 120
+# Weight of the latest request in a pool's running average duration
+DURATION_SMOOTHING = 0.2
+
+# Lower runs first when pools compete for LLM slots
+CHAT_PRIORITY = 0
+ANALYSIS_PRIORITY = 1
+
+ROUTES = {
+    ("POST", "/extract"): "extract",
+    ("POST", "/extract/jobs"): "extract",
+    ("POST", "/chat"): "chat",
+    ("POST", "/analyze-risks"): "analysis",
+    ("POST", "/analyze-risks/stream"): "analysis",
+    ("POST", "/clauses/compare"): "analysis",
+}
+
+MESSAGES = {
+    "queue_full": "⏳ Server busy: too many {pool} requests are waiting. Please retry in {retry_after} seconds.",
+    "timeout": "⏳ Server busy: your {pool} request waited too long to start. Please retry in {retry_after} seconds.",
+    "client_limit": "🚦 Too many requests from this client at once. Please wait for the running ones to finish.",
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, pool, reason, retry_after):
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = 429 if reason == "client_limit" else 503
+        super().__init__(MESSAGES[reason].format(pool=pool, retry_after=retry_after))
+
+
+class Pool:
+    def __init__(self, name, concurrency, queue_size, priority=0, llm=False):
+        self.name = name
+        self.limit = max(concurrency, 1)
+        self.queue_size = queue_size
+        self.priority = priority
+        self.llm = llm
+        self.active = 0
+        self.waiting = 0
+        self.duration = 1.0  # running average seconds per request
+
+    def retry_after(self):
+        """Seconds until the queue ahead has probably drained."""
+        estimate = self.duration * (self.waiting + 1) / self.limit
+        return min(max(math.ceil(estimate), MIN_RETRY_AFTER), MAX_RETRY_AFTER)
+
+    def record(self, seconds):
+        self.duration += DURATION_SMOOTHING * (seconds - self.duration)
+
+
+class AdmissionController:
+    """Admits requests into pools. Waiters are served by priority, then arrival.
+
+    A waiter starts once its pool and, for LLM pools, the shared LLM slots
+    both have room; one scheduler checks both, so a chat question waiting for
+    its own pool is still ahead of analysis when an LLM slot frees up. Runs
+    on the event loop only; no locking.
+    """
+
+    def __init__(self, routes=ROUTES, max_wait=ADMISSION_MAX_WAIT_SECONDS, client_limit=CLIENT_CONCURRENCY,
+                 llm_limit=LLM_CONCURRENCY):
+        self.routes = routes
+        self.max_wait = max_wait
+        self.client_limit = client_limit
+        self.pools = {
+            "extract": Pool("extract", EXTRACT_CONCURRENCY, EXTRACT_QUEUE),
+            "chat": Pool("chat", CHAT_CONCURRENCY, CHAT_QUEUE, CHAT_PRIORITY, llm=True),
+            "analysis": Pool("analysis", ANALYSIS_CONCURRENCY, ANALYSIS_QUEUE, ANALYSIS_PRIORITY, llm=True),
+        }
+        self.llm_limit = max(llm_limit, 1)
+        self.llm_active = 0
+        self._waiters = []  # sorted [priority, arrival, future, pool]
+        self._arrivals = itertools.count()
+        self._clients = {}
+
+    def pool_for(self, method, path):
+        name = self.routes.get((method, path.rstrip("/") or "/"))
+        return self.pools.get(name) if name else None
+
+    def _runnable(self, pool):
+        return pool.active < pool.limit and (not pool.llm or self.llm_active < self.llm_limit)
+
+    def _take(self, pool):
+        pool.active += 1
+        if pool.llm:
+            self.llm_active += 1
+
+    def _give_back(self, pool):
+        pool.active -= 1
+        if pool.llm:
+            self.llm_active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        for entry in list(self._waiters):
+            future, pool = entry[2], entry[3]
+            if future.done():
+                # Timed out or cancelled; its waiter is on its way out
+                self._unqueue(entry)
+            elif self._runnable(pool):
+                self._unqueue(entry)
+                self._take(pool)
+                future.set_result(None)
+
+    def _unqueue(self, entry):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            entry[3].waiting -= 1
+
+    async def _acquire(self, pool):
+        if self._runnable(pool):
+            # Nothing waiting could use the room, or _dispatch would have started it
+            self._take(pool)
+            return
+        if pool.waiting >= pool.queue_size:
+            raise Overloaded(pool.name, "queue_full", pool.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        entry = [pool.priority, next(self._arrivals), future, pool]
+        bisect.insort(self._waiters, entry)
+        pool.waiting += 1
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            self._unqueue(entry)
+            raise Overloaded(pool.name, "timeout", pool.retry_after()) from None
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Started just as the request went away; pass the room on
+                self._give_back(pool)
+            self._unqueue(entry)
+            raise
+
+    async def admit(self, pool, client):
+        """Wait for room in ``pool``; returns the function that gives it back.
+
+        Raises ``Overloaded`` when the request should be turned away.
+        """
+        if client is not None and self._clients.get(client, 0) >= self.client_limit:
+            metrics.ADMISSION_REJECTED.inc(pool=pool.name, reason="client_limit")
+            raise Overloaded(pool.name, "client_limit", pool.retry_after())
+        self._clients[client] = self._clients.get(client, 0) + 1
+        start = time.monotonic()
+        metrics.ADMISSION_WAITING.inc(pool=pool.name)
+        try:
+            await self._acquire(pool)
+        except Overloaded as e:
+            metrics.ADMISSION_REJECTED.inc(pool=pool.name, reason=e.reason)
+            self._leave(client)
+            raise
+        except BaseException:
+            self._leave(client)
+            raise
+        finally:
+            metrics.ADMISSION_WAITING.dec(pool=pool.name)
+        admitted = time.monotonic()
+        metrics.ADMISSION_WAIT.observe(admitted - start, pool=pool.name)
+
+        def release():
+            pool.record(time.monotonic() - admitted)
+            self._give_back(pool)
+            self._leave(client)
+
+        return release
+
+    def _leave(self, client):
+        count = self._clients.get(client, 0) - 1
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware; slots are released once the whole response has been sent."""
+
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        pool = self.controller.pool_for(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        try:
+            release = await self.controller.admit(pool, client[0] if client else None)
+        except Overloaded as e:
+            from fastapi.responses import JSONResponse
+
+            response = JSONResponse({"error": str(e)}, status_code=e.status_code,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            release()
+
+
+def install_admission_control(app):
+    """Put the routes in ``ROUTES`` behind admission control (no-op with ``ADMISSION=off``).
+
+    Install before ``core.metrics.instrument_app`` so rejected requests are still counted.
+    """
+    if ADMISSION:
+        app.state.admission = AdmissionController()
+        app.add_middleware(AdmissionMiddleware, controller=app.state.admission)
+    return app
@@ -0,0 +1,202 @@
+"""Clause-library comparison: flag contract clauses that deviate from approved wordings.
+
+Library clauses (``CLAUSE_LIBRARY_PATH``, a JSON list of ``{"id", "title",
+"category", "text"}``) and the clauses of a contract (``split_sections``) are
+embedded with a local hashing vectorizer (signed word unigrams and bigrams
+hashed into ``N_FEATURES`` dimensions, L2-normalized), so no model download
+or network call is needed. One matrix product per document (batched for very
+long ones) gives every clause's cosine similarity to every library clause;
+each clause is then labelled against its nearest library clause:
+
+- ``standard``  - similarity >= ``CLAUSE_MATCH_THRESHOLD``: approved wording (the
+  default is strict because a few changed words can change the risk);
+- ``deviation`` - same subject (>= ``CLAUSE_RELATED_THRESHOLD``) but different
+  wording; only these are worth an LLM review. A clause above the match
+  threshold is still a deviation when its negations or numbers differ from
+  the library clause ("shall not indemnify", "30 days" for "90 days"): one
+  word barely moves the similarity but reverses the clause. The differing
+  tokens are reported as ``changed_terms``;
+- ``unmatched`` - no library counterpart.
+"""
+import collections
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from core.tokens import split_sections
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLAUSE_LIBRARY_PATH = os.getenv("CLAUSE_LIBRARY_PATH", os.path.join(_REPO_ROOT, "clause_library.json"))
+CLAUSE_MATCH_THRESHOLD = float(os.getenv("CLAUSE_MATCH_THRESHOLD", "0.95"))
+CLAUSE_RELATED_THRESHOLD = float(os.getenv("CLAUSE_RELATED_THRESHOLD", "0.35"))
+
+N_FEATURES = 2 ** 14
+# Headings and one-line fragments carry too little wording to compare
+MIN_CLAUSE_WORDS = 8
+BATCH_CLAUSES = 512
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_NUMBERING = re.compile(r"^\s*(?:(?:article|section|clause)\s+)?[\dIVXLC]+(?:\.\d+)*\.?\s+", re.IGNORECASE)
+# Words whose presence reverses or bounds a clause, compared exactly before a clause is called standard
+_NEGATIONS = {"not", "no", "never", "neither", "nor", "none", "nothing", "without", "cannot", "unless", "except"}
+_NUMBER_WORDS = {"one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+                 "fifteen", "twenty", "thirty", "forty", "fifty", "sixty", "ninety", "hundred", "thousand", "million",
+                 "billion", "half", "double", "twice"}
+_KEY_TOKEN = re.compile(r"\d+(?:[.,]\d+)*%?|[a-z]+(?:n't)?")
+
+
+def _features(text):
+    words = _WORD.findall(_NUMBERING.sub("", text).lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])], len(words)
+
+
+def _key_terms(text):
+    """Negations and numbers/amounts of ``text``, with their counts."""
+    terms = collections.Counter()
+    for token in _KEY_TOKEN.findall(_NUMBERING.sub("", text).lower()):
+        if token[0].isdigit():
+            terms[token.replace(",", "")] += 1
+        elif token in _NEGATIONS or token in _NUMBER_WORDS or token.endswith("n't"):
+            terms[token] += 1
+    return terms
+
+
+def changed_terms(text, standard):
+    """Negations and numbers that differ between a clause and its library wording, or ``None``.
+
+    Returns ``{"contract": [...], "library": [...]}``: the terms only the
+    clause has, and those only the library clause has.
+    """
+    ours, theirs = _key_terms(text), _key_terms(standard)
+    if ours == theirs:
+        return None
+    return {"contract": sorted((ours - theirs).elements()), "library": sorted((theirs - ours).elements())}
+
+
+def vectorize(texts):
+    """Embed ``texts`` as an L2-normalized ``(len(texts), N_FEATURES)`` float32 matrix."""
+    matrix = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+    rows, cols, signs = [], [], []
+    for row, text in enumerate(texts):
+        for feature in _features(text)[0]:
+            h = zlib.crc32(feature.encode("utf-8"))
+            rows.append(row)
+            cols.append(h % N_FEATURES)
+            # The top bit picks the sign so colliding features tend to cancel rather than add up
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+    if rows:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(signs, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class ClauseLibrary:
+    def __init__(self, clauses):
+        self.clauses = [c for c in clauses if c.get("text", "").strip()]
+        self.vectors = vectorize([c["text"] for c in self.clauses])
+
+    @classmethod
+    def load(cls, path=CLAUSE_LIBRARY_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def compare(self, text, match_threshold=CLAUSE_MATCH_THRESHOLD, related_threshold=CLAUSE_RELATED_THRESHOLD):
+        """Label each clause of ``text`` against its nearest library clause.
+
+        Returns ``(clauses, summary)``; each clause carries its ``position``,
+        ``heading``, ``text``, ``status`` and, when related, the nearest
+        ``library_id``/``library_title`` and ``similarity``. A clause above
+        ``match_threshold`` whose negations or numbers differ is a
+        ``deviation`` with those ``changed_terms``.
+        """
+        sections = [(i, s) for i, s in enumerate(split_sections(text)) if _features(s)[1] >= MIN_CLAUSE_WORDS]
+        if not sections or not self.clauses:
+            return [], {"clauses": 0, "standard": 0, "deviation": 0, "unmatched": 0}
+
+        nearest, best = [], []
+        # Batches bound the dense (clauses x N_FEATURES) matrix for very long documents
+        for start in range(0, len(sections), BATCH_CLAUSES):
+            batch = sections[start:start + BATCH_CLAUSES]
+            similarities = vectorize([s for _, s in batch]) @ self.vectors.T
+            index = similarities.argmax(axis=1)
+            nearest.extend(index.tolist())
+            best.extend(similarities[np.arange(len(batch)), index].tolist())
+
+        results = []
+        for (position, section), index, score in zip(sections, nearest, best):
+            heading = next((line.strip() for line in section.splitlines() if line.strip()), "")
+            clause = {"position": position, "heading": heading[:200], "text": section.strip()}
+            if score >= related_threshold:
+                library = self.clauses[index]
+                terms = changed_terms(section, library["text"]) if score >= match_threshold else None
+                clause.update(
+                    status="standard" if score >= match_threshold and terms is None else "deviation",
+                    library_id=library.get("id"),
+                    library_title=library.get("title"),
+                    similarity=round(score, 3),
+                )
+                if terms is not None:
+                    clause["changed_terms"] = terms
+            else:
+                clause.update(status="unmatched", similarity=round(score, 3))
+            results.append(clause)
+
+        summary = {"clauses": len(results)}
+        for status in ("standard", "deviation", "unmatched"):
+            summary[status] = sum(1 for c in results if c["status"] == status)
+        return results, summary
+
+    def get(self, library_id):
+        return next((c for c in self.clauses if c.get("id") == library_id), None)
+
+
+_library = None
+_library_mtime = None
+_library_lock = threading.Lock()
+
+
+def get_library():
+    """The library at ``CLAUSE_LIBRARY_PATH``, reloaded when the file changes; ``None`` if it is missing."""
+    global _library, _library_mtime
+    try:
+        mtime = os.path.getmtime(CLAUSE_LIBRARY_PATH)
+    except OSError:
+        return None
+    if mtime != _library_mtime:
+        with _library_lock:
+            if mtime != _library_mtime:
+                _library = ClauseLibrary.load(CLAUSE_LIBRARY_PATH)
+                _library_mtime = mtime
+    return _library
+
+
+def build_review_prompt(deviations, library):
+    """``(build_prompt, document)`` for ``fit_prompt``: an LLM review of the deviating clauses only."""
+
+    def build_prompt(document):
+        return f"""You are an expert contract lawyer. Each clause below deviates from the approved standard wording in our clause library. For each one, explain briefly how it differs from the standard position, whether the change is riskier for us, and what to negotiate.
+
+{document}
+
+Answer clause by clause, citing the clause heading."""
+
+    blocks = []
+    for clause in deviations:
+        standard = library.get(clause["library_id"]) or {}
+        terms = clause.get("changed_terms")
+        note = ""
+        if terms:
+            note = (f"Differing negations/numbers - contract: {', '.join(terms['contract']) or '(none)'}; "
+                    f"standard: {', '.join(terms['library']) or '(none)'}\n")
+        blocks.append(
+            f"--- Clause: {clause['heading']} (similarity {clause['similarity']}) ---\n"
+            f"{note}"
+            f"Contract wording:\n{clause['text']}\n\n"
+            f"Standard wording ({standard.get('title', clause['library_id'])}):\n{standard.get('text', '')}\n"
+        )
+    return build_prompt, "\n".join(blocks)
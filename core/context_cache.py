@@ -0,0 +1,203 @@
+"""Provider-side context caching of long documents for ``/chat``.
+
+Without caching every question resends the whole document. For documents
+of at least ``CONTEXT_CACHE_MIN_TOKENS`` (Gemini's minimum for a cache), the
+first question stores the document with the provider (Gemini context
+caching) under a handle keyed by the document hash. That question and every
+follow-up then send only the question, referencing the handle.
+
+Handles live for ``CONTEXT_CACHE_TTL_SECONDS``:
+
+- a handle in use is refreshed (TTL extended) once less than half its TTL is left;
+- an expired handle, or one the provider no longer knows (404), is dropped and
+  recreated on the next question;
+- at most ``CONTEXT_CACHE_MAX_ENTRIES`` handles are kept per process; the least
+  recently used one is deleted provider-side to make room.
+
+Handles are per process: another worker or a restarted server creates its
+own, and orphans expire with their TTL. ``StubProvider`` implements the same
+calls in memory, so the mechanism can be exercised without Gemini.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from core import metrics
+from core.llm import get_provider
+from core.store import document_id
+from core.timing import stage
+from core.tokens import CHAT_TOKEN_BUDGET, estimate_tokens, fit_document
+
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "on").lower() != "off"
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+# Documents beyond this are fitted (risk-ranked sections) before caching
+CONTEXT_CACHE_MAX_TOKENS = int(os.getenv("CONTEXT_CACHE_MAX_TOKENS", "500000"))
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "900"))
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "20"))
+
+# Treat a handle this close to expiry as expired: the request must finish before it lapses
+EXPIRY_MARGIN_SECONDS = 30
+
+CHAT_SYSTEM_INSTRUCTION = """You are an expert document assistant. The extracted document data is provided as context. Answer each user question with a helpful, accurate, and detailed answer based on the document content."""
+
+CHAT_QUESTION_PROMPT = """{history}User question: {question}
+
+Please provide a helpful, accurate, and detailed answer based on the document content."""
+
+
+def _missing(e):
+    message = str(e).lower()
+    return "404" in message or "not found" in message or "expired" in message
+
+
+class ContextCache:
+    def __init__(self, provider, ttl_seconds=CONTEXT_CACHE_TTL_SECONDS, min_tokens=CONTEXT_CACHE_MIN_TOKENS,
+                 max_tokens=CONTEXT_CACHE_MAX_TOKENS, max_entries=CONTEXT_CACHE_MAX_ENTRIES):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # document hash -> entry, least recently used first
+        self._lock = threading.Lock()
+        # One creation per document at a time; concurrent questions wait for the same handle
+        self._key_locks = {}
+
+    def cacheable(self, text):
+        return estimate_tokens(text) >= self.min_tokens
+
+    def acquire(self, text):
+        """``(entry, created)`` for ``text``: a live handle, refreshed if due, or a new one."""
+        key = document_id(text)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            now = time.time()
+            with self._lock:
+                for expired in [k for k, e in self._entries.items() if e["expires_at"] - EXPIRY_MARGIN_SECONDS <= now]:
+                    # Already gone provider-side; forget it
+                    del self._entries[expired]
+                    if expired != key:
+                        self._key_locks.pop(expired, None)
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+
+            if entry is not None:
+                if entry["expires_at"] - now < self.ttl_seconds / 2:
+                    try:
+                        self.provider.refresh_context_cache(entry["name"], self.ttl_seconds)
+                        entry["expires_at"] = now + self.ttl_seconds
+                    except Exception as e:
+                        if not _missing(e):
+                            raise
+                        self._forget(key)
+                        entry = None
+                if entry is not None:
+                    metrics.record_cache("context", True)
+                    return entry, False
+
+            metrics.record_cache("context", False)
+            document, report = fit_document(text, self.max_tokens)
+            name = self.provider.create_context_cache(document, CHAT_SYSTEM_INSTRUCTION, self.ttl_seconds)
+            entry = {"key": key, "name": name, "expires_at": now + self.ttl_seconds, "report": report}
+            with self._lock:
+                self._entries[key] = entry
+                evicted = []
+                while len(self._entries) > self.max_entries:
+                    evicted.append(self._entries.popitem(last=False)[1])
+            for old in evicted:
+                self._delete(old)
+            return entry, True
+
+    def _forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _delete(self, entry):
+        with self._lock:
+            self._key_locks.pop(entry["key"], None)
+        try:
+            self.provider.delete_context_cache(entry["name"])
+        except Exception as e:
+            # It expires on its own; deleting only frees provider storage early
+            print(f"Warning: could not delete context cache {entry['name']}: {e}")
+
+    def invalidate(self, text):
+        """Drop the handle for ``text`` and delete it provider-side."""
+        with self._lock:
+            entry = self._entries.pop(document_id(text), None)
+        if entry is not None:
+            self._delete(entry)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._delete(entry)
+
+    def _usage(self, entry, created, prompt):
+        usage = {"budget": CHAT_TOKEN_BUDGET, "prompt_tokens": estimate_tokens(prompt), "counter": "local"}
+        usage.update(entry["report"])
+        usage["context_cache"] = {
+            "name": entry["name"],
+            "created": created,
+            "expires_in": round(entry["expires_at"] - time.time()),
+        }
+        return usage
+
+    def answer(self, text, question, history=""):
+        """``(answer, usage)`` for ``question`` about ``text``, sending only the question (and ``history``)."""
+        prompt = CHAT_QUESTION_PROMPT.format(history=history, question=question)
+        with stage("context_cache"):
+            entry, created = self.acquire(text)
+        try:
+            with stage("llm_round_trip"):
+                answer = self.provider.generate(prompt, cached_content=entry["name"])
+        except Exception as e:
+            if not _missing(e):
+                raise
+            # The provider dropped the handle before its TTL; recreate it once
+            self._forget(entry["key"])
+            with stage("context_cache"):
+                entry, created = self.acquire(text)
+            with stage("llm_round_trip"):
+                answer = self.provider.generate(prompt, cached_content=entry["name"])
+        return answer, self._usage(entry, created, prompt)
+
+    async def aanswer(self, text, question, history=""):
+        prompt = CHAT_QUESTION_PROMPT.format(history=history, question=question)
+        with stage("context_cache"):
+            entry, created = await asyncio.to_thread(self.acquire, text)
+        try:
+            with stage("llm_round_trip"):
+                answer = await self.provider.agenerate(prompt, cached_content=entry["name"])
+        except Exception as e:
+            if not _missing(e):
+                raise
+            self._forget(entry["key"])
+            with stage("context_cache"):
+                entry, created = await asyncio.to_thread(self.acquire, text)
+            with stage("llm_round_trip"):
+                answer = await self.provider.agenerate(prompt, cached_content=entry["name"])
+        return answer, self._usage(entry, created, prompt)
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    """The process-wide cache for the configured provider; ``None`` if disabled or unsupported."""
+    global _context_cache
+    provider = get_provider()
+    if not CONTEXT_CACHE or not provider.context_caching:
+        return None
+    if _context_cache is None or _context_cache.provider is not provider:
+        with _context_cache_lock:
+            if _context_cache is None or _context_cache.provider is not provider:
+                _context_cache = ContextCache(provider)
+    return _context_cache
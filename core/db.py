@@ -0,0 +1,49 @@
+"""SQLite helpers shared by the job queue and the contract store."""
+import os
+import sqlite3
+
+
+class _Closing:
+    """``with`` support that closes the connection (sqlite3's own only ends the transaction)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+
+def connect(path):
+    """Open ``path`` in autocommit mode; use as ``with connect(path) as conn:``.
+
+    One short-lived connection per call keeps callers thread-safe without a
+    shared lock; run ``BEGIN IMMEDIATE`` explicitly for multi-statement writes.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return _Closing(conn)
+
+
+def initialize(path, schema):
+    """Create the parent directory and ``schema`` (idempotent DDL) in WAL mode."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(schema)
+
+
+def add_columns(path, table, columns):
+    """Add ``columns`` (name -> SQL type) missing from ``table`` in a database created by an older version."""
+    with connect(path) as conn:
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, sql_type in columns.items():
+            if name not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+                except sqlite3.OperationalError as e:
+                    # Another process added it first
+                    if "duplicate column" not in str(e):
+                        raise
@@ -0,0 +1,109 @@
+"""Per-request deadlines for LLM calls.
+
+A request gets a time budget for its endpoint when it arrives
+(``CHAT_DEADLINE_SECONDS`` for ``/chat``, ``ANALYSIS_DEADLINE_SECONDS`` for
+risk analysis and clause review). The deadline is kept in a context
+variable. It follows the request into tasks and ``asyncio.to_thread``
+workers without being passed around, and every LLM call made for the
+request (``core.llm``) gets only the time that is left. A call that runs out
+raises ``DeadlineExceeded``, which handlers answer with ``504``. A slow
+upstream response then costs at most the budget, not a worker slot held
+indefinitely.
+
+FastAPI apps set the budget with ``install_deadlines``; other entry points
+wrap their work in ``budget(name)``. ``LLM_DEADLINES=off`` disables them.
+"""
+import contextlib
+import contextvars
+import os
+import time
+
+from core import metrics
+from core.admission import ROUTES
+
+LLM_DEADLINES = os.getenv("LLM_DEADLINES", "on").lower() != "off"
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "120"))
+
+# Budget by kind of work (the admission pools of ROUTES)
+BUDGETS = {
+    "chat": CHAT_DEADLINE_SECONDS,
+    "analysis": ANALYSIS_DEADLINE_SECONDS,
+}
+
+# (budget name, seconds, absolute monotonic deadline)
+_current = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, name, seconds):
+        self.name = name
+        self.seconds = seconds
+        super().__init__(f"⏱️ The AI did not answer within the {seconds:g}s time limit. Please try again.")
+
+
+@contextlib.contextmanager
+def budget(name):
+    """Run the block under the ``name`` budget from ``BUDGETS``, starting now."""
+    seconds = BUDGETS.get(name)
+    if not LLM_DEADLINES or seconds is None:
+        yield
+        return
+    token = _current.set((name, seconds, time.monotonic() + seconds))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current():
+    """Name of the budget in force, or ``None``."""
+    deadline = _current.get()
+    return deadline[0] if deadline else None
+
+
+def remaining():
+    """Seconds left before the deadline (``None`` without one); raises once it has passed."""
+    deadline = _current.get()
+    if deadline is None:
+        return None
+    left = deadline[2] - time.monotonic()
+    if left <= 0:
+        raise exceeded()
+    return left
+
+
+def exceeded():
+    """The ``DeadlineExceeded`` for the budget in force, counted in metrics."""
+    name, seconds, _ = _current.get()
+    metrics.LLM_DEADLINE_EXCEEDED.inc(budget=name)
+    return DeadlineExceeded(name, seconds)
+
+
+class DeadlineMiddleware:
+    """ASGI middleware; the budget starts when the request arrives, so queueing counts against it."""
+
+    def __init__(self, app, routes=ROUTES):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        name = None
+        if scope["type"] == "http":
+            name = self.routes.get((scope["method"], scope["path"].rstrip("/") or "/"))
+        if name not in BUDGETS:
+            await self.app(scope, receive, send)
+            return
+        with budget(name):
+            await self.app(scope, receive, send)
+
+
+def install_deadlines(app):
+    """Give the LLM routes of ``ROUTES`` their budgets (no-op with ``LLM_DEADLINES=off``).
+
+    Install after ``core.admission.install_admission_control`` so time spent
+    waiting for admission is part of the budget.
+    """
+    if LLM_DEADLINES:
+        app.add_middleware(DeadlineMiddleware)
+    return app
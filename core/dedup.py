@@ -0,0 +1,157 @@
+"""Near-duplicate detection (MinHash + LSH) so template contracts reuse prior risk analyses.
+
+Each analyzed document gets a MinHash signature over its word 5-gram
+shingles. The signature is split into ``LSH_BANDS`` bands whose hashes are
+stored as buckets in the contract store, so candidate matches are found with
+an index lookup rather than a scan. Candidates are scored by estimated
+Jaccard similarity; above ``DEDUP_THRESHOLD`` the prior analysis is reused
+and only the sections that differ from the matched document go to the LLM
+(through ``build_delta_prompt``), with the headings of sections it no longer has.
+"""
+import hashlib
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+from core.tokens import split_sections
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+# Above this share of changed sections a delta prompt saves little; analyze the whole document
+DEDUP_MAX_CHANGED_SHARE = float(os.getenv("DEDUP_MAX_CHANGED_SHARE", "0.5"))
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+LSH_BANDS = 32  # 4 rows per band: candidates from roughly 0.4 estimated similarity upwards
+_PRIME = np.uint64(4294967291)  # largest 32-bit prime
+_rng = np.random.RandomState(20240601)  # fixed seed: signatures are persisted and must stay comparable
+_A = _rng.randint(1, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_WORD = re.compile(r"\w+")
+_SPACES = re.compile(r"\s+")
+# Leading clause numbering ("7.", "12.3", "(b)"), which shifts when a section is removed
+_NUMBERING = re.compile(r"^(?:[\divx]+[.)]|\([\da-z]+\))[\d.]*\s*")
+# Removed sections are named in the delta prompt by their first line, cut to this length
+MAX_HEADING_CHARS = 200
+
+DELTA_PROMPT = """You are an expert legal analyst specializing in contract risk assessment. A contract was analyzed before; its risk analysis is below. The contract now under review is a near-identical version of it: only the sections listed under "Changed sections" differ, and the sections listed under "Removed sections" are no longer in it.
+
+Previous risk analysis:
+{analysis}
+
+Removed sections (present in the previous contract, missing from the contract under review):
+{removed}
+
+Changed sections of the contract under review:
+{document}
+
+Update the previous analysis for the contract under review, taking the changed and removed sections into account, and return the complete analysis in exactly the same JSON format (overall_risk_level, risk_categories, key_concerns, missing_protections, summary). Only return valid JSON."""
+
+
+def signature(text):
+    """MinHash signature (``NUM_PERM`` uint32 values) of the word shingles of ``text``."""
+    words = _WORD.findall(text.lower())
+    n = max(len(words) - SHINGLE_WORDS + 1, 1)
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(n)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # One vectorized pass: (a * x + b) mod p for every permutation and shingle
+    permuted = (np.outer(_A, hashes) + _B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def band_keys(sig):
+    """``(band, bucket)`` pairs for the LSH index; buckets are signed 64-bit ints (SQLite INTEGER)."""
+    rows = NUM_PERM // LSH_BANDS
+    return [
+        (band, int.from_bytes(hashlib.blake2b(sig[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+                              "big", signed=True))
+        for band in range(LSH_BANDS)
+    ]
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+
+def to_blob(sig):
+    return sig.astype(np.uint32).tobytes()
+
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+def _section_key(section):
+    return _SPACES.sub(" ", section).strip().lower()
+
+
+def _heading(section):
+    return _SPACES.sub(" ", section.strip().split("\n", 1)[0])[:MAX_HEADING_CHARS]
+
+
+def _title(section):
+    return _NUMBERING.sub("", _heading(section).lower())
+
+
+def changed_sections(text, previous_text):
+    """Compare the sections of ``text`` with those of ``previous_text`` (modulo whitespace and case).
+
+    Returns ``(changed, removed, total)``: the sections of ``text`` missing
+    from ``previous_text``, the headings of the sections of ``previous_text``
+    missing from ``text`` (except those whose heading, ignoring its numbering,
+    a changed section still has: they were edited or renumbered, not removed), and the number of sections of
+    ``text``.
+    """
+    previous_sections = split_sections(previous_text)
+    sections = split_sections(text)
+    previous = {_section_key(s) for s in previous_sections}
+    current = {_section_key(s) for s in sections}
+    changed = [s for s in sections if _section_key(s) not in previous]
+    edited = {_title(s) for s in changed}
+    removed = [_heading(s) for s in previous_sections
+               if _section_key(s) not in current and _title(s) not in edited]
+    return changed, removed, len(sections)
+
+
+def build_delta_prompt(analysis, removed=()):
+    """A ``build_prompt(document)`` for ``fit_prompt`` that updates ``analysis`` from the changed sections.
+
+    ``removed`` are the headings of the sections the contract no longer has.
+    """
+    analysis_json = json.dumps(analysis, indent=2)
+    removed_list = "\n".join(f"- {heading}" for heading in removed) or "(none)"
+
+    def build_prompt(document):
+        return DELTA_PROMPT.format(analysis=analysis_json, removed=removed_list, document=document)
+
+    return build_prompt
+
+
+def reuse_report(match):
+    """How a ``ContractStore.find_near_duplicate`` match is used, for the response metadata.
+
+    ``mode`` is ``cached`` (same content: the analysis is returned as is),
+    ``delta`` (only the changed sections, and the headings of removed ones,
+    go to the LLM) or ``full`` (too much changed; the whole document is
+    analyzed). Removed sections count as changes, so a contract that only
+    lost clauses is never ``cached``.
+    """
+    changed = len(match["changed_sections"])
+    removed = len(match["removed_sections"])
+    if not changed and not removed:
+        mode = "cached"
+    elif changed + removed <= DEDUP_MAX_CHANGED_SHARE * (match["sections_total"] + removed):
+        mode = "delta"
+    else:
+        mode = "full"
+    return {
+        "document_id": match["document_id"],
+        "similarity": round(match["similarity"], 3),
+        "sections_changed": changed,
+        "sections_removed": removed,
+        "sections_total": match["sections_total"],
+        "mode": mode,
+    }
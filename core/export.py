@@ -0,0 +1,172 @@
+"""Streaming table export: XLSX, CSV and Parquet in bounded memory.
+
+``DataFrame.to_excel`` builds the whole openpyxl workbook in memory before
+writing a byte. ``export_table`` writes ``EXPORT_CHUNK_ROWS`` rows at a time
+instead:
+
+- XLSX through openpyxl's write-only workbook, which streams rows to disk
+  rather than keeping a cell object per value;
+- CSV with ``DataFrame.to_csv`` per chunk;
+- Parquet through ``pyarrow.parquet.ParquetWriter``, one row group per chunk
+  (optional: needs ``pyarrow``).
+
+A risk analysis (the ``analysis`` returned by ``/analyze-risks``) can be
+exported alongside the table. It goes on a second sheet in XLSX, and into a
+``<name>-risks`` file next to a CSV or Parquet export. ``progress(done,
+total)`` is called after every chunk, so a GUI can run the export on a
+worker thread and show a progress bar; raising ``ExportCancelled`` from it
+stops the export. Files are written under a temporary name and renamed at
+the end, so a failed or cancelled export leaves nothing half-written.
+"""
+import importlib.util
+import os
+
+import pandas as pd
+
+EXPORT_CHUNK_ROWS = 5000
+
+# Suffix -> (format, module it needs)
+FORMATS = {
+    ".xlsx": ("xlsx", "openpyxl"),
+    ".csv": ("csv", None),
+    ".parquet": ("parquet", "pyarrow"),
+}
+
+ANALYSIS_COLUMNS = ["Section", "Category", "Level", "Text"]
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def available_formats():
+    """Suffixes that can be written with the installed packages, in ``FORMATS`` order."""
+    return [suffix for suffix, (_, module) in FORMATS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def analysis_frame(analysis):
+    """A ``/analyze-risks`` analysis as one row per item (``ANALYSIS_COLUMNS``), for any table format."""
+    rows = [("Overall", "", analysis.get("overall_risk_level", ""), analysis.get("summary", ""))]
+    rows += [("Key concern", "", "", concern) for concern in analysis.get("key_concerns", [])]
+    rows += [("Missing protection", "", "", item) for item in analysis.get("missing_protections", [])]
+    for risk in analysis.get("risk_categories", []):
+        category, level = risk.get("category", ""), risk.get("level", "")
+        rows.append(("Risk", category, level, risk.get("description", "")))
+        rows += [("Clause", category, level, clause) for clause in risk.get("specific_clauses", [])]
+        rows += [("Recommendation", category, level, item) for item in risk.get("recommendations", [])]
+    if "raw_analysis" in analysis:
+        # The model's answer could not be parsed; keep it rather than export nothing
+        rows.append(("Raw analysis", "", "", analysis["raw_analysis"]))
+    return pd.DataFrame(rows, columns=ANALYSIS_COLUMNS)
+
+
+def _chunks(df):
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        yield df.iloc[start:start + EXPORT_CHUNK_ROWS]
+
+
+class _Progress:
+    def __init__(self, total, callback):
+        self.done, self.total, self.callback = 0, total, callback
+
+    def advance(self, rows):
+        self.done += rows
+        if self.callback is not None:
+            self.callback(self.done, self.total)
+
+
+def _xlsx_rows(chunk):
+    """Rows of ``chunk`` as openpyxl accepts them: missing values as ``None``, text without control characters."""
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    for column in chunk.columns:
+        if chunk[column].map(type).eq(str).any():
+            # Control characters from extracted text are not allowed in XLSX
+            chunk[column] = chunk[column].map(
+                lambda value: ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value)
+    return chunk.itertuples(index=False, name=None)
+
+
+def _write_xlsx(path, sheets, progress):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for title, df in sheets:
+        sheet = workbook.create_sheet(title)
+        sheet.append([str(column) for column in df.columns])
+        for chunk in _chunks(df):
+            for row in _xlsx_rows(chunk):
+                sheet.append(row)
+            progress.advance(len(chunk))
+    workbook.save(path)
+
+
+def _write_csv(path, df, progress):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if df.empty:
+            df.to_csv(f, index=False)
+        for start, chunk in enumerate(_chunks(df)):
+            chunk.to_csv(f, header=start == 0, index=False)
+            progress.advance(len(chunk))
+
+
+def _write_parquet(path, df, progress):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(df):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            progress.advance(len(chunk))
+
+
+def _analysis_path(path):
+    root, suffix = os.path.splitext(path)
+    return f"{root}-risks{suffix}"
+
+
+def export_table(df, path, analysis=None, progress=None):
+    """Write ``df`` (and ``analysis``, if given) to ``path``; the format follows its suffix.
+
+    Returns the paths written.
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in FORMATS:
+        raise ValueError(f"Unsupported export format '{suffix}'. Use one of: {', '.join(FORMATS)}.")
+    fmt, module = FORMATS[suffix]
+    if module is not None and importlib.util.find_spec(module) is None:
+        raise ValueError(f"Exporting {fmt.upper()} needs the '{module}' package (pip install {module}).")
+
+    risks = analysis_frame(analysis) if analysis else None
+    tracker = _Progress(len(df) + (len(risks) if risks is not None else 0), progress)
+    if fmt == "xlsx":
+        outputs = [(path, lambda part: _write_xlsx(part, [("Data", df)] + (
+            [("Risk Analysis", risks)] if risks is not None else []), tracker))]
+    else:
+        write = _write_csv if fmt == "csv" else _write_parquet
+        outputs = [(path, lambda part: write(part, df, tracker))]
+        if risks is not None:
+            outputs.append((_analysis_path(path), lambda part: write(part, risks, tracker)))
+
+    written = []
+    try:
+        for target, write_to in outputs:
+            part = target + ".part"
+            try:
+                write_to(part)
+            except BaseException:
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+            written.append(part)
+        for part in written:
+            os.replace(part, part[:-len(".part")])
+    except BaseException:
+        for part in written:
+            if os.path.exists(part):
+                os.remove(part)
+        raise
+    return [target for target, _ in outputs]
@@ -0,0 +1,538 @@
+"""Text extraction for uploaded contracts.
+
+Uploads are routed by content, not by file name: ``detect_format`` sniffs
+the magic bytes (a mislabeled PDF is still a PDF, a renamed PNG is still an
+image) and ``extract_pages`` hands the file to the extractor registered for
+that format in ``EXTRACTORS``. Each extractor is the cheapest one that can
+read its format: PDFs use their text layer (read by a ``core.pdf_text``
+backend) and fall back to OCR only when there is none, images go straight to OCR, and plain text and RTF are decoded
+without any parsing library. ``register_extractor`` adds formats.
+
+The ``extract_pages_*`` functions return one string per page so that later
+stages (normalization, page-level retrieval) can see page boundaries; the
+``extract_text_*`` wrappers return the whole document as one string. A
+``page_range`` of ``(first, last)`` (1-based, inclusive; ``last`` may be
+``None`` for "to the end") extracts only those pages, which for PDFs and
+multi-frame images skips the work on the others; ``page_count`` tells how
+many there are. A range that selects no pages (``last`` below ``first`` or
+1, ``first`` past the end) raises ``PageRangeError``.
+
+Extractors take a ``source``: the upload's bytes, a path, or a binary file
+object (e.g. an upload's spooled file). Parsers read it in place through
+``open_source``, memory-mapping large files, so nothing is copied to disk
+on the way. Only the OCR rasterizer, which runs Poppler on a path, gets a
+temporary copy (``source_path``), and that copy is removed when it is done.
+
+``progress``, when given, is called as ``progress(stage, done, total)`` as
+pages complete, so long-running extraction jobs can report real progress.
+For page stages ``done`` is the page number just finished and ``total`` the
+document's page count, also when only a range is extracted.
+"""
+import codecs
+import contextlib
+import glob
+import io
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+
+from docx import Document
+
+from core import pdf_text
+from core.timing import stage
+
+# Enough for every signature below, and for telling text from binary
+SNIFF_BYTES = 4096
+PDF_HEADER_WINDOW = 1024
+# Files at least this large are memory-mapped instead of read through a file buffer
+MMAP_MIN_BYTES = 8 * 1024 * 1024
+# Temporary copies for the OCR rasterizer; ones older than SPOOL_STALE_SECONDS were left by a dead process
+SPOOL_PREFIX = "contracts-ai-ocr-"
+SPOOL_STALE_SECONDS = 24 * 3600
+
+# (signature, offset, format); checked in order
+MAGIC = (
+    (b"%PDF-", None, "pdf"),  # None: within PDF_HEADER_WINDOW, as PDF readers allow junk before it
+    (b"PK\x03\x04", 0, "zip"),
+    (b"\x89PNG\r\n\x1a\n", 0, "png"),
+    (b"\xff\xd8\xff", 0, "jpeg"),
+    (b"II*\x00", 0, "tiff"),
+    (b"MM\x00*", 0, "tiff"),
+    (b"{\\rtf", 0, "rtf"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", 0, "doc"),  # OLE2 compound file: legacy Word (or Excel)
+)
+
+# Formats that are recognized but have no extractor, with what to do instead
+UNSUPPORTED = {
+    "doc": "Legacy Word (.doc) files are not supported. Save the document as .docx or PDF and upload it again.",
+    "zip": "ZIP archives are not supported, except Word (.docx) documents.",
+}
+
+_TEXT_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+_CONTROL = re.compile(rb"[\x00-\x08\x0b\x0e-\x1f]")
+
+
+class UnsupportedFormat(ValueError):
+    """The upload is not a format any registered extractor can read."""
+
+
+class PageRangeError(ValueError):
+    """The requested page range selects no pages of the document."""
+
+
+def _report(progress, name, done, total):
+    if progress is not None:
+        progress(name, done, total)
+
+
+def _span(page_range, total):
+    """``(first, last)`` of ``page_range`` clamped to ``1..total``; empty when ``first > last``."""
+    first, last = page_range or (1, None)
+    return max(first or 1, 1), total if last is None else min(last, total)
+
+
+def _select(pages, page_range):
+    first, last = _span(page_range, len(pages))
+    return pages[first - 1:last]
+
+
+class _Mapped(io.RawIOBase):
+    """A memory map as a seekable binary file (``mmap`` lacks ``seekable()``, which ``zipfile`` needs)."""
+
+    def __init__(self, mapped):
+        self._map = mapped
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._map.read() if size is None or size < 0 else self._map.read(size)
+
+    def readall(self):
+        return self._map.read()
+
+    def readinto(self, buffer):
+        data = self._map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def tell(self):
+        return self._map.tell()
+
+
+@contextlib.contextmanager
+def _mapped(f):
+    f.seek(0)
+    if os.fstat(f.fileno()).st_size < MMAP_MIN_BYTES:
+        yield f
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield _Mapped(mapped)
+
+
+@contextlib.contextmanager
+def open_source(source):
+    """A seekable binary stream over ``source``: bytes, a path or a binary file object.
+
+    Bytes are wrapped without copying; files of at least ``MMAP_MIN_BYTES`` are
+    memory-mapped. File objects are rewound and left open.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f, _mapped(f) as stream:
+            yield stream
+        return
+    # In memory (BytesIO, or a spooled file that has not rolled over, which has no name yet):
+    # read it as it is; fileno() would force a spooled file to disk
+    if isinstance(source, io.BytesIO) or (isinstance(source, tempfile.SpooledTemporaryFile) and source.name is None):
+        source.seek(0)
+        yield source
+        return
+    try:
+        source.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        source.seek(0)
+        yield source
+        return
+    with _mapped(source) as stream:
+        yield stream
+
+
+_last_sweep = 0.0
+
+
+def remove_stale_spools():
+    """Delete OCR copies left behind by processes that died mid-extraction (at most hourly)."""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < 3600:
+        return
+    _last_sweep = now
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), SPOOL_PREFIX + "*")):
+        try:
+            if now - os.path.getmtime(path) > SPOOL_STALE_SECONDS:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+@contextlib.contextmanager
+def source_path(source, suffix="", timings=None):
+    """A filesystem path holding ``source``, for tools that only take paths (the OCR rasterizer).
+
+    Paths are used as they are. Anything else is copied to a temporary file
+    that is removed on exit, including when extraction fails.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+        return
+    remove_stale_spools()
+    fd, path = tempfile.mkstemp(prefix=SPOOL_PREFIX, suffix=suffix)
+    try:
+        with stage("temp_write", timings):
+            with os.fdopen(fd, "wb") as f, open_source(source) as stream:
+                shutil.copyfileobj(stream, f)
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _looks_like_text(head):
+    if any(head.startswith(bom) for bom, _ in _TEXT_BOMS):
+        return True
+    if not head or b"\x00" in head:
+        return False
+    try:
+        # Not final: the sniffed head may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return True
+    except UnicodeDecodeError:
+        # Single-byte legacy encodings: accept if control characters are rare
+        return len(_CONTROL.findall(head)) <= len(head) // 100
+
+
+def detect_format(source):
+    """Format of ``source`` (bytes, a path or a binary file) from its content, or ``None``.
+
+    Returns one of the ``MAGIC`` formats, ``docx`` for Word ZIP packages or
+    ``txt`` for anything that decodes as text.
+    """
+    with open_source(source) as f:
+        head = f.read(SNIFF_BYTES)
+        fmt = next((name for magic, offset, name in MAGIC
+                    if (magic in head[:PDF_HEADER_WINDOW] if offset is None else head.startswith(magic, offset))), None)
+        if fmt == "zip":
+            f.seek(0)
+            try:
+                with zipfile.ZipFile(f) as package:
+                    if "word/document.xml" in package.namelist():
+                        return "docx"
+            except zipfile.BadZipFile:
+                return None
+        if fmt is None and _looks_like_text(head):
+            return "txt"
+        return fmt
+
+
+@contextlib.contextmanager
+def open_pdf(source, backend=None, timings=None):
+    """``source`` opened by ``backend`` (default ``PDF_TEXT_BACKEND``; see ``core.pdf_text``).
+
+    A document the backend cannot open is retried with the other installed
+    backends. The backend's lock is held until the block exits.
+    """
+    names = pdf_text.candidates(backend)
+    for position, name in enumerate(names):
+        opener = pdf_text.PDF_BACKENDS[name]
+        with open_source(source) as stream, opener.lock or contextlib.nullcontext():
+            try:
+                with stage("pdf_open", timings):
+                    document = opener(stream)
+            except Exception as e:
+                if position == len(names) - 1:
+                    raise
+                print(f"⚠️ PDF backend {name} could not open the document ({e}); trying {names[position + 1]}")
+                continue
+            try:
+                yield document
+            finally:
+                document.close()
+            return
+
+
+def extract_pages_from_pdf(source, timings=None, progress=None, page_range=None, backend=None):
+    with open_pdf(source, backend, timings) as document:
+        with stage("pdf_text", timings):
+            total = len(document)
+            first, last = _span(page_range, total)
+            pages = []
+            for number in range(first, last + 1):
+                pages.append(document.page_text(number - 1))
+                _report(progress, "pdf_text", number, total)
+            return pages
+
+
+def extract_text_from_pdf(source, timings=None, backend=None):
+    return "".join(extract_pages_from_pdf(source, timings, backend=backend))
+
+
+def extract_pages_from_pdf_ocr(source, timings=None, progress=None, page_range=None):
+    """OCR every page (in ``page_range``); see ``core.ocr`` for the preprocessing and adaptive DPI."""
+    try:
+        # Imported lazily: the OCR stack is optional for text-only deployments (e.g. Vercel)
+        from core.ocr import ocr_pdf
+
+        # Poppler reads from a path; bytes and streams get a temporary copy for the duration
+        with source_path(source, ".pdf", timings) as file_path:
+            return ocr_pdf(file_path, timings, progress, *(page_range or ()))
+    except Exception as e:
+        raise Exception(f"OCR processing failed: {str(e)}. Make sure Tesseract and Poppler are installed.")
+
+
+def extract_text_from_pdf_ocr(source, timings=None):
+    return "".join(extract_pages_from_pdf_ocr(source, timings))
+
+
+def extract_pages_from_image(source, timings=None, progress=None, page_range=None):
+    """OCR a PNG/JPEG/TIFF directly, one page per frame (multi-page TIFF scans)."""
+    try:
+        from PIL import Image, ImageSequence
+
+        from core.ocr import ocr_images
+
+        with stage("image_open", timings):
+            with open_source(source) as stream, Image.open(stream) as image:
+                # Copies: the frames must outlive the file handle
+                total = getattr(image, "n_frames", 1)
+                first, last = _span(page_range, total)
+                images = [frame.copy() for number, frame in enumerate(ImageSequence.Iterator(image), start=1)
+                          if first <= number <= last]
+        return ocr_images(images, timings, progress, first, total)
+    except Exception as e:
+        raise Exception(f"OCR processing failed: {str(e)}. Make sure Tesseract is installed.")
+
+
+def extract_text_from_docx(source, timings=None):
+    with stage("docx_open", timings):
+        with open_source(source) as stream:
+            doc = Document(stream)
+    with stage("docx_paragraphs", timings):
+        return "\n".join([para.text for para in doc.paragraphs])
+
+
+def _decode_text(data):
+    for bom, encoding in _TEXT_BOMS:
+        if data.startswith(bom):
+            return data.decode(encoding)
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+
+def extract_pages_from_text(source, timings=None, progress=None, page_range=None):
+    """Plain text; form feeds (as in ``pdftotext`` output) separate pages."""
+    with stage("text_decode", timings):
+        with open_source(source) as f:
+            pages = _decode_text(f.read()).replace("\r\n", "\n").split("\f")
+    _report(progress, "text_decode", 1, 1)
+    return _select(pages, page_range)
+
+
+_RTF_TOKEN = re.compile(r"\\([a-zA-Z]{1,32})(-?\d{1,10})? ?|\\'([0-9a-fA-F]{2})|\\(.)|([{}])|[\r\n]+|([^\\{}\r\n]+)", re.S)
+# Groups holding fonts, styles, metadata, pictures etc. rather than document text
+_RTF_SKIP = frozenset((
+    "fonttbl", "colortbl", "stylesheet", "info", "pict", "object", "header", "headerl", "headerr", "headerf",
+    "footer", "footerl", "footerr", "footerf", "listtable", "listoverridetable", "revtbl", "rsidtbl",
+    "generator", "xmlnstbl", "themedata", "colorschememapping", "latentstyles", "datastore", "fldinst",
+    "filetbl", "pgdsctbl", "mmathPr", "bkmkstart", "bkmkend",
+))
+_RTF_CHARS = {
+    "par": "\n", "line": "\n", "row": "\n", "sect": "\n\n", "page": "\f", "tab": "\t", "cell": "\t",
+    "emdash": "\u2014", "endash": "\u2013", "lquote": "\u2018", "rquote": "\u2019",
+    "ldblquote": "\u201c", "rdblquote": "\u201d", "bullet": "\u2022",
+}
+
+
+def rtf_to_text(rtf):
+    """Plain text of an RTF document: skips formatting groups, decodes ``\\'hh`` and ``\\uN`` escapes."""
+    out, stack = [], []
+    skipping, uc, pending, codepage = False, 1, 0, "cp1252"
+    for match in _RTF_TOKEN.finditer(rtf):
+        word, arg, hex_code, symbol, brace, text = match.groups()
+        if brace == "{":
+            stack.append((skipping, uc))
+        elif brace == "}":
+            if stack:
+                skipping, uc = stack.pop()
+            pending = 0
+        elif word:
+            if word == "ansicpg" and arg:
+                codepage = f"cp{arg}"
+            elif word == "uc" and arg:
+                uc = int(arg)
+            elif word in _RTF_SKIP:
+                skipping = True
+            elif skipping:
+                pass
+            elif word == "u" and arg:
+                out.append(chr(int(arg) % 65536))
+                # \uN is followed by uc fallback characters for readers without Unicode
+                pending = uc
+            elif word in _RTF_CHARS:
+                out.append(_RTF_CHARS[word])
+        elif hex_code:
+            if pending:
+                pending -= 1
+            elif not skipping:
+                out.append(bytes([int(hex_code, 16)]).decode(codepage, errors="replace"))
+        elif symbol:
+            if symbol == "*":
+                skipping = True  # unknown destinations are marked \* and must be ignorable
+            elif not skipping:
+                out.append({"~": "\xa0", "-": "", "_": "-"}.get(symbol, symbol))
+        elif text:
+            if pending:
+                dropped = min(pending, len(text))
+                text, pending = text[dropped:], pending - dropped
+            if not skipping:
+                out.append(text)
+    return "".join(out)
+
+
+def extract_pages_from_rtf(source, timings=None, progress=None, page_range=None):
+    with stage("rtf_text", timings):
+        with open_source(source) as f:
+            # RTF is 7-bit; anything else is escaped inside the document
+            pages = rtf_to_text(f.read().decode("latin-1")).split("\f")
+    _report(progress, "rtf_text", 1, 1)
+    return _select(pages, page_range)
+
+
+def _extract_pdf(source, timings=None, progress=None, page_range=None, backend=None):
+    pages = extract_pages_from_pdf(source, timings, progress, page_range, backend)
+    # Decided per range: a scanned appendix after a text-layer body is still OCR'd
+    if pages and not any(page.strip() for page in pages):
+        pages = extract_pages_from_pdf_ocr(source, timings, progress, page_range)
+    return pages
+
+
+def _extract_docx(source, timings=None, progress=None, page_range=None):
+    # Word files have no fixed pages; the whole document is page 1
+    if _span(page_range, 1)[0] > 1:
+        return []
+    pages = [extract_text_from_docx(source, timings)]
+    _report(progress, "docx_paragraphs", 1, 1)
+    return pages
+
+
+# format -> extract(source, timings, progress, page_range) returning one string per page
+EXTRACTORS = {
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+    "png": extract_pages_from_image,
+    "jpeg": extract_pages_from_image,
+    "tiff": extract_pages_from_image,
+    "txt": extract_pages_from_text,
+    "rtf": extract_pages_from_rtf,
+}
+
+# File name extensions per format, for upload pickers and spooled files
+SUFFIXES = {
+    "pdf": (".pdf",),
+    "docx": (".docx",),
+    "png": (".png",),
+    "jpeg": (".jpg", ".jpeg"),
+    "tiff": (".tif", ".tiff"),
+    "txt": (".txt", ".text", ".md"),
+    "rtf": (".rtf",),
+}
+
+
+def register_extractor(fmt, extract, suffixes=()):
+    """Route ``fmt`` (as returned by ``detect_format``) to ``extract(source, timings, progress, page_range)``."""
+    EXTRACTORS[fmt] = extract
+    SUFFIXES[fmt] = tuple(suffixes)
+    UNSUPPORTED.pop(fmt, None)
+
+
+def supported_suffixes():
+    return tuple(suffix for fmt in EXTRACTORS for suffix in SUFFIXES.get(fmt, ()))
+
+
+def check_format(source):
+    """``detect_format(source)``, raising ``UnsupportedFormat`` with a user-facing message if it cannot be extracted."""
+    fmt = detect_format(source)
+    if fmt not in EXTRACTORS:
+        raise UnsupportedFormat(UNSUPPORTED.get(fmt) or (
+            "Unsupported file type. Supported: PDF, Word (.docx), plain text, RTF and PNG/JPEG/TIFF images."
+        ))
+    return fmt
+
+
+def extract_pages(source, fmt=None, timings=None, progress=None, page_range=None, pdf_backend=None):
+    """Extract the pages of ``source`` (only those in ``page_range``, if given) with the
+    extractor for its (sniffed, unless given) format.
+
+    ``pdf_backend`` overrides ``PDF_TEXT_BACKEND`` for a PDF's text layer.
+    Raises ``PageRangeError`` when ``page_range`` selects no pages.
+    """
+    if fmt is None:
+        fmt = check_format(source)
+    if fmt not in EXTRACTORS:
+        raise UnsupportedFormat(f"Unsupported file type: {fmt}")
+    first, last = page_range or (1, None)
+    if last is not None and last < max(first, 1):
+        raise PageRangeError(f"last_page ({last}) must be at least first_page ({max(first, 1)}).")
+    if fmt == "pdf" and pdf_backend is not None:
+        pages = EXTRACTORS[fmt](source, timings, progress, page_range, backend=pdf_backend)
+    else:
+        pages = EXTRACTORS[fmt](source, timings, progress, page_range)
+    # Counted only when nothing came back: an empty document is not an error, a range past its end is
+    if not pages and first > 1:
+        total = page_count(source, fmt, pdf_backend)
+        if first > total:
+            raise PageRangeError(f"first_page ({first}) is past the end of the document ({total} pages).")
+    return pages
+
+
+def page_count(source, fmt=None, pdf_backend=None):
+    """Number of pages ``extract_pages`` returns for ``source``, counted without extracting where possible."""
+    if fmt is None:
+        fmt = check_format(source)
+    if fmt == "pdf":
+        with open_pdf(source, pdf_backend) as document:
+            return len(document)
+    if fmt == "docx":
+        return 1
+    if fmt in ("png", "jpeg", "tiff"):
+        from PIL import Image
+
+        with open_source(source) as stream, Image.open(stream) as image:
+            return getattr(image, "n_frames", 1)
+    return len(extract_pages(source, fmt))
+
+
+def format_suffix(fmt):
+    """A file name extension for a ``fmt`` file on disk."""
+    return (SUFFIXES.get(fmt) or ("." + fmt,))[0]
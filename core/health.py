@@ -0,0 +1,72 @@
+"""Readiness: whether this process should be sent traffic.
+
+``GET /health`` only says the process is up. ``GET /ready`` also checks
+what requests depend on, and returns 503 until all of it is in place:
+
+- ``llm``: the provider is configured (API key present);
+- ``ocr``: Tesseract and Poppler are installed (not a failure when
+  ``OCR_REQUIRED`` is off; ``/extract`` then cannot read scans);
+- ``pdf``: the text-layer backend PDFs are read with (``core.pdf_text``);
+- ``store``: the contract store database answers, when enabled;
+- ``jobs``: the extraction job queue answers and its workers are not
+  draining for a shutdown.
+
+Load balancers and orchestrators should probe ``/ready`` for routing and
+``/health`` for liveness.
+"""
+import asyncio
+import sqlite3
+
+from core import db, ocr, pdf_text
+
+
+def _database(path):
+    try:
+        with db.connect(path) as conn:
+            conn.execute("SELECT 1")
+    except sqlite3.Error as e:
+        return str(e)
+    return None
+
+
+def readiness(app, llm, store=None):
+    """``(ready, checks)``: every check as ``{"ok": bool, ...details}``."""
+    checks = {"llm": {"ok": bool(llm.configured), "provider": llm.name}}
+
+    missing = ocr.missing_tools()
+    checks["ocr"] = {"ok": not (missing and ocr.OCR_REQUIRED), "required": ocr.OCR_REQUIRED,
+                     **ocr.tool_versions()}
+
+    checks["pdf"] = {"ok": True, "backend": pdf_text.DEFAULT_BACKEND, "installed": pdf_text.available()}
+
+    if store is None:
+        checks["store"] = {"ok": True, "enabled": False}
+    else:
+        error = _database(store.path)
+        checks["store"] = {"ok": error is None, "enabled": True, **({"error": error} if error else {})}
+
+    pool = getattr(app.state, "extraction_pool", None)
+    if pool is not None:
+        error = _database(pool.queue.db_path)
+        checks["jobs"] = {"ok": error is None and not pool.draining, "draining": pool.draining,
+                          **({"error": error} if error else {})}
+    return all(check["ok"] for check in checks.values()), checks
+
+
+def install_readiness_api(app, llm, store=None):
+    """Add ``GET /ready`` to a FastAPI app; the OCR tools are checked once, at startup."""
+    from fastapi.responses import JSONResponse
+
+    @app.on_event("startup")
+    async def check_ocr_tools():
+        missing = await asyncio.to_thread(ocr.missing_tools)
+        if missing:
+            print(f"⚠️ OCR tools missing: {', '.join(missing)}; scanned documents cannot be read")
+
+    @app.get("/ready")
+    async def ready():
+        is_ready, checks = await asyncio.to_thread(readiness, app, llm, store)
+        return JSONResponse({"status": "ready" if is_ready else "not ready", "checks": checks},
+                            status_code=200 if is_ready else 503)
+
+    return app
@@ -0,0 +1,585 @@
+"""Asynchronous extraction jobs backed by a persistent SQLite queue.
+
+``POST /extract/jobs`` spools the upload to ``JOBS_DIR`` and returns a job ID
+straight away; a pool of worker threads claims queued jobs, runs the same
+extraction + normalization pipeline as ``/extract`` and records per-stage
+page progress in the database. Clients poll ``GET /extract/jobs/{id}`` or
+follow ``GET /extract/jobs/{id}/events`` (Server-Sent Events).
+
+Workers extract ``PAGE_CHUNK`` pages at a time and store each chunk as it
+completes, so ``GET /extract/jobs/{id}/pages`` serves pages while the rest
+of the document is still being extracted. ``?preview_pages=N`` on submit
+extracts the first pages before responding; the worker carries on from there.
+
+The queue lives in SQLite, so jobs survive a restart: jobs left ``running``
+by a dead process are re-queued by a pool's periodic sweep (which also
+purges old finished jobs), and extra worker
+processes can share the queue with ``python -m core.jobs --workers N``.
+Jobs need a long-running server; on Vercel use the synchronous ``/extract``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional
+
+from core import db, metrics
+from core.extraction import UnsupportedFormat, check_format, extract_pages, format_suffix, open_source, page_count
+from core.normalize import normalize_pages, normalize_text
+from core.store import get_store
+from core.timing import stage
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "contracts-ai-jobs"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+# A running job whose progress has not moved for this long belongs to a dead worker
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+# On shutdown, running jobs get this long to finish before they are handed back to the queue
+JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", "30"))
+# An events stream ends with a "timeout" event after this long; clients reconnect or poll
+JOB_EVENTS_TIMEOUT_SECONDS = float(os.getenv("JOB_EVENTS_TIMEOUT_SECONDS", "3600"))
+
+POLL_INTERVAL = 1.0       # idle workers re-check the queue this often (submits wake them sooner)
+PROGRESS_INTERVAL = 0.5   # minimum seconds between progress writes for one job
+EVENTS_INTERVAL = 0.5     # SSE poll interval
+SWEEP_INTERVAL = 60.0     # seconds between re-queueing stale jobs and purging old ones
+PAGE_CHUNK = 20           # pages extracted (and stored for /pages) at a time
+MAX_PREVIEW_PAGES = 5
+MAX_PAGES_PER_REQUEST = 100
+FINISHED = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress TEXT NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    text TEXT,
+    normalization TEXT,
+    timings TEXT,
+    document_id TEXT,
+    page_count INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_pages (
+    job_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (job_id, page)
+);
+"""
+
+
+class JobQueue:
+    """Extraction jobs in a SQLite database under ``directory``; safe to share across threads and processes."""
+
+    def __init__(self, directory=JOBS_DIR):
+        self.directory = directory
+        self.upload_dir = os.path.join(directory, "uploads")
+        self.db_path = os.path.join(directory, "jobs.sqlite3")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        db.initialize(self.db_path, _SCHEMA)
+        db.add_columns(self.db_path, "jobs", {"page_count": "INTEGER"})
+
+    def _connect(self):
+        return db.connect(self.db_path)
+
+    def submit(self, filename, content, fmt=None, pages=(), count=None):
+        """Spool ``content`` (bytes or a binary file) to disk and queue it. Returns the job ID.
+
+        ``fmt`` (from ``detect_format``) picks the spool file's extension; the
+        file name's own extension is only a fallback, as it may be wrong.
+        ``pages`` already extracted from the start of the document (a preview)
+        are stored with the job and not extracted again; ``count`` is the page count.
+        """
+        job_id = uuid.uuid4().hex
+        suffix = format_suffix(fmt) if fmt else os.path.splitext(filename)[-1].lower()
+        path = os.path.join(self.upload_dir, job_id + suffix)
+        with open(path, "wb") as f, open_source(content) as stream:
+            shutil.copyfileobj(stream, f)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, filename, suffix, path, status, page_count, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, filename, suffix, path, count, now, now),
+            )
+            conn.executemany("INSERT INTO job_pages (job_id, page, text) VALUES (?, ?, ?)",
+                             [(job_id, number, text) for number, text in enumerate(pages, start=1)])
+            conn.execute("COMMIT")
+        return job_id
+
+    def get(self, job_id, include_result=False):
+        """Job status as a JSON-ready dict (``None`` if unknown); the text only with ``include_result``."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "filename": row["filename"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "progress": json.loads(row["progress"]),
+            "error": row["error"],
+            "page_count": row["page_count"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "updated_at": row["updated_at"],
+            "finished_at": row["finished_at"],
+        }
+        if include_result and row["status"] == "done":
+            job["text"] = row["text"]
+            job["normalization"] = json.loads(row["normalization"])
+            job["timings"] = json.loads(row["timings"])
+            job["document_id"] = row["document_id"]
+        return job
+
+    def claim(self, worker):
+        """Atomically move the oldest queued job to ``running``. Returns the row or ``None``."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "started_at = ?, updated_at = ? WHERE id = ?",
+                        (worker, now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def update_progress(self, job_id, current, progress):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ?",
+                (current, json.dumps(progress), time.time(), job_id),
+            )
+
+    def finish(self, job_id, text, normalization, timings, progress, document_id=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', stage = NULL, progress = ?, text = ?, normalization = ?, "
+                "timings = ?, document_id = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(progress), text, json.dumps(normalization), json.dumps(timings), document_id,
+                 now, now, job_id),
+            )
+
+    def set_page_count(self, job_id, count):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET page_count = ? WHERE id = ?", (count, job_id))
+
+    def add_pages(self, job_id, first, pages):
+        """Store extracted ``pages`` (raw text) starting at page number ``first``."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR REPLACE INTO job_pages (job_id, page, text) VALUES (?, ?, ?)",
+                             [(job_id, number, text) for number, text in enumerate(pages, start=first)])
+            conn.execute("COMMIT")
+
+    def stored_pages(self, job_id):
+        """Raw text of the pages stored so far, in order, up to the first missing page."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT page, text FROM job_pages WHERE job_id = ? ORDER BY page", (job_id,)).fetchall()
+        pages = []
+        for row in rows:
+            if row["page"] != len(pages) + 1:
+                break
+            pages.append(row["text"])
+        return pages
+
+    def pages(self, job_id, first=1, last=None):
+        """Pages ``first`` to ``last`` extracted so far, each cleaned up on its own; ``None`` if the job is unknown.
+
+        Running headers and footers are only recognized across the whole
+        document, so they are removed from the job's full text but not here.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        last = first + MAX_PAGES_PER_REQUEST - 1 if last is None else min(last, first + MAX_PAGES_PER_REQUEST - 1)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT page, text FROM job_pages WHERE job_id = ? AND page BETWEEN ? AND ? ORDER BY page",
+                (job_id, first, last),
+            ).fetchall()
+            done = conn.execute("SELECT COUNT(*) FROM job_pages WHERE job_id = ?", (job_id,)).fetchone()[0]
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "page_count": job["page_count"],
+            "pages_done": done,
+            "pages": [{"page": row["page"], "text": normalize_text(row["text"])[0]} for row in rows],
+        }
+
+    def fail(self, job_id, error):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                (error, now, now, job_id),
+            )
+
+    def release(self, job_id, worker):
+        """Hand a job ``worker`` is still running back to the queue, keeping its stored pages.
+
+        The attempt is not counted: the job was interrupted by a shutdown, not by a failure.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, attempts = MAX(attempts - 1, 0), updated_at = ? "
+                "WHERE id = ? AND status = 'running' AND worker = ?",
+                (time.time(), job_id, worker),
+            ).rowcount
+
+    def requeue_stale(self, stale_seconds=JOB_STALE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        """Re-queue jobs orphaned by a dead worker; give up on those that already used ``max_attempts``."""
+        cutoff = time.time() - stale_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped while processing this job.', "
+                "finished_at = ? WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                (time.time(), cutoff, max_attempts),
+            )
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND updated_at < ?",
+                (cutoff,),
+            ).rowcount
+
+    def purge(self, retention_hours=JOB_RETENTION_HOURS):
+        """Delete finished jobs (and any leftover uploads) older than ``retention_hours``."""
+        cutoff = time.time() - retention_hours * 3600
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT path FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM job_pages WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        for row in rows:
+            _remove(row["path"])
+        return len(rows)
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class WorkerPool:
+    """Threads that claim jobs from a ``JobQueue`` and run them to completion.
+
+    OCR spends its time in the Tesseract and Poppler subprocesses, so threads
+    overlap well; start extra processes with ``python -m core.jobs`` when the
+    PyPDF2 text layer (pure Python) becomes the bottleneck.
+
+    ``stop`` drains: no new jobs are claimed, running ones get
+    ``JOB_DRAIN_SECONDS`` to finish, and those still running after that are
+    released back to the queue with the pages extracted so far, for the next
+    worker (in this or another process) to carry on.
+    """
+
+    def __init__(self, queue, workers=EXTRACTION_WORKERS, poll_interval=POLL_INTERVAL, store=None):
+        self.queue = queue
+        self.store = store
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._abandon = threading.Event()
+        self._wake = threading.Condition()
+        self._threads = []
+        self._active = {}  # worker -> job ID
+        self._active_lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    @property
+    def draining(self):
+        return self._stop.is_set()
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        self.sweep()
+        prefix = f"{os.getpid()}-"
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(prefix + str(i),), name=f"extract-worker-{i}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=JOB_DRAIN_SECONDS):
+        """Drain: wait up to ``timeout`` seconds for running jobs, then release the rest to the queue."""
+        self._stop.set()
+        self.notify()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        self._abandon.set()
+        with self._active_lock:
+            active = dict(self._active)
+        for worker, job_id in active.items():
+            try:
+                if self.queue.release(job_id, worker):
+                    print(f"Extraction job {job_id} released back to the queue")
+            except sqlite3.Error as e:
+                # requeue_stale picks it up after JOB_STALE_SECONDS
+                print(f"Warning: could not release extraction job {job_id}: {e}")
+        self._threads = []
+
+    def sweep(self, force=True):
+        """Re-queue jobs orphaned by dead workers and purge old finished ones.
+
+        Workers call this between jobs; unless ``force``, it runs at most every ``SWEEP_INTERVAL``
+        seconds across the pool.
+        """
+        with self._sweep_lock:
+            now = time.monotonic()
+            if not force and now < self._next_sweep:
+                return
+            self._next_sweep = now + SWEEP_INTERVAL
+        try:
+            requeued = self.queue.requeue_stale()
+            self.queue.purge()
+        except sqlite3.Error as e:
+            print(f"Warning: could not sweep the extraction job queue: {e}")
+            return
+        if requeued:
+            print(f"Re-queued {requeued} stale extraction job(s)")
+
+    def notify(self):
+        """Wake idle workers (called after a submit)."""
+        with self._wake:
+            self._wake.notify_all()
+
+    def _run(self, worker):
+        while not self._stop.is_set():
+            self.sweep(force=False)
+            try:
+                row = self.queue.claim(worker)
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+                continue
+            with self._active_lock:
+                self._active[worker] = row["id"]
+            try:
+                self.process(row)
+            finally:
+                with self._active_lock:
+                    self._active.pop(worker, None)
+
+    def process(self, row):
+        job_id = row["id"]
+        metrics.observe_stage("job_queue_wait", time.time() - row["created_at"])
+        progress, last = {}, {"at": 0.0, "stage": None}
+
+        def report(name, done, total):
+            progress[name] = {"done": done, "total": total}
+            now = time.monotonic()
+            if name != last["stage"] or done == total or now - last["at"] >= PROGRESS_INTERVAL:
+                last.update(at=now, stage=name)
+                self.queue.update_progress(job_id, name, progress)
+
+        timings = {}
+        try:
+            # Sniffed again: only the first bytes are read, and queued files may predate format detection
+            fmt = check_format(row["path"])
+            count = row["page_count"]
+            if count is None:
+                count = page_count(row["path"], fmt)
+                self.queue.set_page_count(job_id, count)
+            # Pages from a preview, or from an attempt that died part-way, are not extracted again
+            pages = self.queue.stored_pages(job_id)
+            while len(pages) < count:
+                if self._abandon.is_set():
+                    # Released by stop(); the stored pages and the upload stay for the next worker
+                    return
+                first = len(pages) + 1
+                chunk = extract_pages(row["path"], fmt, timings, report, (first, first + PAGE_CHUNK - 1))
+                if not chunk:
+                    break
+                self.queue.add_pages(job_id, first, chunk)
+                pages.extend(chunk)
+            with stage("normalize", timings):
+                text, normalization = normalize_pages(pages)
+            document_id = None
+            if self.store:
+                with stage("store_write", timings):
+                    document_id = self.store.save_document(text, row["filename"], len(pages))
+            self.queue.finish(job_id, text, normalization, timings, progress, document_id)
+            metrics.JOBS.inc(status="done")
+        except Exception as e:
+            self.queue.fail(job_id, f"Error extracting text: {str(e)}")
+            metrics.JOBS.inc(status="failed")
+        finally:
+            # After a release the next worker needs the upload; purge() removes it once the job is finished
+            if not self._abandon.is_set():
+                _remove(row["path"])
+
+
+def _extract_preview(source, fmt, preview_pages):
+    """``(pages, page_count)`` for the first ``preview_pages`` pages of an upload."""
+    return extract_pages(source, fmt, page_range=(1, preview_pages)), page_count(source, fmt)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def install_job_api(app, queue=None, workers=EXTRACTION_WORKERS, store=None):
+    """Add the ``/extract/jobs`` routes to a FastAPI app and run a worker pool for its lifetime.
+
+    Finished documents are saved to ``store`` (a ``core.store.ContractStore``) when given.
+    """
+    from fastapi import File, UploadFile
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    queue = queue or JobQueue()
+    pool = WorkerPool(queue, workers, store=store)
+    # For the readiness check (core.serve)
+    app.state.extraction_pool = pool
+
+    @app.on_event("startup")
+    async def start_extraction_workers():
+        await asyncio.to_thread(pool.start)
+
+    @app.on_event("shutdown")
+    async def stop_extraction_workers():
+        await asyncio.to_thread(pool.stop)
+
+    @app.post("/extract/jobs", status_code=202)
+    async def submit_extraction_job(file: UploadFile = File(...), preview_pages: int = 0):
+        # Read from the upload's spooled file: sniffed, previewed and copied into the queue without a temp copy
+        content = file.file
+        # Rejected here rather than failing in a worker later
+        try:
+            fmt = check_format(content)
+        except UnsupportedFormat as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        preview = None
+        pages, count = (), None
+        if preview_pages > 0:
+            try:
+                pages, count = await asyncio.to_thread(_extract_preview, content, fmt,
+                                                       min(preview_pages, MAX_PREVIEW_PAGES))
+            except Exception as e:
+                return JSONResponse({"error": f"Error extracting text: {str(e)}"}, status_code=500)
+            with stage("normalize"):
+                text, normalization = normalize_pages(pages)
+            preview = {"text": text, "normalization": normalization, "first_page": 1, "last_page": len(pages),
+                       "page_count": count}
+        with stage("job_submit"):
+            job_id = await asyncio.to_thread(queue.submit, file.filename, content, fmt, pages, count)
+        pool.notify()
+        return JSONResponse({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/extract/jobs/{job_id}",
+            "events_url": f"/extract/jobs/{job_id}/events",
+            "pages_url": f"/extract/jobs/{job_id}/pages",
+            "preview": preview,
+        }, status_code=202)
+
+    @app.get("/extract/jobs/{job_id}/pages")
+    async def extraction_job_pages(job_id: str, first_page: int = 1, last_page: Optional[int] = None):
+        """Pages extracted so far; the rest appear as the job works through the document."""
+        pages = await asyncio.to_thread(queue.pages, job_id, max(first_page, 1), last_page)
+        if pages is None:
+            return JSONResponse({"error": "Unknown job ID."}, status_code=404)
+        return pages
+
+    @app.get("/extract/jobs/{job_id}")
+    async def extraction_job_status(job_id: str):
+        job = await asyncio.to_thread(queue.get, job_id, True)
+        if job is None:
+            return JSONResponse({"error": "Unknown job ID."}, status_code=404)
+        return job
+
+    @app.get("/extract/jobs/{job_id}/events")
+    async def extraction_job_events(job_id: str):
+        job = await asyncio.to_thread(queue.get, job_id)
+        if job is None:
+            return JSONResponse({"error": "Unknown job ID."}, status_code=404)
+
+        async def events(job):
+            last = None
+            deadline = time.monotonic() + JOB_EVENTS_TIMEOUT_SECONDS
+            while True:
+                if job is None:
+                    yield _sse("failed", {"job_id": job_id, "status": "failed", "error": "Job was purged."})
+                    return
+                if job["status"] in FINISHED:
+                    # The final event carries the status only; fetch the status URL for the text
+                    yield _sse(job["status"], job)
+                    return
+                if job != last:
+                    yield _sse("progress", job)
+                    last = job
+                if time.monotonic() >= deadline:
+                    # Not the job's end: the client reconnects or polls the status URL
+                    yield _sse("timeout", job)
+                    return
+                await asyncio.sleep(EVENTS_INTERVAL)
+                job = await asyncio.to_thread(queue.get, job_id)
+
+        return StreamingResponse(events(job), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run extraction workers against the shared job queue.")
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS)
+    parser.add_argument("--jobs-dir", default=JOBS_DIR)
+    args = parser.parse_args(argv)
+
+    pool = WorkerPool(JobQueue(args.jobs_dir), max(args.workers, 1), store=get_store())
+    pool.start()
+    print(f"Processing extraction jobs from {args.jobs_dir} with {pool.workers} worker(s); Ctrl+C to stop")
+    # SIGTERM (systemd, containers) drains like Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except (KeyboardInterrupt, SystemExit):
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+"""LLM provider interface shared by every entry point.
+
+Handlers never talk to ``google.generativeai`` directly; they ask
+``get_provider()`` for the configured provider and call ``generate`` (sync
+handlers) or ``agenerate`` (async handlers); ``stream``/``astream`` yield the
+answer in chunks as it is generated. Passing ``schema`` (a response schema
+such as ``core.risk.RISK_SCHEMA``) asks for JSON in that shape.
+
+Providers with ``context_caching`` can hold a document provider-side
+(``create_context_cache``) so later prompts reference it with
+``cached_content`` instead of resending it; ``core.context_cache`` manages
+the handles.
+
+Every call gets the time left before the request's deadline
+(``core.deadlines``); Gemini receives it as the RPC timeout. ``agenerate``
+can also hedge (``LLM_HEDGE=on``). If no answer has come back after the
+``LLM_HEDGE_PERCENTILE`` latency of recent calls to the same endpoint, a
+backup request is sent, the first answer wins and the other request is
+cancelled. At most ``LLM_HEDGE_MAX_RATE`` of calls are hedged, so a slow
+upstream does not double the load on it.
+
+``LLM_PROVIDER=stub`` swaps Gemini for ``StubProvider``, a local deterministic
+stand-in with configurable latency, token rate, tail latency and 429/500 error
+injection, so ``/chat`` and ``/analyze-risks`` can be load-tested without
+spending quota.
+"""
+import asyncio
+import collections
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from core import deadlines, metrics
+from core.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+DEFAULT_MODEL = "gemini-1.5-flash-latest"
+# Context caching needs an explicitly versioned model
+DEFAULT_CACHE_MODEL = "gemini-1.5-flash-002"
+# Chunk size of StubProvider streams, roughly what Gemini sends per streamed response
+STREAM_CHUNK_TOKENS = 16
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "off").lower() == "on"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+# Recent calls per endpoint that the hedge delay and rate are computed over
+HEDGE_WINDOW = 200
+# No hedging until an endpoint has this many latencies to go on
+HEDGE_MIN_SAMPLES = 20
+
+
+def _timed_out(error):
+    """Whether ``error`` is an upstream timeout caused by the request's deadline."""
+    return deadlines.current() is not None and isinstance(error, (TimeoutError, google_exceptions.DeadlineExceeded))
+
+
+class Hedging:
+    """When to send a backup request, from the latencies of recent calls to one endpoint."""
+
+    def __init__(self, percentile=LLM_HEDGE_PERCENTILE, max_rate=LLM_HEDGE_MAX_RATE, window=HEDGE_WINDOW):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.latencies = collections.deque(maxlen=window)
+        self.hedged = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Seconds to wait before hedging, or ``None`` to not hedge this call."""
+        with self._lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES or sum(self.hedged) >= self.max_rate * len(self.hedged):
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def record(self, seconds, hedged):
+        with self._lock:
+            if seconds is not None:
+                self.latencies.append(seconds)
+            self.hedged.append(hedged)
+            return sum(self.hedged) / len(self.hedged)
+
+
+class LLMProvider:
+    """Base class: subclasses implement ``_generate`` and ``_stream`` and may override ``_agenerate``/``_astream``.
+
+    ``timeout`` is the time left before the request's deadline (``None``
+    without one); blocking calls should pass it on to the upstream request.
+    """
+
+    name = "base"
+    context_caching = False
+
+    def __init__(self):
+        self._hedging = collections.defaultdict(Hedging)
+
+    @property
+    def configured(self):
+        return True
+
+    def _generate(self, prompt, schema=None, cached_content=None, timeout=None):
+        raise NotImplementedError
+
+    def _stream(self, prompt, schema=None, timeout=None):
+        yield self._generate(prompt, schema=schema, timeout=timeout)
+
+    async def _agenerate(self, prompt, schema=None, cached_content=None):
+        # Keep blocking SDK calls off the event loop
+        return await asyncio.to_thread(self._generate, prompt, schema, cached_content, deadlines.remaining())
+
+    def generate(self, prompt, schema=None, cached_content=None):
+        try:
+            return self._generate(prompt, schema, cached_content, deadlines.remaining())
+        except Exception as e:
+            if _timed_out(e):
+                raise deadlines.exceeded() from e
+            raise
+
+    def create_context_cache(self, document, system_instruction, ttl_seconds):
+        """Cache ``document`` provider-side for ``ttl_seconds``; returns the handle name."""
+        raise NotImplementedError
+
+    def refresh_context_cache(self, name, ttl_seconds):
+        raise NotImplementedError
+
+    def delete_context_cache(self, name):
+        raise NotImplementedError
+
+    def stream(self, prompt, schema=None):
+        try:
+            yield from self._stream(prompt, schema, deadlines.remaining())
+        except Exception as e:
+            if _timed_out(e):
+                raise deadlines.exceeded() from e
+            raise
+
+    def count_tokens(self, text):
+        return estimate_tokens(text)
+
+    async def agenerate(self, prompt, schema=None, cached_content=None):
+        """``_agenerate`` within the request's deadline, hedged when ``LLM_HEDGE`` is on."""
+        endpoint = deadlines.current() or "default"
+        hedging = self._hedging[endpoint]
+        delay = hedging.delay() if LLM_HEDGE else None
+        left = deadlines.remaining()
+        if delay is not None and left is not None and delay >= left:
+            # A backup sent that late could not finish in time
+            delay = None
+        started = time.monotonic()
+        calls = [asyncio.ensure_future(self._agenerate(prompt, schema, cached_content))]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(calls, timeout=delay)
+                if not done:
+                    calls.append(asyncio.ensure_future(self._agenerate(prompt, schema, cached_content)))
+            answer, winner = await self._first_answer(calls)
+        except BaseException as e:
+            hedging.record(None, len(calls) > 1)
+            if _timed_out(e):
+                raise deadlines.exceeded() from e
+            raise
+        finally:
+            # The losing request is cancelled rather than left to finish
+            for call in calls:
+                call.cancel()
+        rate = hedging.record(time.monotonic() - started, len(calls) > 1)
+        if len(calls) > 1:
+            metrics.LLM_HEDGES.inc(endpoint=endpoint, winner="primary" if winner is calls[0] else "backup")
+        metrics.LLM_HEDGE_RATE.set(rate, endpoint=endpoint)
+        return answer
+
+    @staticmethod
+    async def _first_answer(calls):
+        """``(answer, call)`` from the first of ``calls`` to succeed; the last failure if none does."""
+        pending, error = set(calls), None
+        while pending:
+            timeout = deadlines.remaining()
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise deadlines.exceeded()
+            for call in done:
+                if call.exception() is None:
+                    return call.result(), call
+                error = call.exception()
+        raise error
+
+    async def astream(self, prompt, schema=None):
+        """``_astream`` within the request's deadline: each chunk must arrive before it."""
+        chunks = self._astream(prompt, schema).__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), deadlines.remaining())
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    if _timed_out(e):
+                        raise deadlines.exceeded() from e
+                    raise
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    async def _astream(self, prompt, schema=None):
+        """Async iterator over ``_stream``; the blocking SDK iterator runs in a worker thread."""
+        timeout = deadlines.remaining()
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        done = object()
+
+        def produce():
+            try:
+                for chunk in self._stream(prompt, schema, timeout):
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is done:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            await producer
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    context_caching = True
+
+    def __init__(self, api_key=None, model_name=None, cache_model_name=None):
+        super().__init__()
+        self.api_key = api_key if api_key is not None else os.getenv("GEMINI_API_KEY")
+        self.model_name = model_name or os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+        self.cache_model_name = cache_model_name or os.getenv("GEMINI_CACHE_MODEL", DEFAULT_CACHE_MODEL)
+        # CachedContent objects by name, so generating from one needs no extra lookup
+        self._caches = {}
+        if self.api_key:
+            genai.configure(api_key=self.api_key)
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    @staticmethod
+    def _config(schema):
+        if schema is None:
+            return None
+        return genai.GenerationConfig(response_mime_type="application/json", response_schema=schema)
+
+    def _cached(self, name):
+        cached = self._caches.get(name)
+        if cached is None:
+            cached = self._caches[name] = genai.caching.CachedContent.get(name)
+        return cached
+
+    @staticmethod
+    def _request_options(timeout):
+        return {"timeout": timeout} if timeout is not None else None
+
+    def _model(self, cached_content):
+        if cached_content:
+            return genai.GenerativeModel.from_cached_content(self._cached(cached_content))
+        return genai.GenerativeModel(self.model_name)
+
+    def _generate(self, prompt, schema=None, cached_content=None, timeout=None):
+        response = self._model(cached_content).generate_content(
+            prompt, generation_config=self._config(schema), request_options=self._request_options(timeout))
+        return response.text if hasattr(response, 'text') else str(response)
+
+    async def _agenerate(self, prompt, schema=None, cached_content=None):
+        # Native async call, so a cancelled (hedged or timed-out) request is abandoned upstream too
+        model = await asyncio.to_thread(self._model, cached_content)
+        response = await model.generate_content_async(
+            prompt, generation_config=self._config(schema),
+            request_options=self._request_options(deadlines.remaining()))
+        return response.text if hasattr(response, 'text') else str(response)
+
+    def create_context_cache(self, document, system_instruction, ttl_seconds):
+        cached = genai.caching.CachedContent.create(
+            model=self.cache_model_name,
+            system_instruction=system_instruction,
+            contents=[document],
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        self._caches[cached.name] = cached
+        return cached.name
+
+    def refresh_context_cache(self, name, ttl_seconds):
+        self._cached(name).update(ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def delete_context_cache(self, name):
+        cached = self._caches.pop(name, None) or genai.caching.CachedContent.get(name)
+        cached.delete()
+
+    def _stream(self, prompt, schema=None, timeout=None):
+        model = genai.GenerativeModel(self.model_name)
+        for chunk in model.generate_content(prompt, generation_config=self._config(schema), stream=True,
+                                            request_options=self._request_options(timeout)):
+            if chunk.parts:
+                yield chunk.text
+
+    def count_tokens(self, text):
+        return genai.GenerativeModel(self.model_name).count_tokens(text).total_tokens
+
+
+class StubError(Exception):
+    """Injected failure; the message mimics the Gemini SDK so handlers map it the same way."""
+
+
+class StubProvider(LLMProvider):
+    """Deterministic local provider for load and end-to-end testing.
+
+    Simulated latency is ``latency_ms`` plus the time to "stream" the answer at
+    ``tokens_per_sec`` and, when ``prefill_tokens_per_sec`` is set, to read the
+    prompt at that rate (cached documents are not read again). A share
+    ``slow_rate`` of calls take ``slow_ms`` longer, for tail latency. ``error_rate_429``
+    and ``error_rate_500`` are the probabilities of an injected failure per
+    call, drawn from a seeded RNG. Context caches live in memory and expire
+    like Gemini's: using an expired or deleted one fails with a 404.
+    """
+
+    name = "stub"
+    context_caching = True
+
+    def __init__(self, latency_ms=200.0, tokens_per_sec=80.0, output_tokens=150,
+                 error_rate_429=0.0, error_rate_500=0.0, seed=0, prefill_tokens_per_sec=0.0,
+                 slow_rate=0.0, slow_ms=0.0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.output_tokens = output_tokens
+        self.error_rate_429 = error_rate_429
+        self.error_rate_500 = error_rate_500
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._caches = {}  # name -> (document, expires_at)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_ms=float(os.getenv("STUB_LLM_LATENCY_MS", "200")),
+            tokens_per_sec=float(os.getenv("STUB_LLM_TOKENS_PER_SEC", "80")),
+            output_tokens=int(os.getenv("STUB_LLM_OUTPUT_TOKENS", "150")),
+            error_rate_429=float(os.getenv("STUB_LLM_ERROR_RATE_429", "0")),
+            error_rate_500=float(os.getenv("STUB_LLM_ERROR_RATE_500", "0")),
+            seed=int(os.getenv("STUB_LLM_SEED", "0")),
+            prefill_tokens_per_sec=float(os.getenv("STUB_LLM_PREFILL_TOKENS_PER_SEC", "0")),
+            slow_rate=float(os.getenv("STUB_LLM_SLOW_RATE", "0")),
+            slow_ms=float(os.getenv("STUB_LLM_SLOW_MS", "0")),
+        )
+
+    def _prefill(self, text):
+        return estimate_tokens(text) / self.prefill_tokens_per_sec if self.prefill_tokens_per_sec > 0 else 0.0
+
+    def _delay(self, prompt=""):
+        stream_time = self.output_tokens / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        return self.latency_ms / 1000.0 + self._prefill(prompt) + stream_time
+
+    def _tail(self):
+        if self.slow_rate <= 0:
+            return 0.0
+        with self._lock:
+            roll = self._rng.random()
+        return self.slow_ms / 1000.0 if roll < self.slow_rate else 0.0
+
+    def _maybe_fail(self):
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.error_rate_429:
+            raise StubError("429 Resource has been exhausted (e.g. check quota).")
+        if roll < self.error_rate_429 + self.error_rate_500:
+            raise StubError("500 An internal error has occurred.")
+
+    def _answer(self, prompt):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        if '"risk_categories"' in prompt:
+            level = ("Low", "Medium", "High")[int(digest[0], 16) % 3]
+            return json.dumps({
+                "overall_risk_level": level,
+                "risk_categories": [{
+                    "category": "Financial Risk",
+                    "level": level,
+                    "description": f"Stub analysis {digest[:12]}.",
+                    "specific_clauses": [],
+                    "recommendations": ["Review payment terms."],
+                }],
+                "key_concerns": [f"Stub concern {digest[12:20]}"],
+                "missing_protections": [],
+                "summary": "Deterministic stub response.",
+            })
+        filler = f"stub-{digest[:8]} "
+        return (filler * (self.output_tokens * CHARS_PER_TOKEN // len(filler) + 1)).strip()
+
+    def _chunks(self, answer):
+        size = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN
+        return [answer[i:i + size] for i in range(0, len(answer), size)]
+
+    def _context(self, cached_content):
+        """The cached document prepended to the prompt, as if it were part of it."""
+        if not cached_content:
+            return ""
+        with self._lock:
+            document, expires_at = self._caches.get(cached_content, (None, 0.0))
+        if document is None or expires_at <= time.time():
+            raise StubError(f"404 CachedContent not found (or permission denied): {cached_content}")
+        return document + "\n"
+
+    def create_context_cache(self, document, system_instruction, ttl_seconds):
+        self._maybe_fail()
+        time.sleep(self.latency_ms / 1000.0 + self._prefill(document))
+        name = "cachedContents/stub-" + hashlib.sha256((system_instruction + document).encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            self._caches[name] = (system_instruction + "\n" + document, time.time() + ttl_seconds)
+        return name
+
+    def refresh_context_cache(self, name, ttl_seconds):
+        with self._lock:
+            if name not in self._caches or self._caches[name][1] <= time.time():
+                raise StubError(f"404 CachedContent not found (or permission denied): {name}")
+            self._caches[name] = (self._caches[name][0], time.time() + ttl_seconds)
+
+    def delete_context_cache(self, name):
+        with self._lock:
+            self._caches.pop(name, None)
+
+    def _generate(self, prompt, schema=None, cached_content=None, timeout=None):
+        self._maybe_fail()
+        context = self._context(cached_content)
+        delay = self._delay(prompt) + self._tail()
+        if timeout is not None and delay > timeout:
+            # What the SDK does when the RPC timeout passes
+            time.sleep(timeout)
+            raise google_exceptions.DeadlineExceeded("Deadline Exceeded")
+        time.sleep(delay)
+        return self._answer(context + prompt)
+
+    def _stream(self, prompt, schema=None, timeout=None):
+        self._maybe_fail()
+        time.sleep(self.latency_ms / 1000.0 + self._prefill(prompt) + self._tail())
+        chunks = self._chunks(self._answer(prompt))
+        for chunk in chunks:
+            time.sleep((self._delay() - self.latency_ms / 1000.0) / len(chunks))
+            yield chunk
+
+    async def _agenerate(self, prompt, schema=None, cached_content=None):
+        self._maybe_fail()
+        context = self._context(cached_content)
+        await asyncio.sleep(self._delay(prompt) + self._tail())
+        return self._answer(context + prompt)
+
+    async def _astream(self, prompt, schema=None):
+        self._maybe_fail()
+        await asyncio.sleep(self.latency_ms / 1000.0 + self._prefill(prompt) + self._tail())
+        chunks = self._chunks(self._answer(prompt))
+        for chunk in chunks:
+            # The total time matches agenerate; the answer arrives spread over it
+            await asyncio.sleep((self._delay() - self.latency_ms / 1000.0) / len(chunks))
+            yield chunk
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "stub": StubProvider.from_env,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """Return the process-wide provider selected by ``LLM_PROVIDER`` (default: gemini)."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                name = os.getenv("LLM_PROVIDER", "gemini").lower()
+                if name not in PROVIDERS:
+                    raise ValueError(f"Unknown LLM_PROVIDER '{name}'. Choose one of: {', '.join(PROVIDERS)}")
+                _provider = PROVIDERS[name]()
+    return _provider
+
+
+def set_provider(provider):
+    """Install ``provider`` as the process-wide provider (tests and harnesses)."""
+    global _provider
+    _provider = provider
@@ -0,0 +1,256 @@
+"""In-process metrics exposed in Prometheus text format.
+
+A deliberately small, dependency-free registry: counters, gauges and
+histograms with labels, rendered by ``render()``. Processing stages are timed
+through ``core.timing.stage``, which feeds ``STAGE_SECONDS``; HTTP traffic is
+recorded by the middleware installed with ``instrument_app``.
+
+Values are per process. When several workers serve the app, Prometheus
+should scrape each of them (or aggregate by instance).
+"""
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    labels = _labels(self.labelnames, key, [("le", _number(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _labels(self.labelnames, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "contracts_stage_duration_seconds",
+    "Wall time spent in each processing stage (temp_write, pdf_text, ocr_page, "
+    "prompt_build, llm_round_trip, risk_json_parse, ...).",
+    ["stage"],
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "contracts_stage_errors_total", "Processing stages that raised an exception.", ["stage"]
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "contracts_http_requests_total", "HTTP requests served.", ["endpoint", "method", "status"]
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "contracts_http_request_duration_seconds", "HTTP request latency.", ["endpoint"]
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "contracts_http_requests_in_flight", "Requests currently being processed.", ["endpoint"]
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "contracts_cache_lookups_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"]
+)
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "contracts_cache_hit_ratio", "Fraction of lookups served from cache since start-up.", ["cache"]
+)
+
+JOBS = REGISTRY.counter(
+    "contracts_extraction_jobs_total", "Asynchronous extraction jobs finished, by status (done/failed).", ["status"]
+)
+
+ADMISSION_WAIT = REGISTRY.histogram(
+    "contracts_admission_wait_seconds", "Time requests waited for an admission slot.", ["pool"]
+)
+ADMISSION_WAITING = REGISTRY.gauge(
+    "contracts_admission_waiting", "Requests currently queued for an admission slot.", ["pool"]
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "contracts_admission_rejected_total",
+    "Requests turned away by admission control, by reason (queue_full/timeout/client_limit).",
+    ["pool", "reason"],
+)
+
+CHAT_ROUTES = REGISTRY.counter(
+    "contracts_chat_routes_total",
+    "Chat questions by the path that answered them (local/context_cache/llm) and lookup intent.",
+    ["path", "intent"],
+)
+
+LLM_HEDGES = REGISTRY.counter(
+    "contracts_llm_hedges_total",
+    "LLM calls that sent a backup request, by endpoint and which request answered first (primary/backup).",
+    ["endpoint", "winner"],
+)
+LLM_HEDGE_RATE = REGISTRY.gauge(
+    "contracts_llm_hedge_rate", "Share of recent LLM calls that sent a backup request.", ["endpoint"]
+)
+LLM_DEADLINE_EXCEEDED = REGISTRY.counter(
+    "contracts_llm_deadline_exceeded_total", "LLM calls abandoned at the request's deadline, by budget.", ["budget"]
+)
+
+
+def observe_stage(name, seconds, failed=False):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if failed:
+        STAGE_ERRORS.inc(stage=name)
+
+
+def record_cache(cache, hit):
+    """Count one lookup against ``cache`` and refresh its hit ratio."""
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+    hits = CACHE_LOOKUPS.value(cache=cache, result="hit")
+    total = hits + CACHE_LOOKUPS.value(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / total, cache=cache)
+
+
+def render():
+    return REGISTRY.render()
+
+
+def instrument_app(app):
+    """Add request/in-flight accounting middleware and a ``GET /metrics`` route to a FastAPI app."""
+    from fastapi.responses import Response
+    from starlette.routing import Match
+
+    def endpoint_label(scope):
+        for route in app.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    @app.middleware("http")
+    async def metrics_middleware(request, call_next):
+        endpoint = endpoint_label(request.scope)
+        IN_FLIGHT.inc(endpoint=endpoint)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            IN_FLIGHT.dec(endpoint=endpoint)
+            HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(render(), media_type=CONTENT_TYPE)
+
+    return app
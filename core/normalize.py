@@ -0,0 +1,152 @@
+"""Post-extraction text normalization.
+
+PyPDF2 and Tesseract output carries running headers and footers
+("Confidential - Page 12 of 80"), words hyphenated across line breaks,
+typographic ligatures and runs of whitespace. ``normalize_pages`` removes
+them before the text is stored or sent to the LLM:
+
+1. lines that recur in the header/footer zone of many pages (after masking
+   digits, so page numbers don't defeat the match) are dropped, as are bare
+   page-number lines; a fixed header such as the title is kept once. A
+   numbered line is dropped everywhere only when it is a running footer or
+   header: at the same zone position on nearly every page
+   (``RUNNING_PAGE_SHARE``, so a cover page without it does not count). Other recurring numbered
+   lines (schedule rows, "Invoice No. ..." lines) are content; only exact
+   repeats of them are dropped;
+2. the remaining text goes through a single regex pass that expands
+   ligatures, strips soft hyphens and zero-width characters, re-joins
+   hyphenated line breaks and collapses whitespace.
+"""
+import re
+from collections import Counter, defaultdict
+
+# Lines at the top and bottom of each page that may be running headers/footers
+ZONE_LINES = 3
+# A zone line is boilerplate if it recurs on at least this share of pages...
+MIN_PAGE_SHARE = 0.5
+# ...and on at least this many pages
+MIN_PAGES = 3
+# A numbered zone line is a running header/footer if it sits in one place on at least this share of pages
+RUNNING_PAGE_SHARE = 0.8
+
+LIGATURES = {
+    "\ufb00": "ff", "\ufb01": "fi", "\ufb02": "fl", "\ufb03": "ffi", "\ufb04": "ffl",
+    "\ufb05": "st", "\ufb06": "st",
+    "\u00ad": "", "\u200b": "", "\u200c": "", "\u200d": "", "\ufeff": "",  # soft hyphen, zero-width
+}
+
+_CLEANUP = re.compile(
+    r"(?P<lig>[\ufb00-\ufb06\u00ad\u200b-\u200d\ufeff])"
+    r"|(?P<hyph>(?<=[a-z])-[ \t]*\n[ \t]*(?=[a-z]))"
+    r"|(?P<para>[ \t]*\n(?:[ \t]*\n)+[ \t]*)"
+    r"|(?P<line>[ \t]*\n[ \t]*)"
+    r"|(?P<space>[ \t\f\v\u00a0\u2000-\u200a\u3000]+)"
+)
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+_PAGE_NUMBER = re.compile(r"^[-\u2013\u2014 ]*(?:page\s*)?#(?:\s*(?:of|/)\s*#)?[-\u2013\u2014 ]*$")
+
+
+def _line_key(line):
+    return _SPACES.sub(" ", _DIGITS.sub("#", line.strip().lower()))
+
+
+def _zone(lines):
+    """Line index -> zone position (``("top", n)`` or ``("bottom", n)``) for the first and last
+    non-empty lines of a page, which may hold a header/footer.
+
+    Short pages get a smaller zone so their body text is never mistaken for boilerplate.
+    """
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    size = min(ZONE_LINES, len(filled) // 3)
+    if not size:
+        return {}
+    zone = {i: ("top", n) for n, i in enumerate(filled[:size])}
+    zone.update({i: ("bottom", n) for n, i in enumerate(reversed(filled[-size:]))})
+    return zone
+
+
+def strip_boilerplate(pages):
+    """Drop running headers/footers and page-number lines. Returns ``(pages, removed)``."""
+    split = [page.splitlines() for page in pages]
+    zones = [_zone(lines) for lines in split]
+    seen = Counter()
+    positions = defaultdict(set)
+    for lines, zone in zip(split, zones):
+        keys = set()
+        for i, position in zone.items():
+            key = _line_key(lines[i])
+            keys.add(key)
+            positions[key].add(position)
+        seen.update(keys)
+
+    threshold = max(MIN_PAGES, MIN_PAGE_SHARE * len(pages))
+    boilerplate = {key for key, n in seen.items() if n >= threshold}
+    # Numbered running headers/footers: on nearly every page, always in the same place
+    running_threshold = max(MIN_PAGES, RUNNING_PAGE_SHARE * len(pages))
+    running = {key for key in boilerplate
+               if "#" in key and seen[key] >= running_threshold and len(positions[key]) == 1}
+    check_page_numbers = len(pages) > 1
+
+    result, removed, kept_once = [], 0, set()
+    for lines, zone in zip(split, zones):
+        kept = []
+        for i, line in enumerate(lines):
+            if i in zone:
+                key = _line_key(line)
+                if check_page_numbers and _PAGE_NUMBER.match(key):
+                    removed += 1
+                    continue
+                if key in running:
+                    removed += 1
+                    continue
+                if key in boilerplate:
+                    # Keep the first occurrence of a fixed running header (usually the
+                    # document title); numbered lines are content, so only exact repeats go
+                    once = _SPACES.sub(" ", line.strip().lower()) if "#" in key else key
+                    if once in kept_once:
+                        removed += 1
+                        continue
+                    kept_once.add(once)
+            kept.append(line)
+        result.append("\n".join(kept))
+    return result, removed
+
+
+def normalize_text(text):
+    """Expand ligatures, de-hyphenate and collapse whitespace in one pass.
+
+    Returns ``(text, joined)`` where ``joined`` is the number of hyphenated
+    line breaks that were re-joined.
+    """
+    joined = 0
+
+    def replace(match):
+        nonlocal joined
+        kind = match.lastgroup
+        if kind == "lig":
+            return LIGATURES[match.group()]
+        if kind == "hyph":
+            joined += 1
+            return ""
+        if kind == "para":
+            return "\n\n"
+        if kind == "line":
+            return "\n"
+        return " "
+
+    return _CLEANUP.sub(replace, text).strip(), joined
+
+
+def normalize_pages(pages):
+    """Normalize extracted pages into one text. Returns ``(text, report)``."""
+    before = sum(len(page) for page in pages)
+    pages, removed = strip_boilerplate(pages)
+    text, joined = normalize_text("\n".join(pages))
+    return text, {
+        "chars_before": before,
+        "chars_after": len(text),
+        "reduction_pct": round(100.0 * (before - len(text)) / before, 1) if before else 0.0,
+        "boilerplate_lines_removed": removed,
+        "hyphenations_joined": joined,
+    }
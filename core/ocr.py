@@ -0,0 +1,241 @@
+"""OCR for scanned PDFs and images: preprocessing and adaptive resolution.
+
+Every page is first rasterized at ``OCR_DPI``, which is cheap and enough for
+clean scans. The page is then preprocessed with NumPy:
+
+- grayscale;
+- deskew, by picking the rotation whose row projection of ink is sharpest;
+- Otsu binarization.
+
+It is read with ``image_to_data``, which returns the text together with
+Tesseract's per-word confidence. Pages whose mean word confidence is below
+``OCR_MIN_CONFIDENCE`` are rasterized again, alone, at ``OCR_RETRY_DPI`` and
+read again. The better of the two readings is kept. Blank pages (almost no
+ink) are never retried.
+
+``OCR_PREPROCESS=off`` sends the plain grayscale page instead, for comparing
+runs with ``benchmarks/bench_extraction.py``.
+
+Tesseract and Poppler are external programs; ``tool_versions`` reports
+whether they are installed, for the readiness check and the production
+server's startup (``OCR_REQUIRED``).
+"""
+import functools
+import importlib.util
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+from core.timing import stage
+
+OCR_DPI = int(os.getenv("OCR_DPI", "150"))
+OCR_RETRY_DPI = int(os.getenv("OCR_RETRY_DPI", "300"))
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "70"))
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "on").lower() != "off"
+# Tesseract page segmentation mode; 3 (automatic layout) handles multi-column pages and headers
+OCR_PSM = int(os.getenv("OCR_PSM", "3"))
+# Missing OCR tools make the server not ready (and core.serve refuse to start); Vercel has none
+OCR_REQUIRED = os.getenv("OCR_REQUIRED", "off" if os.getenv("VERCEL") else "on").lower() != "off"
+
+# Deskew search: scanner skew is small, so +-MAX_SKEW degrees in SKEW_STEP steps
+MAX_SKEW = 5.0
+SKEW_STEP = 0.25
+# Below this a rotation costs more (resampling blur) than it gains
+MIN_SKEW = 0.3
+# The skew estimate only needs a sample of the ink pixels
+SKEW_SAMPLE = 50_000
+# Pages with less ink than this share of pixels are treated as blank
+BLANK_INK_SHARE = 0.001
+
+# ITU-R BT.601 luma weights
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _version(command, module):
+    """First line of ``command``'s version output, or ``None`` if it or the Python ``module`` is missing."""
+    if shutil.which(command[0]) is None or importlib.util.find_spec(module) is None:
+        return None
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    # pdftoppm prints its version to stderr
+    lines = (result.stdout or result.stderr).strip().splitlines()
+    return lines[0] if lines else command[0]
+
+
+@functools.lru_cache(maxsize=1)
+def tool_versions():
+    """``{"tesseract": version, "poppler": version}``, ``None`` for a missing tool. Checked once per process."""
+    versions = {
+        "tesseract": _version(["tesseract", "--version"], "pytesseract"),
+        "poppler": _version(["pdftoppm", "-v"], "pdf2image"),
+    }
+    if versions["poppler"] is not None and shutil.which("pdfinfo") is None:
+        versions["poppler"] = None
+    return versions
+
+
+def missing_tools():
+    return [name for name, version in tool_versions().items() if version is None]
+
+
+def grayscale(image):
+    """``image`` (PIL) as a 2-D uint8 array."""
+    if image.mode == "L":
+        return np.asarray(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    return (np.asarray(image)[..., :3] @ _LUMA).astype(np.uint8)
+
+
+def otsu_threshold(gray):
+    """Otsu's threshold: the gray level that maximizes the between-class variance."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * levels)
+    total, total_mean = weight[-1], mean[-1]
+    background = weight
+    foreground = total - weight
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (total_mean * background - mean * total) ** 2 / (background * foreground)
+    return int(np.nanargmax(between)) if np.isfinite(between).any() else 127
+
+
+def estimate_skew(ink):
+    """Skew angle in degrees of the text in the boolean ``ink`` mask (``0.0`` if unclear)."""
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > SKEW_SAMPLE:
+        pick = np.random.default_rng(0).choice(len(ys), SKEW_SAMPLE, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    angles = np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP)
+    radians = np.deg2rad(angles)
+    # Row of every ink pixel after rotating by each candidate angle: (angles, pixels)
+    rows = np.rint(ys[None, :] * np.cos(radians)[:, None] - xs[None, :] * np.sin(radians)[:, None]).astype(np.int64)
+    rows -= rows.min(axis=1, keepdims=True)
+    height = int(rows.max()) + 1
+    # One bincount over all angles at once: offset each angle's rows into its own range
+    profiles = np.bincount((rows + np.arange(len(angles))[:, None] * height).ravel(),
+                           minlength=len(angles) * height).reshape(len(angles), height)
+    # Aligned text lines give tall, narrow peaks: the largest sum of squares
+    score = (profiles.astype(np.float64) ** 2).sum(axis=1)
+    if score.max() <= score.min() * 1.0001:
+        return 0.0
+    return float(angles[score.argmax()])
+
+
+def preprocess(image):
+    """Grayscale, deskew and binarize a page. Returns ``(PIL image, ink share)``."""
+    from PIL import Image
+
+    gray = grayscale(image)
+    threshold = otsu_threshold(gray)
+    ink = gray <= threshold
+    ink_share = float(ink.mean())
+    if not OCR_PREPROCESS:
+        return Image.fromarray(gray), ink_share
+    if ink_share >= BLANK_INK_SHARE:
+        angle = estimate_skew(ink)
+        if abs(angle) >= MIN_SKEW:
+            # A positive angle means lines fall to the right; PIL rotates counter-clockwise.
+            # Rotate the grayscale page, not the binary one, so the resampling can still anti-alias
+            rotated = Image.fromarray(gray).rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+            gray = np.asarray(rotated)
+    return Image.fromarray(np.where(gray <= threshold, 0, 255).astype(np.uint8)), ink_share
+
+
+def read_page(image):
+    """``(text, confidence)`` for one page; confidence is the mean word confidence (0-100), ``None`` with no words."""
+    import pytesseract
+
+    data = pytesseract.image_to_data(image, config=f"--psm {OCR_PSM}", output_type=pytesseract.Output.DICT)
+    lines, confidences, key = [], [], None
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        confidences.append(conf)
+        line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key is not None and line[:2] != key[:2]:
+            lines.append("")  # paragraph break
+        if line != key:
+            lines.append(word)
+            key = line
+        else:
+            lines[-1] += " " + word
+    confidence = sum(confidences) / len(confidences) if confidences else None
+    return "\n".join(lines) + ("\n" if lines else ""), confidence
+
+
+def _ocr_page(image, timings=None):
+    with stage("ocr_preprocess", timings):
+        page, ink_share = preprocess(image)
+    with stage("ocr_page", timings):
+        text, confidence = read_page(page)
+    blank = ink_share < BLANK_INK_SHARE
+    return text, confidence, blank
+
+
+def _needs_retry(confidence, blank):
+    return not blank and (confidence is None or confidence < OCR_MIN_CONFIDENCE)
+
+
+def ocr_images(images, timings=None, progress=None, first_page=1, total=None):
+    """Text of each image in ``images`` (pages ``first_page`` onwards of ``total``).
+
+    Images have a fixed resolution, so there is no retry.
+    """
+    pages = []
+    for image in images:
+        text, _, _ = _ocr_page(image, timings)
+        pages.append(text)
+        if progress is not None:
+            progress("ocr_page", first_page + len(pages) - 1, total or first_page + len(images) - 1)
+    return pages
+
+
+def ocr_pdf(file_path, timings=None, progress=None, first_page=None, last_page=None):
+    """Text of each page of ``file_path`` (``first_page`` to ``last_page``, 1-based, default all).
+
+    All pages are read at ``OCR_DPI``; low-confidence ones are read again at ``OCR_RETRY_DPI``.
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    def report(name, done, total):
+        if progress is not None:
+            progress(name, done, total)
+
+    total = pdfinfo_from_path(file_path)["Pages"]
+    first, last = max(first_page or 1, 1), min(last_page or total, total)
+    if first > last:
+        return []
+    report("ocr_rasterize", 0, 1)
+    with stage("ocr_rasterize", timings):
+        images = convert_from_path(file_path, dpi=OCR_DPI, grayscale=True, first_page=first, last_page=last)
+    report("ocr_rasterize", 1, 1)
+
+    pages, retry = [], []
+    for number, image in enumerate(images, start=first):
+        text, confidence, blank = _ocr_page(image, timings)
+        pages.append((text, confidence))
+        if _needs_retry(confidence, blank):
+            retry.append(number)
+        report("ocr_page", number, total)
+    del images
+
+    for done, number in enumerate(retry, start=1):
+        with stage("ocr_retry", timings):
+            # One page at a time keeps memory at one high-resolution page
+            image = convert_from_path(file_path, dpi=OCR_RETRY_DPI, grayscale=True,
+                                      first_page=number, last_page=number)[0]
+            text, confidence, _ = _ocr_page(image, timings)
+        index = number - first
+        if confidence is not None and (pages[index][1] is None or confidence > pages[index][1]):
+            pages[index] = (text, confidence)
+        report("ocr_retry", done, len(retry))
+    return [text for text, _ in pages]
@@ -0,0 +1,144 @@
+"""Text-layer backends for PDF extraction.
+
+``core.extraction`` reads a PDF's text layer through one of ``PDF_BACKENDS``:
+
+- ``pdfium``: pypdfium2, the PDFium engine used by Chrome. It is faster than
+  PyPDF2, several times faster on PDFs that position text line by line
+  with kerning. It also spaces words correctly when the gaps between them
+  are kerning rather than space characters.
+- ``pymupdf``: PyMuPDF (MuPDF), about as fast. It is licensed under the
+  AGPL, so it is not in ``requirements.txt``; install it yourself to use it.
+- ``pypdf2``: PyPDF2, pure Python and always installed. It is the slowest,
+  and it runs words together at such gaps.
+
+``PDF_TEXT_BACKEND`` picks the backend (default ``auto``: the first
+installed of ``AUTO_ORDER``), and ``/extract?pdf_backend=`` picks one for
+a single document. A document the chosen backend cannot open is retried
+with the other installed backends (``candidates``). PDFium and MuPDF are
+not thread-safe, so each extracts one document at a time per process.
+``register_pdf_backend`` adds backends. ``python -m benchmarks.bench_extraction
+--pdf-backends all`` compares them.
+"""
+import importlib.util
+import os
+import threading
+
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "auto").lower()
+# Chosen by "auto", and tried in turn when a backend cannot open a document
+AUTO_ORDER = ("pdfium", "pypdf2")
+
+
+class PyPDF2Text:
+    name = "pypdf2"
+    module = "PyPDF2"
+    lock = None
+
+    def __init__(self, stream):
+        from PyPDF2 import PdfReader
+
+        self._reader = PdfReader(stream)
+
+    def __len__(self):
+        return len(self._reader.pages)
+
+    def page_text(self, index):
+        return self._reader.pages[index].extract_text() or ""
+
+    def close(self):
+        pass
+
+
+class PdfiumText:
+    name = "pdfium"
+    module = "pypdfium2"
+    lock = threading.Lock()
+
+    def __init__(self, stream):
+        import pypdfium2
+
+        # Read in place through the stream, as PyPDF2 does
+        self._document = pypdfium2.PdfDocument(stream)
+
+    def __len__(self):
+        return len(self._document)
+
+    def page_text(self, index):
+        page = self._document[index]
+        try:
+            text_page = page.get_textpage()
+            try:
+                text = text_page.get_text_bounded().replace("\r\n", "\n")
+            finally:
+                text_page.close()
+        finally:
+            page.close()
+        # Ended like the other backends' pages, so joined pages do not run together
+        return text + "\n" if text and not text.endswith("\n") else text
+
+    def close(self):
+        self._document.close()
+
+
+class PyMuPDFText:
+    name = "pymupdf"
+    module = "pymupdf"
+    lock = threading.Lock()
+
+    def __init__(self, stream):
+        import pymupdf
+
+        # MuPDF parses from memory, so a file is read in full
+        self._document = pymupdf.open(stream=stream.read(), filetype="pdf")
+
+    def __len__(self):
+        return self._document.page_count
+
+    def page_text(self, index):
+        return self._document[index].get_text()
+
+    def close(self):
+        self._document.close()
+
+
+# name -> backend class: ``Backend(stream)`` opens a document; ``len()``, ``page_text(index)``, ``close()``
+PDF_BACKENDS = {backend.name: backend for backend in (PdfiumText, PyMuPDFText, PyPDF2Text)}
+
+
+def register_pdf_backend(backend):
+    """Make ``backend`` (a class shaped like ``PyPDF2Text``) selectable by its ``name``."""
+    PDF_BACKENDS[backend.name] = backend
+
+
+def installed(name):
+    backend = PDF_BACKENDS.get(name)
+    return backend is not None and importlib.util.find_spec(backend.module) is not None
+
+
+def available():
+    """Names of the registered backends whose library is installed."""
+    return [name for name in PDF_BACKENDS if installed(name)]
+
+
+def default_backend():
+    """The backend ``PDF_TEXT_BACKEND`` selects."""
+    if PDF_TEXT_BACKEND != "auto":
+        if installed(PDF_TEXT_BACKEND):
+            return PDF_TEXT_BACKEND
+        print(f"⚠️ PDF_TEXT_BACKEND={PDF_TEXT_BACKEND} is not installed; choosing automatically")
+    return next(name for name in AUTO_ORDER if installed(name))
+
+
+def check_backend(name):
+    """Raise ``ValueError`` with a user-facing message unless backend ``name`` can be used."""
+    if not installed(name):
+        raise ValueError(f"Unknown PDF backend '{name}'. Available: {', '.join(available())}.")
+
+
+def candidates(name=None):
+    """Backends to try for a document, in order: ``name`` (or the default), then the installed ``AUTO_ORDER`` ones."""
+    first = name or DEFAULT_BACKEND
+    check_backend(first)
+    return [first] + [other for other in AUTO_ORDER if other != first and installed(other)]
+
+
+DEFAULT_BACKEND = default_backend()
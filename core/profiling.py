@@ -0,0 +1,356 @@
+"""On-demand profiling of single requests.
+
+When a particular document is slow, profile just that request. Send it with
+``X-Profile: <PROFILE_TOKEN>``, or set ``PROFILING=all`` to profile every
+request. A profiled request records:
+
+- a sampling profile. Every ``PROFILE_SAMPLE_MS`` the stacks of the threads
+  working on the request are sampled: the event loop thread, plus worker
+  threads while they run one of its ``core.timing.stage`` blocks. They are
+  aggregated as folded stacks (``frame;frame;frame count``).
+- a per-stage breakdown: every ``stage`` the request ran, with its start
+  offset, duration and thread, plus totals per stage.
+
+Profiles are stored as JSON in ``PROFILE_DIR``, keyed by request ID. The ID
+is the client's ``X-Request-ID`` when it sends a valid one that is not taken
+yet, otherwise a new one, and comes back in the ``X-Profile-Id`` response
+header. The newest ``PROFILE_KEEP`` profiles are kept. ``GET /admin/profiles``
+lists them and ``GET /admin/profiles/{id}`` serves one; ``?format=folded``
+gives the folded stacks for flame graph tools (speedscope,
+``flamegraph.pl``). The admin routes also need the token in ``X-Profile``.
+
+Without ``PROFILE_TOKEN`` anyone could start profiles and read them, so the
+header and the admin routes are off: ``PROFILING=header`` (the default)
+profiles nothing, and ``PROFILING=all`` only writes profiles to disk.
+
+The event loop thread is shared: under concurrency its samples also show
+other requests, and ``select`` frames are time spent waiting on I/O.
+``PROFILING=off`` disables profiling and the admin routes.
+"""
+import asyncio
+import collections
+import contextvars
+import functools
+import hmac
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+PROFILING = os.getenv("PROFILING", "header").lower()
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "contracts-ai-profiles"))
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+
+HEADER = "x-profile"
+ADMIN_PREFIX = "/admin/profiles"
+# Stacks deeper than this keep their innermost frames
+MAX_STACK_DEPTH = 128
+# Stage entries recorded per request; totals keep counting past it
+MAX_STAGES = 5000
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_current = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    """Stage timings and stack samples of one request."""
+
+    def __init__(self, request_id, method, path):
+        self.id = request_id
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.stages = []
+        self.totals = collections.defaultdict(lambda: {"seconds": 0.0, "count": 0})
+        self.samples = collections.Counter()
+        self.ticks = 0
+        # Thread ident -> blocks running on it for this request
+        self._threads = collections.Counter()
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """Sample the calling thread until the matching ``leave``."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] += 1
+        return ident
+
+    def leave(self, ident):
+        with self._lock:
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def add_stage(self, name, start, seconds, failed):
+        with self._lock:
+            total = self.totals[name]
+            total["seconds"] += seconds
+            total["count"] += 1
+            if len(self.stages) < MAX_STAGES:
+                self.stages.append({"stage": name, "start": round(start - self.start, 6),
+                                    "seconds": round(seconds, 6), "thread": threading.current_thread().name,
+                                    "failed": failed})
+
+    def sample(self, frames):
+        with self._lock:
+            threads = list(self._threads)
+            self.ticks += 1
+        for ident in threads:
+            frame = frames.get(ident)
+            if frame is not None:
+                stack = _fold(frame)
+                with self._lock:
+                    self.samples[stack] += 1
+
+    def to_dict(self, status):
+        seconds = time.perf_counter() - self.start
+        with self._lock:
+            totals = {name: {"seconds": round(t["seconds"], 6), "count": t["count"]}
+                      for name, t in sorted(self.totals.items(), key=lambda item: -item[1]["seconds"])}
+            return {
+                "id": self.id,
+                "method": self.method,
+                "path": self.path,
+                "status": status,
+                "started_at": self.started_at,
+                "seconds": round(seconds, 6),
+                "sample_interval_ms": PROFILE_SAMPLE_MS,
+                "ticks": self.ticks,
+                "stage_totals": totals,
+                "stages": list(self.stages),
+                "samples": [{"stack": stack, "count": count} for stack, count in self.samples.most_common()],
+            }
+
+
+@functools.lru_cache(maxsize=4096)
+def _short_path(filename):
+    # Relative to its sys.path entry: "core/extraction.py", "PyPDF2/_page.py"
+    roots = sorted((p for p in sys.path if p), key=len, reverse=True)
+    for root in roots:
+        if filename.startswith(root.rstrip(os.sep) + os.sep):
+            return filename[len(root.rstrip(os.sep)) + 1:]
+    return filename
+
+
+def _fold(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({_short_path(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _Sampler:
+    """One background thread that samples every active profile; it exits when none are left."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._profiles = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile):
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+            del frames
+            time.sleep(self.interval)
+
+
+_sampler = _Sampler(PROFILE_SAMPLE_MS / 1000)
+
+
+def current():
+    """The ``Profile`` of the request being handled, or ``None``."""
+    return _current.get()
+
+
+def _path(request_id):
+    return os.path.join(PROFILE_DIR, f"{request_id}.json")
+
+
+def _mtime(entry):
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        # Removed by another worker meanwhile
+        return 0.0
+
+
+def save(record):
+    """Write a profile and drop the oldest beyond ``PROFILE_KEEP``."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = _path(record["id"])
+    partial = f"{path}.{uuid.uuid4().hex}.part"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(partial, path)
+    profiles = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+                      key=_mtime, reverse=True)
+    for entry in profiles[PROFILE_KEEP:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def load(request_id):
+    """The stored profile for ``request_id``, or ``None``."""
+    if not _REQUEST_ID.match(request_id):
+        return None
+    try:
+        with open(_path(request_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    summaries = []
+    for entry in os.scandir(PROFILE_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        record = load(entry.name[:-len(".json")])
+        if record is None:
+            continue
+        slowest = next(iter(record["stage_totals"]), None)
+        summary = {key: record[key] for key in ("id", "method", "path", "status", "started_at", "seconds")}
+        summaries.append(dict(summary, slowest_stage=slowest, samples=sum(s["count"] for s in record["samples"])))
+    return sorted(summaries, key=lambda s: s["started_at"], reverse=True)
+
+
+def folded(record):
+    """The profile's samples in folded-stack format, one ``stack count`` line each."""
+    return "".join(f"{sample['stack']} {sample['count']}\n" for sample in record["samples"])
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def authorized(value, token=PROFILE_TOKEN):
+    """Whether an ``X-Profile`` header value asks for (or may read) a profile; never without a token."""
+    if value is None or not token:
+        return False
+    return hmac.compare_digest(value.encode(), token.encode())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests asking for it (every request with ``PROFILING=all``)."""
+
+    def __init__(self, app, mode=PROFILING, token=PROFILE_TOKEN):
+        self.app = app
+        self.mode = mode
+        self.token = token
+
+    def _wanted(self, scope):
+        if scope["type"] != "http" or scope["path"].startswith(ADMIN_PREFIX):
+            return False
+        return self.mode == "all" or authorized(_header(scope, HEADER.encode()), self.token)
+
+    async def __call__(self, scope, receive, send):
+        if not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        request_id = _header(scope, b"x-request-id")
+        # A reused ID gets a new one rather than overwriting the earlier profile
+        if request_id is None or not _REQUEST_ID.match(request_id) or os.path.exists(_path(request_id)):
+            request_id = uuid.uuid4().hex
+        profile = Profile(request_id, scope["method"], scope["path"])
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", ())) + [
+                    (b"x-profile-id", request_id.encode())])
+            await send(message)
+
+        token = _current.set(profile)
+        ident = profile.enter()
+        _sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _sampler.remove(profile)
+            profile.leave(ident)
+            _current.reset(token)
+            try:
+                await asyncio.to_thread(save, profile.to_dict(status))
+            except OSError as e:
+                print(f"⚠️ Could not save profile {request_id}: {e}")
+
+
+def install_profiling(app):
+    """Add request profiling and the ``/admin/profiles`` routes (no-op with ``PROFILING=off``).
+
+    Both need ``PROFILE_TOKEN``: without it, ``PROFILING=all`` only saves
+    profiles to ``PROFILE_DIR`` and any other mode installs nothing.
+    Install last, outside admission control and deadlines, so queueing shows in the profile.
+    """
+    if PROFILING == "off":
+        return app
+    if not PROFILE_TOKEN:
+        if PROFILING != "all":
+            return app
+        print(f"⚠️ PROFILE_TOKEN is not set: profiles are saved to {PROFILE_DIR} but /admin/profiles is off")
+        app.add_middleware(ProfilingMiddleware)
+        return app
+    from fastapi import Request
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    def denied(request):
+        if not authorized(request.headers.get(HEADER)):
+            return JSONResponse({"error": "Profiles need the X-Profile token."}, status_code=403)
+        return None
+
+    @app.get(ADMIN_PREFIX, include_in_schema=False)
+    async def profiles(request: Request):
+        return denied(request) or {"profiles": await asyncio.to_thread(list_profiles)}
+
+    @app.get(ADMIN_PREFIX + "/{request_id}", include_in_schema=False)
+    async def profile(request: Request, request_id: str, format: str = "json"):
+        refused = denied(request)
+        if refused:
+            return refused
+        record = await asyncio.to_thread(load, request_id)
+        if record is None:
+            return JSONResponse({"error": "Unknown profile ID."}, status_code=404)
+        if format == "folded":
+            return PlainTextResponse(folded(record))
+        return record
+
+    app.add_middleware(ProfilingMiddleware)
+    return app
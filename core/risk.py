@@ -0,0 +1,401 @@
+"""Risk analysis: the prompt, a schema for the model's JSON mode, local repair and incremental parsing.
+
+``RiskAnalysis`` is sent to the provider as a response schema, so Gemini
+returns bare JSON in the agreed shape instead of prose with a fenced block.
+Output that still fails to parse or validate (a truncated response, a
+trailing comma, a string where a list belongs) is repaired here rather than
+re-requested: ``repair_json`` closes what was left open and drops the
+incomplete tail, and the lenient validators coerce the rest.
+
+``CategoryStream`` parses a streamed response as it arrives and yields each
+``risk_categories`` entry as soon as its closing brace is seen;
+``POST /analyze-risks/stream`` (``install_risk_stream_api``) forwards them to
+the client as Server-Sent Events.
+"""
+import asyncio
+import json
+import re
+from typing import List
+
+from pydantic import BaseModel, ValidationError, field_validator, model_validator
+
+from core.deadlines import DeadlineExceeded
+from core.dedup import build_delta_prompt, reuse_report
+from core.timing import stage
+from core.tokens import RISK_TOKEN_BUDGET, fit_prompt
+
+LEVELS = ("Low", "Medium", "High")
+
+RISK_PROMPT = """You are an expert legal analyst specializing in contract risk assessment. Analyze the following contract document and identify potential risk factors.
+
+Contract Document:
+{document}
+
+Please provide a comprehensive risk analysis in the following JSON format:
+{{
+    "overall_risk_level": "Low/Medium/High",
+    "risk_categories": [
+        {{
+            "category": "Financial Risk",
+            "level": "Low/Medium/High",
+            "description": "Brief description of the risk",
+            "specific_clauses": ["List of specific problematic clauses or sections"],
+            "recommendations": ["List of recommended actions or mitigations"]
+        }}
+    ],
+    "key_concerns": ["List of the most critical issues"],
+    "missing_protections": ["List of protections that should be included but are missing"],
+    "summary": "Brief overall assessment and recommendations"
+}}
+
+Focus on these risk categories:
+1. Financial Risk (payment terms, penalties, liability caps)
+2. Performance Risk (delivery obligations, service levels, warranties)
+3. Legal/Compliance Risk (regulatory requirements, indemnification, governing law)
+4. Operational Risk (termination clauses, force majeure, data security)
+5. Reputation Risk (confidentiality, non-disparagement, publicity)
+6. Intellectual Property Risk (IP ownership, licensing, infringement)
+
+Be thorough but concise. Only return valid JSON."""
+
+
+def build_risk_prompt(document):
+    return RISK_PROMPT.format(document=document)
+
+
+def _level(value):
+    if value is None:
+        return ""
+    value = str(value).strip()
+    return next((level for level in LEVELS if level.lower() == value.lower()), value)
+
+
+def _string_list(value):
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [item if isinstance(item, str) else json.dumps(item) for item in value if item not in (None, "")]
+
+
+class RiskCategory(BaseModel):
+    category: str = ""
+    level: str = ""
+    description: str = ""
+    specific_clauses: List[str] = []
+    recommendations: List[str] = []
+
+    _normalize_level = field_validator("level", mode="before")(_level)
+    _normalize_lists = field_validator("specific_clauses", "recommendations", mode="before")(_string_list)
+
+    @field_validator("category", "description", mode="before")
+    @classmethod
+    def _text(cls, value):
+        return "" if value is None else str(value)
+
+
+class RiskAnalysis(BaseModel):
+    overall_risk_level: str = ""
+    risk_categories: List[RiskCategory] = []
+    key_concerns: List[str] = []
+    missing_protections: List[str] = []
+    summary: str = ""
+
+    _normalize_level = field_validator("overall_risk_level", mode="before")(_level)
+    _normalize_lists = field_validator("key_concerns", "missing_protections", mode="before")(_string_list)
+
+    @field_validator("risk_categories", mode="before")
+    @classmethod
+    def _categories(cls, value):
+        if isinstance(value, dict):
+            value = [value]
+        # Anything that is not an object cannot be a category; drop it rather than fail the analysis
+        return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+    @field_validator("summary", mode="before")
+    @classmethod
+    def _summary(cls, value):
+        return "" if value is None else str(value)
+
+    @model_validator(mode="after")
+    def _overall_from_categories(self):
+        if self.overall_risk_level not in LEVELS:
+            levels = [LEVELS.index(c.level) for c in self.risk_categories if c.level in LEVELS]
+            if levels:
+                self.overall_risk_level = LEVELS[max(levels)]
+        return self
+
+
+# Keys of the OpenAPI subset accepted by Gemini's response_schema (no defaults, titles or $refs)
+_SCHEMA_KEYS = ("type", "format", "description", "nullable", "enum", "properties", "required", "items")
+
+
+def _gemini_schema(node, defs):
+    if "$ref" in node:
+        return _gemini_schema(defs[node["$ref"].rsplit("/", 1)[-1]], defs)
+    schema = {key: node[key] for key in _SCHEMA_KEYS if key in node}
+    if "properties" in schema:
+        schema["properties"] = {name: _gemini_schema(prop, defs) for name, prop in schema["properties"].items()}
+        # Every field is requested; the defaults only exist to repair answers that omit one
+        schema["required"] = list(schema["properties"])
+    if "items" in schema:
+        schema["items"] = _gemini_schema(schema["items"], defs)
+    return schema
+
+
+def response_schema():
+    """``RiskAnalysis`` as a Gemini response schema, with the levels constrained to ``LEVELS``."""
+    raw = RiskAnalysis.model_json_schema()
+    schema = _gemini_schema(raw, raw.get("$defs", {}))
+    schema["properties"]["overall_risk_level"]["enum"] = list(LEVELS)
+    schema["properties"]["risk_categories"]["items"]["properties"]["level"]["enum"] = list(LEVELS)
+    return schema
+
+
+RISK_SCHEMA = response_schema()
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def repair_json(text):
+    """Best-effort valid JSON from a model answer; ``None`` if nothing can be recovered.
+
+    Strips code fences and text around the object, removes trailing commas
+    and closes unterminated strings, arrays and objects. If the answer was cut
+    off mid-value, the incomplete tail is dropped back to the last complete
+    element.
+    """
+    text = _FENCE.sub("", text.strip())
+    start = text.find("{")
+    if start < 0:
+        return None
+    out, stack, cuts = [], [], []
+    in_string = escaped = False
+    for char in text[start:]:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in "}]":
+            if not stack:
+                break
+            while out and out[-1] in " \t\r\n":
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            char = _CLOSERS[stack.pop()]
+        elif char == ",":
+            # Cutting here keeps every element before the comma
+            cuts.append((len(out), tuple(stack)))
+        out.append(char)
+        if not stack:
+            break
+
+    candidate = "".join(out)
+    if in_string:
+        candidate += "\\" if escaped else ""
+        candidate += '"'
+    attempts = [candidate + "".join(_CLOSERS[c] for c in reversed(stack))]
+    attempts += ["".join(out[:pos]) + "".join(_CLOSERS[c] for c in reversed(opened)) for pos, opened in reversed(cuts)]
+    for attempt in attempts:
+        try:
+            return json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def parse_analysis(answer):
+    """Validated analysis dict from a model answer, repaired locally when needed.
+
+    Falls back to ``{"raw_analysis": answer}`` only when no JSON object can be
+    recovered at all.
+    """
+    try:
+        data = json.loads(answer)
+    except json.JSONDecodeError:
+        data = repair_json(answer)
+    if not isinstance(data, dict):
+        return {"raw_analysis": answer}
+    try:
+        return RiskAnalysis.model_validate(data).model_dump()
+    except ValidationError:
+        return {"raw_analysis": answer}
+
+
+class CategoryStream:
+    """Incremental parser: ``feed`` text chunks, get back each ``risk_categories`` entry once complete."""
+
+    def __init__(self):
+        self._buffer = []
+        self._stack = []  # (opening char, key it is the value of)
+        self._in_string = self._escaped = False
+        self._string_start = 0
+        self._last_string = None
+        self._key = None
+        self._item_start = None
+        self._position = 0
+
+    def _in_categories(self):
+        return len(self._stack) == 2 and self._stack[-1] == ("[", "risk_categories")
+
+    def feed(self, chunk):
+        completed = []
+        self._buffer.append(chunk)
+        for char in chunk:
+            position = self._position
+            self._position += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = (self._string_start, position)
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = position + 1
+            elif char == ":":
+                start, end = self._last_string or (0, 0)
+                self._key = self._text(start, end)
+            elif char in "{[":
+                if char == "{" and self._in_categories():
+                    self._item_start = position
+                self._stack.append((char, self._key))
+                self._key = None
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if char == "}" and self._item_start is not None and self._in_categories():
+                    category = self._category(self._text(self._item_start, position + 1))
+                    if category is not None:
+                        completed.append(category)
+                    self._item_start = None
+            elif char == ",":
+                self._key = None
+        return completed
+
+    def _text(self, start, end):
+        text = "".join(self._buffer)
+        self._buffer = [text]
+        return text[start:end]
+
+    @staticmethod
+    def _category(text):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            data = repair_json(text)
+        if not isinstance(data, dict):
+            return None
+        try:
+            return RiskCategory.model_validate(data).model_dump()
+        except ValidationError:
+            return None
+
+
+async def prepare_analysis(text, llm, store):
+    """Plan an ``/analyze-risks`` call.
+
+    Near-duplicates of an analyzed contract reuse its analysis (``cached``) or
+    send only the changed sections. Returns a dict with ``near_duplicate`` and
+    either ``analysis`` (nothing to ask the model) or ``prompt`` and
+    ``token_budget``.
+    """
+    build_prompt, document, near_duplicate = build_risk_prompt, text, None
+    if store:
+        with stage("dedup_lookup"):
+            match = await asyncio.to_thread(store.find_near_duplicate, text)
+        if match:
+            near_duplicate = reuse_report(match)
+            if near_duplicate["mode"] == "cached":
+                return {"analysis": match["analysis"], "token_budget": None, "near_duplicate": near_duplicate}
+            if near_duplicate["mode"] == "delta":
+                build_prompt = build_delta_prompt(match["analysis"], match["removed_sections"])
+                document = "".join(match["changed_sections"])
+
+    with stage("prompt_build"):
+        prompt, token_budget = await asyncio.to_thread(
+            fit_prompt, build_prompt, document, RISK_TOKEN_BUDGET, None, llm
+        )
+    return {"prompt": prompt, "token_budget": token_budget, "near_duplicate": near_duplicate}
+
+
+def llm_error(e):
+    """``(status_code, message)`` for a provider exception, as the JSON endpoints report it."""
+    error_message = str(e)
+    if isinstance(e, DeadlineExceeded):
+        return 504, error_message
+    if "429" in error_message or "quota" in error_message.lower() or "rate limit" in error_message.lower():
+        return 429, "🚫 API Rate Limit Exceeded: You've reached the free tier limit for Gemini API. Please wait a few minutes before trying again."
+    if "401" in error_message or "unauthorized" in error_message.lower():
+        return 401, "🔑 API Key Error: Please check that your Gemini API key is valid and properly configured."
+    if "403" in error_message or "forbidden" in error_message.lower():
+        return 403, "🚫 API Access Denied: Your API key may not have permission to access the Gemini API."
+    return 500, f"🤖 AI Error: {error_message}"
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def install_risk_stream_api(app, llm, store=None):
+    """Add ``POST /analyze-risks/stream`` to a FastAPI app.
+
+    Takes the same body as ``/analyze-risks`` and answers with Server-Sent
+    Events: a ``category`` event per ``risk_categories`` entry as soon as the
+    model has finished it, then one ``analysis`` event with the full response
+    of ``/analyze-risks`` (or an ``error`` event with ``status`` and ``error``).
+    """
+    from fastapi import Body
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    async def events(text):
+        try:
+            plan = await prepare_analysis(text, llm, store)
+            if "analysis" in plan:
+                for category in plan["analysis"].get("risk_categories", []):
+                    yield _sse("category", category)
+                yield _sse("analysis", plan)
+                return
+
+            parser, chunks = CategoryStream(), []
+            with stage("llm_round_trip"):
+                async for chunk in llm.astream(plan["prompt"], schema=RISK_SCHEMA):
+                    chunks.append(chunk)
+                    for category in parser.feed(chunk):
+                        yield _sse("category", category)
+            with stage("risk_json_parse"):
+                analysis = parse_analysis("".join(chunks))
+            if store and "raw_analysis" not in analysis:
+                with stage("store_write"):
+                    await asyncio.to_thread(store.save_analysis, text, analysis)
+            yield _sse("analysis", {"analysis": analysis, "token_budget": plan["token_budget"],
+                                    "near_duplicate": plan["near_duplicate"]})
+        except Exception as e:
+            status_code, message = llm_error(e)
+            yield _sse("error", {"status": status_code, "error": message})
+
+    @app.post("/analyze-risks/stream")
+    async def analyze_risks_stream(text: str = Body(..., embed=True)):
+        if not llm.configured:
+            return JSONResponse(
+                {"error": "Gemini API key not configured. Please check your environment variables."},
+                status_code=500
+            )
+        return StreamingResponse(events(text), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    return app
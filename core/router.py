@@ -0,0 +1,204 @@
+"""Chat routing: lookup questions are answered from the document, the rest by the LLM.
+
+Many questions are simple lookups ("what is the governing law?", "when does
+this expire?"). ``route_question`` classifies a question against
+``INTENTS`` and, for a lookup, answers it locally, with no model call:
+
+- key terms (dates, amounts, durations, parties) come from
+  ``core.terms.extract_terms``, computed once per document and cached;
+- governing law and venue come from rules over the text.
+
+A local answer cites its source sentence (``start``/``end`` offsets into the
+document and the sentence itself). Open-ended questions (``why``,
+``explain``, ``risk`` ...), questions matching more than one lookup, and
+lookups the document does not answer go to the LLM as before. Every
+``/chat`` answer reports its ``route``: ``{"path": "local" | "context_cache"
+| "llm", "intent": ...}``. ``CHAT_ROUTER=off`` sends everything to the LLM.
+"""
+import functools
+import os
+import re
+
+from core import metrics
+from core.terms import KEY_TERMS, extract_terms
+
+CHAT_ROUTER = os.getenv("CHAT_ROUTER", "on").lower() != "off"
+# Documents whose extracted terms are kept for follow-up questions
+ROUTER_CACHE_DOCUMENTS = 16
+# Longer questions are rarely simple lookups
+MAX_LOOKUP_WORDS = 20
+# Characters searched on each side of a term for the edges of its sentence
+SENTENCE_CHARS = 400
+
+# Questions with these words need reasoning, not a lookup
+OPEN_ENDED = re.compile(
+    r"\b(?:why|explain|summar|risk|compare|should|analy[sz]|implication|fair|negotiat|recommend|advi[sc]e"
+    r"|what if|what happens|how does|pros\b|cons\b|mean(?:s|ing|t)?\b|difference|better|worse|favou?rable)"
+)
+
+_THE_CONTRACT = r"(?:it|this|the (?:agreement|contract|lease|license))"
+INTENTS = {
+    "parties": r"\bwho are the parties\b|\bwhich parties\b|\bparties to\b|\bwho (?:signed|is the \w+(?: party)?)\b",
+    "effective_date": rf"\b(?:effective|start|commencement) date\b|\bwhen (?:does|did|will) {_THE_CONTRACT} "
+                      r"(?:start|begin|commence|take effect|become effective)\b",
+    "expiration_date": rf"\bexpir|\b(?:end|expiry|termination) date\b|\bwhen (?:does|will) {_THE_CONTRACT} "
+                       r"(?:end|terminate|run out)\b",
+    "contract_value": r"\bcontract (?:value|price|amount|sum)\b|\btotal (?:fees?|price|value|cost|amount)\b"
+                      r"|\bhow much (?:is|does|will)\b|\bpurchase price\b|\bwhat does \w+ cost\b",
+    "liability_cap": r"\bliability cap\b|\bcap on liability\b|\blimit(?:ation)? (?:of|on) liability\b"
+                     r"|\bmaximum liability\b|\bliability (?:limit|capped)\b",
+    "notice_period": r"\bnotice period\b|\bhow much notice\b|\bhow many days'? (?:of )?notice\b|\bnotice (?:is )?required\b",
+    "renewal_term": r"\brenew",
+    "term": rf"\bhow long (?:is|does|will|do)\b|\b(?:initial|contract) term\b|\bduration\b|\blength of {_THE_CONTRACT}\b"
+            rf"|\bterm of {_THE_CONTRACT}\b",
+    "payment_terms": r"\bpayment terms?\b|\bwhen (?:is|are) (?:payments?|invoices?|fees?) due\b|\bdays to pay\b",
+    "governing_law": r"\bgoverning law\b|\bgoverned by\b|\bapplicable law\b|\bwhich (?:law|laws|state|country)\b",
+    "venue": r"\bvenue\b|\bwhich courts?\b|\bjurisdiction\b|\bwhere (?:are |would |will |can )?(?:disputes|claims)\b",
+}
+_INTENTS = {name: re.compile(pattern) for name, pattern in INTENTS.items()}
+# Matched by many specific questions too ("how long is the notice period?"); used only when alone
+GENERIC_INTENTS = {"term"}
+
+# Intent -> answer built from its key term (see core.terms.KEY_TERMS)
+STATEMENTS = {
+    "effective_date": "The agreement is effective from {text}.",
+    "expiration_date": "The agreement expires on {text}.",
+    "contract_value": "The contract value is {text}.",
+    "liability_cap": "Liability is capped at {text}.",
+    "term": "The term is {text}.",
+    "renewal_term": "The agreement renews for periods of {text}.",
+    "notice_period": "The notice period is {text}.",
+    "payment_terms": "Payment is due within {text}.",
+}
+
+# A capitalized name word; inner full stops ("U.S.A") are kept, one ending a sentence is not
+_PROPER = r"[A-Z](?:\w|\.(?!\s|$))*"
+_GOVERNING_LAW = re.compile(
+    r"\bgoverned by,?\s+(?:and\s+(?:construed|interpreted)\s+(?:in accordance with|under)\s+)?(?:the\s+)?laws?\s+of\s+"
+    r"(?P<law>(?:the\s+)?(?:(?:State|Commonwealth|Province|Republic)\s+of\s+)?" + _PROPER
+    + r"(?:\s+(?:and\s+)?" + _PROPER + r")*)",
+)
+_VENUE = re.compile(
+    r"\b(?:exclusive\s+|non-exclusive\s+)?(?:jurisdiction|venue)\b[^.;\n]{0,120}?\bcourts?\b[^.;\n]*"
+    r"|\bcourts?\b[^.;\n]{0,120}?\b(?:jurisdiction|venue)\b[^.;\n]*",
+    re.IGNORECASE,
+)
+_COURTS = re.compile(
+    r"\b(?:[Tt]he\s+)?(?:(?!(?:of|to|the|jurisdiction|venue)\b)[\w-]+\s+){0,4}courts?\s+(?:located\s+|sitting\s+)?"
+    r"(?:in|of|for)\s+(?:the\s+)?" + _PROPER + r"(?:,?\s+(?:of\s+|and\s+)?" + _PROPER + r")*"
+)
+_ROLE_QUESTION = re.compile(r"\bwho is the (\w+(?: party)?)\b")
+_SENTENCE_START = re.compile(r"(?:[.;!?]\s|\n)")
+_SENTENCE_END = re.compile(r"[.;!?](?=\s|$)|\n")
+
+
+def classify(question):
+    """The lookup intent of ``question``, or ``None`` for an open-ended or ambiguous one."""
+    question = question.lower()
+    if len(question.split()) > MAX_LOOKUP_WORDS or OPEN_ENDED.search(question):
+        return None
+    matches = {name for name, pattern in _INTENTS.items() if pattern.search(question)}
+    if len(matches) > 1:
+        matches -= GENERIC_INTENTS
+    return matches.pop() if len(matches) == 1 else None
+
+
+@functools.lru_cache(maxsize=ROUTER_CACHE_DOCUMENTS)
+def document_terms(text):
+    """``extract_terms(text)``, kept for the document's follow-up questions."""
+    return extract_terms(text)
+
+
+def _sentence(text, start, end):
+    """The sentence around ``text[start:end]``, as ``(start, end)``."""
+    base = max(0, start - SENTENCE_CHARS)
+    left = base
+    for found in _SENTENCE_START.finditer(text, base, start):
+        left = found.end()
+    found = _SENTENCE_END.search(text, end, min(len(text), end + SENTENCE_CHARS))
+    right = found.end() if found else min(len(text), end + SENTENCE_CHARS)
+    return left, right
+
+
+def _full_stop(statement):
+    # Names can end in an abbreviation ("Inc.")
+    return statement if statement.endswith(".") else statement + "."
+
+
+def _cite(text, start, end):
+    start, end = _sentence(text, start, end)
+    return {"start": start, "end": end, "text": text[start:end].strip()}
+
+
+def _parties(question, text):
+    parties = document_terms(text)["parties"]
+    if not parties:
+        return None
+    asked = _ROLE_QUESTION.search(question.lower())
+    if asked:
+        role = asked.group(1)
+        party = next((p for p in parties if (p["role"] or "").lower() == role), None)
+        if party is None:
+            return None
+        return _full_stop(f"The {party['role']} is {party['name']}"), _cite(text, party["start"], party["end"])
+    names = [f"{p['name']} ({p['role']})" if p["role"] else p["name"] for p in parties]
+    listed = names[0] if len(names) == 1 else ", ".join(names[:-1]) + " and " + names[-1]
+    return _full_stop(f"The parties are {listed}"), _cite(text, parties[0]["start"], parties[0]["end"])
+
+
+def _key_term(intent, text):
+    group, label = KEY_TERMS[intent]
+    term = next((t for t in document_terms(text)[group] if t["label"] == label), None)
+    if term is None:
+        return None
+    return STATEMENTS[intent].format(text=term["text"]), _cite(text, term["start"], term["end"])
+
+
+def _governing_law(text):
+    found = _GOVERNING_LAW.search(text)
+    if found is None:
+        return None
+    return _full_stop(f"The agreement is governed by the laws of {found['law']}"), _cite(text, found.start(), found.end())
+
+
+def _venue(text):
+    found = _VENUE.search(text)
+    if found is None:
+        return None
+    citation = _cite(text, found.start(), found.end())
+    courts = _COURTS.search(citation["text"])
+    if courts is None:
+        return "Disputes go to the courts named in the venue clause.", citation
+    # "the courts of ...": mid-sentence, a leading "The" is lower-cased
+    named = re.sub(r"^The\b", "the", courts.group().rstrip(","))
+    return _full_stop(f"Disputes are heard by {named}"), citation
+
+
+def answer_locally(intent, question, text):
+    """``(answer, citation)`` for a lookup ``intent``, or ``None`` if the document does not say."""
+    if intent == "parties":
+        return _parties(question, text)
+    if intent == "governing_law":
+        return _governing_law(text)
+    if intent == "venue":
+        return _venue(text)
+    return _key_term(intent, text)
+
+
+def route_question(text, question):
+    """``(route, answer, citation)``; ``answer`` is ``None`` when the question needs the LLM.
+
+    ``route`` is ``{"path", "intent"}``, with ``path`` ``"local"`` or ``"llm"``
+    (the caller may narrow ``"llm"`` to ``"context_cache"``).
+    """
+    intent = classify(question) if CHAT_ROUTER else None
+    found = answer_locally(intent, question, text) if intent else None
+    route = {"path": "local" if found else "llm", "intent": intent}
+    if found is None:
+        return route, None, None
+    answer, citation = found
+    return route, f"{answer}\n\nSource: \"{citation['text']}\"", citation
+
+
+def record_route(route):
+    metrics.CHAT_ROUTES.inc(path=route["path"], intent=route["intent"] or "open")
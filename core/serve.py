@@ -0,0 +1,124 @@
+"""Production server: several worker processes forked from one warm parent.
+
+``python -m core.serve`` runs a FastAPI app under Gunicorn with Uvicorn
+workers. The parent imports the app before forking (``preload_app``). So
+the PDF libraries, python-docx, NumPy, PIL, the Gemini SDK, the clause library and the
+app's own modules are loaded once and shared copy-on-write, instead of each
+worker importing them during its first request. No connection is opened
+before the fork: the Gemini client connects on its first call, in the
+worker, and SQLite connections are opened per call.
+
+The OCR tools (Tesseract, Poppler) are checked before anything else. With
+``OCR_REQUIRED`` on, a missing tool stops the start instead of failing the
+first scanned upload.
+
+On SIGTERM Gunicorn stops accepting connections and lets in-flight requests
+finish. Each worker then drains its extraction jobs (``JOB_DRAIN_SECONDS``)
+before exiting, so ``--graceful-timeout`` must leave room for both.
+
+Gunicorn does not run on Windows. There the server falls back to
+``uvicorn --workers``, which spawns workers and so cannot share the preload.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+from core import ocr
+from core.jobs import JOB_DRAIN_SECONDS
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1)))
+# Seconds a worker may go without reporting to the master before it is restarted
+WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "120"))
+# Draining requests and extraction jobs must fit in here
+WEB_GRACEFUL_TIMEOUT = int(os.getenv("WEB_GRACEFUL_TIMEOUT", str(int(JOB_DRAIN_SECONDS) + 30)))
+
+# Imported lazily elsewhere (first upload, first OCR); preloaded so workers start warm
+PRELOAD_MODULES = ("numpy", "PIL.Image", "PIL.ImageSequence", "PyPDF2", "docx", "google.generativeai",
+                   "core.extraction", "core.ocr")
+OPTIONAL_PRELOAD_MODULES = ("pypdfium2", "pytesseract", "pdf2image")
+
+
+def preload(app_path):
+    """Import the heavy modules and the app ``module:attribute``; returns the app."""
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    for name in OPTIONAL_PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    from core.clauses import get_library
+
+    get_library()
+    module, _, attribute = app_path.partition(":")
+    # Importing the app creates the LLM provider (configures the Gemini SDK without connecting)
+    return getattr(importlib.import_module(module), attribute or "app")
+
+
+def _worker_class():
+    try:
+        import uvicorn_worker  # noqa: F401
+
+        return "uvicorn_worker.UvicornWorker"
+    except ImportError:
+        # Older uvicorn releases ship the worker themselves
+        return "uvicorn.workers.UvicornWorker"
+
+
+def run_gunicorn(app, options):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the FastAPI app with several preloaded worker processes.")
+    parser.add_argument("--app", default="api.index:app", help="module:attribute of the FastAPI app")
+    parser.add_argument("--bind", default=f"0.0.0.0:{os.getenv('PORT', '8000')}")
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--timeout", type=int, default=WEB_TIMEOUT)
+    parser.add_argument("--graceful-timeout", type=int, default=WEB_GRACEFUL_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    missing = ocr.missing_tools()
+    if missing:
+        if ocr.OCR_REQUIRED:
+            sys.exit(f"OCR tools missing: {', '.join(missing)}. Install Tesseract and Poppler, "
+                     f"or set OCR_REQUIRED=off to serve without OCR.")
+        print(f"⚠️ OCR tools missing: {', '.join(missing)}; scanned documents cannot be read")
+    for name, version in ocr.tool_versions().items():
+        if version:
+            print(f"✓ {name}: {version}")
+
+    if sys.platform == "win32":
+        import uvicorn
+
+        print("⚠️ Gunicorn is not available on Windows; running uvicorn workers without preloading")
+        host, _, port = args.bind.rpartition(":")
+        uvicorn.run(args.app, host=host, port=int(port), workers=max(args.workers, 1),
+                    timeout_graceful_shutdown=args.graceful_timeout)
+        return
+
+    app = preload(args.app)
+    run_gunicorn(app, {
+        "bind": args.bind,
+        "workers": max(args.workers, 1),
+        "worker_class": _worker_class(),
+        "preload_app": True,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "accesslog": "-",
+    })
+
+
+if __name__ == "__main__":
+    main()
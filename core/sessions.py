@@ -0,0 +1,233 @@
+"""Server-side chat sessions with a bounded rolling history.
+
+``/chat`` returns a ``session_id``; sending it back with the next question
+continues the conversation. Every prompt carries the conversation so far in
+a bounded form:
+
+- the last ``CHAT_HISTORY_TURNS`` turns verbatim, each capped at
+  ``CHAT_TURN_MAX_TOKENS``;
+- everything older folded into one running summary of at most
+  ``CHAT_SUMMARY_TOKENS``.
+
+Folding runs after the answer has been sent (``fold``), one LLM call per
+fold, so the history part of a prompt stays roughly the same size however
+long the conversation runs. Sessions live in SQLite (``CHAT_SESSIONS_PATH``,
+``off`` to disable) so every worker process sees the same conversation; they
+are purged after ``CHAT_SESSION_TTL_HOURS`` without activity.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from core import db
+from core.deadlines import budget
+from core.store import document_id
+from core.timing import stage
+from core.tokens import CHARS_PER_TOKEN
+
+CHAT_SESSIONS_PATH = os.getenv(
+    "CHAT_SESSIONS_PATH", os.path.join(tempfile.gettempdir(), "contracts-ai-sessions.sqlite3")
+)
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "4"))
+CHAT_TURN_MAX_TOKENS = int(os.getenv("CHAT_TURN_MAX_TOKENS", "400"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "400"))
+CHAT_SESSION_TTL_HOURS = float(os.getenv("CHAT_SESSION_TTL_HOURS", "24"))
+
+# Purge idle sessions at most this often
+PURGE_INTERVAL = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_through INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL REFERENCES sessions (id),
+    position INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    PRIMARY KEY (session_id, position)
+);
+"""
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an assistant about a contract document. Update the summary with the new turns below.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Return only the updated summary, at most {words} words. Keep the facts, figures, clause references and conclusions the user may refer back to; drop pleasantries and repetition."""
+
+
+def _clip(text, max_tokens):
+    limit = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit].rstrip() + " [...]"
+
+
+def _format_turns(turns):
+    return "\n".join(
+        f"User: {_clip(t['question'], CHAT_TURN_MAX_TOKENS)}\nAssistant: {_clip(t['answer'], CHAT_TURN_MAX_TOKENS)}"
+        for t in turns
+    )
+
+
+def format_history(session):
+    """The conversation block for a prompt: summary plus recent turns, or ``""`` for a new session."""
+    if not session or not (session["summary"] or session["turns"]):
+        return ""
+    parts = ["Conversation so far:"]
+    if session["summary"]:
+        parts.append(f"Summary of earlier turns: {session['summary']}")
+    if session["turns"]:
+        # Turns not folded yet can briefly exceed CHAT_HISTORY_TURNS while a fold is running
+        parts.append(_format_turns(session["turns"][-CHAT_HISTORY_TURNS:]))
+    return "\n".join(parts) + "\n\n"
+
+
+class ChatSessions:
+    def __init__(self, path=CHAT_SESSIONS_PATH):
+        self.path = path
+        db.initialize(path, _SCHEMA)
+        self._last_purge = 0.0
+
+    def resume(self, session_id, text):
+        """The session ``session_id`` if it is about ``text``, else a new session for ``text``.
+
+        Returns ``None`` if the database fails; the question is then answered without history.
+        """
+        doc_id = document_id(text)
+        try:
+            if session_id:
+                session = self.get(session_id)
+                if session is not None and session["document_id"] == doc_id:
+                    return session
+            self.purge()
+            now = time.time()
+            session_id = uuid.uuid4().hex
+            with db.connect(self.path) as conn:
+                conn.execute(
+                    "INSERT INTO sessions (id, document_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (session_id, doc_id, now, now),
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: chat session unavailable: {e}")
+            return None
+        return {"id": session_id, "document_id": doc_id, "summary": "", "summarized_through": 0, "turns": []}
+
+    def get(self, session_id):
+        """The session with its summary and the turns not folded into it yet; ``None`` if unknown."""
+        with db.connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT id, document_id, summary, summarized_through FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            turns = conn.execute(
+                "SELECT position, question, answer FROM turns WHERE session_id = ? AND position > ? ORDER BY position",
+                (session_id, row["summarized_through"]),
+            ).fetchall()
+        session = dict(row)
+        session["turns"] = [dict(t) for t in turns]
+        return session
+
+    def add_turn(self, session_id, question, answer):
+        try:
+            with db.connect(self.path) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # Positions keep counting past folded (deleted) turns
+                conn.execute(
+                    "INSERT INTO turns (session_id, position, question, answer) "
+                    "SELECT ?, MAX(COALESCE((SELECT MAX(position) FROM turns WHERE session_id = ?), 0), "
+                    "summarized_through) + 1, ?, ? FROM sessions WHERE id = ?",
+                    (session_id, session_id, question, answer, session_id),
+                )
+                conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"Warning: could not record chat turn for session {session_id}: {e}")
+
+    def fold(self, session_id, llm):
+        """Fold turns beyond the last ``CHAT_HISTORY_TURNS`` into the running summary.
+
+        Safe to run concurrently: the update only applies if no other fold
+        has moved the summary on in the meantime. Failures keep the turns
+        unfolded; the next fold picks them up.
+        """
+        try:
+            session = self.get(session_id)
+        except sqlite3.Error as e:
+            print(f"Warning: could not summarize chat session {session_id}: {e}")
+            return
+        if session is None or len(session["turns"]) <= CHAT_HISTORY_TURNS:
+            return
+        old = session["turns"][:-CHAT_HISTORY_TURNS]
+        prompt = SUMMARY_PROMPT.format(
+            summary=session["summary"] or "(none yet)",
+            turns=_format_turns(old),
+            words=CHAT_SUMMARY_TOKENS * 3 // 4,
+        )
+        try:
+            # A background task: its own budget, not what is left of the request's
+            with budget("chat"), stage("chat_summary"):
+                summary = _clip(llm.generate(prompt).strip(), CHAT_SUMMARY_TOKENS)
+        except Exception as e:
+            print(f"Warning: could not summarize chat session {session_id}: {e}")
+            return
+        try:
+            with db.connect(self.path) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                updated = conn.execute(
+                    "UPDATE sessions SET summary = ?, summarized_through = ? WHERE id = ? AND summarized_through = ?",
+                    (summary, old[-1]["position"], session_id, session["summarized_through"]),
+                ).rowcount
+                if updated:
+                    # Folded turns live on in the summary only
+                    conn.execute("DELETE FROM turns WHERE session_id = ? AND position <= ?",
+                                 (session_id, old[-1]["position"]))
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"Warning: could not summarize chat session {session_id}: {e}")
+
+    def purge(self):
+        """Delete sessions idle for longer than ``CHAT_SESSION_TTL_HOURS`` (at most every ``PURGE_INTERVAL``)."""
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        cutoff = now - CHAT_SESSION_TTL_HOURS * 3600
+        with db.connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM turns WHERE session_id IN (SELECT id FROM sessions WHERE updated_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+            conn.execute("COMMIT")
+
+
+_sessions = None
+_sessions_disabled = CHAT_SESSIONS_PATH.lower() == "off"
+_sessions_lock = threading.Lock()
+
+
+def get_sessions():
+    """The process-wide sessions at ``CHAT_SESSIONS_PATH``, or ``None`` when disabled or unavailable."""
+    global _sessions, _sessions_disabled
+    if _sessions is None and not _sessions_disabled:
+        with _sessions_lock:
+            if _sessions is None and not _sessions_disabled:
+                try:
+                    _sessions = ChatSessions(CHAT_SESSIONS_PATH)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠️ Chat sessions disabled: {e}")
+                    _sessions_disabled = True
+    return _sessions
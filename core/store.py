@@ -0,0 +1,388 @@
+"""Persistent contract store with full-text search.
+
+Every extracted document is kept in SQLite under the SHA-256 of its
+normalized text (the ``document_id`` returned by ``/extract``), together
+with its clause breakdown (``core.tokens.split_sections``) and the latest
+``/analyze-risks`` result. Clauses are indexed with FTS5 so ``GET /search``
+can answer portfolio-wide keyword and risk-level queries without
+re-uploading anything.
+
+Clauses are stored as offsets into the document text and the FTS5 index
+reads them through a view, so the text is kept once.
+
+``CONTRACT_STORE_PATH=off`` disables the store (the default on Vercel, whose
+filesystem is read-only). Store failures are logged and never fail a request.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from core import db, dedup
+from core.metrics import record_cache
+from core.tokens import split_sections
+
+_DEFAULT_PATH = "off" if os.getenv("VERCEL") else os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "contracts.sqlite3"
+)
+CONTRACT_STORE_PATH = os.getenv("CONTRACT_STORE_PATH", _DEFAULT_PATH)
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 200
+SNIPPET_TOKENS = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    pages INTEGER,
+    chars INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clauses (
+    id INTEGER PRIMARY KEY,
+    document_id TEXT NOT NULL REFERENCES documents (id),
+    position INTEGER NOT NULL,
+    heading TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS clauses_document ON clauses (document_id, position);
+CREATE VIEW IF NOT EXISTS clause_text AS
+    SELECT c.id AS id, substr(d.text, c.start + 1, c.end - c.start) AS text
+    FROM clauses c JOIN documents d ON d.id = c.document_id;
+CREATE VIRTUAL TABLE IF NOT EXISTS clauses_fts USING fts5(
+    text, content = 'clause_text', content_rowid = 'id', tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    document_id TEXT PRIMARY KEY REFERENCES documents (id),
+    overall_risk_level TEXT,
+    analysis TEXT NOT NULL,
+    analyzed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_level ON analyses (overall_risk_level COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS risk_categories (
+    document_id TEXT NOT NULL REFERENCES documents (id),
+    category TEXT NOT NULL,
+    level TEXT
+);
+CREATE INDEX IF NOT EXISTS risk_categories_document ON risk_categories (document_id);
+CREATE TABLE IF NOT EXISTS minhashes (
+    document_id TEXT PRIMARY KEY REFERENCES documents (id),
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    document_id TEXT NOT NULL REFERENCES documents (id)
+);
+CREATE INDEX IF NOT EXISTS lsh_buckets_key ON lsh_buckets (band, bucket);
+"""
+
+_TERM = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def document_id(text):
+    """Stable ID of a normalized document: the SHA-256 of its text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def fts_query(query):
+    """Turn free text into an FTS5 query: every word or "quoted phrase" must match; ``word*`` is a prefix."""
+    terms = []
+    for phrase, word in _TERM.findall(query):
+        term = phrase or word
+        prefix = not phrase and term.endswith("*")
+        term = term.rstrip("*") if prefix else term
+        if term.strip():
+            terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def _clauses(text):
+    """``(position, heading, start, end)`` for each section of ``text``."""
+    result, cursor = [], 0
+    for position, section in enumerate(split_sections(text)):
+        start = text.find(section, cursor)
+        if start < 0:
+            continue
+        cursor = start + len(section)
+        heading = next((line.strip() for line in section.splitlines() if line.strip()), "")
+        result.append((position, heading[:200], start, cursor))
+    return result
+
+
+class ContractStore:
+    def __init__(self, path=CONTRACT_STORE_PATH):
+        self.path = path
+        db.initialize(path, _SCHEMA)
+
+    def _connect(self):
+        return db.connect(self.path)
+
+    def _insert_document(self, conn, doc_id, text, filename, pages):
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO documents (id, filename, pages, chars, text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (doc_id, filename, pages, len(text), text, time.time()),
+        )
+        if not cursor.rowcount:
+            if filename:
+                conn.execute("UPDATE documents SET filename = ? WHERE id = ? AND filename IS NULL", (filename, doc_id))
+            return
+        for position, heading, start, end in _clauses(text):
+            rowid = conn.execute(
+                "INSERT INTO clauses (document_id, position, heading, start, end) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, position, heading, start, end),
+            ).lastrowid
+            conn.execute("INSERT INTO clauses_fts (rowid, text) VALUES (?, ?)", (rowid, text[start:end]))
+
+    def _write(self, action, write):
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    write(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            return True
+        except sqlite3.Error as e:
+            print(f"⚠️ Contract store: could not {action}: {e}")
+            return False
+
+    def save_document(self, text, filename=None, pages=None):
+        """Store ``text`` and its clause breakdown. Returns the document ID (``None`` if the write failed)."""
+        doc_id = document_id(text)
+        ok = self._write("save document", lambda conn: self._insert_document(conn, doc_id, text, filename, pages))
+        return doc_id if ok else None
+
+    def save_analysis(self, text, analysis):
+        """Store the ``/analyze-risks`` result for ``text`` (storing the document too if it is new)."""
+        doc_id = document_id(text)
+        categories = analysis.get("risk_categories") or []
+        # Unparsed (raw) analyses are stored but never offered for reuse
+        sig = None if "raw_analysis" in analysis else dedup.signature(text)
+
+        def write(conn):
+            self._insert_document(conn, doc_id, text, None, None)
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (document_id, overall_risk_level, analysis, analyzed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (doc_id, analysis.get("overall_risk_level"), json.dumps(analysis), time.time()),
+            )
+            conn.execute("DELETE FROM risk_categories WHERE document_id = ?", (doc_id,))
+            conn.executemany(
+                "INSERT INTO risk_categories (document_id, category, level) VALUES (?, ?, ?)",
+                [(doc_id, c.get("category") or "", c.get("level")) for c in categories if isinstance(c, dict)],
+            )
+            conn.execute("DELETE FROM lsh_buckets WHERE document_id = ?", (doc_id,))
+            conn.execute("DELETE FROM minhashes WHERE document_id = ?", (doc_id,))
+            if sig is not None:
+                conn.execute("INSERT INTO minhashes (document_id, signature) VALUES (?, ?)", (doc_id, dedup.to_blob(sig)))
+                conn.executemany(
+                    "INSERT INTO lsh_buckets (band, bucket, document_id) VALUES (?, ?, ?)",
+                    [(band, bucket, doc_id) for band, bucket in dedup.band_keys(sig)],
+                )
+
+        return doc_id if self._write("save analysis", write) else None
+
+    def find_near_duplicate(self, text, threshold=None):
+        """The best analyzed match for ``text`` at or above ``threshold`` (default ``DEDUP_THRESHOLD``), or ``None``.
+
+        Returns a dict with the matched ``document_id``, its ``similarity``
+        (1.0 for the same text), ``analysis``, the ``changed_sections`` of
+        ``text`` with ``sections_total``, and the headings of the
+        ``removed_sections`` (see ``dedup.changed_sections``).
+        """
+        threshold = dedup.DEDUP_THRESHOLD if threshold is None else threshold
+        doc_id = document_id(text)
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM minhashes WHERE document_id = ?", (doc_id,)).fetchone():
+                best, score = doc_id, 1.0
+            else:
+                sig = dedup.signature(text)
+                keys = dedup.band_keys(sig)
+                candidates = conn.execute(
+                    "SELECT m.document_id, m.signature FROM minhashes m WHERE m.document_id IN ("
+                    "SELECT b.document_id FROM lsh_buckets b WHERE (b.band, b.bucket) IN (VALUES "
+                    + ", ".join(["(?, ?)"] * len(keys)) + "))",
+                    [value for key in keys for value in key],
+                ).fetchall()
+                scored = [(dedup.similarity(sig, dedup.from_blob(row["signature"])), row["document_id"])
+                          for row in candidates]
+                score, best = max(scored, default=(0.0, None))
+            match = None
+            if best is not None and score >= threshold:
+                row = conn.execute(
+                    "SELECT d.text, a.analysis FROM documents d JOIN analyses a ON a.document_id = d.id WHERE d.id = ?",
+                    (best,),
+                ).fetchone()
+                if row is not None:
+                    match = {"document_id": best, "similarity": score, "analysis": json.loads(row["analysis"]),
+                             "previous_text": row["text"]}
+        record_cache("near_duplicate", match is not None)
+        if match is None:
+            return None
+        previous_text = match.pop("previous_text")
+        if best == doc_id:
+            changed, removed, total = [], [], len(split_sections(text))
+        else:
+            changed, removed, total = dedup.changed_sections(text, previous_text)
+        match.update(changed_sections=changed, removed_sections=removed, sections_total=total)
+        return match
+
+    def get_document(self, doc_id):
+        """The stored document with its clause headings and latest analysis, or ``None``."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT d.*, a.analysis, a.analyzed_at FROM documents d "
+                "LEFT JOIN analyses a ON a.document_id = d.id WHERE d.id = ?",
+                (doc_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            clauses = conn.execute(
+                "SELECT position, heading, start, end FROM clauses WHERE document_id = ? ORDER BY position", (doc_id,)
+            ).fetchall()
+        return {
+            "document_id": row["id"],
+            "filename": row["filename"],
+            "pages": row["pages"],
+            "chars": row["chars"],
+            "created_at": row["created_at"],
+            "text": row["text"],
+            "clauses": [dict(c) for c in clauses],
+            "analysis": json.loads(row["analysis"]) if row["analysis"] else None,
+            "analyzed_at": row["analyzed_at"],
+        }
+
+    def search(self, query=None, risk_level=None, category=None, category_level=None, limit=SEARCH_LIMIT):
+        """Documents matching a keyword query and/or risk filters, best match first.
+
+        ``query`` is matched against clauses (see ``fts_query``); documents are
+        ranked by their best-matching clause, returned highlighted as ``best_match``.
+        ``risk_level`` filters on the overall level of the latest analysis;
+        ``category`` (substring) and ``category_level`` on its risk categories.
+        """
+        limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+        filters, params = [], []
+        if risk_level:
+            filters.append("a.overall_risk_level = ? COLLATE NOCASE")
+            params.append(risk_level)
+        if category or category_level:
+            sub = ["r.document_id = d.id"]
+            if category:
+                sub.append("r.category LIKE ?")
+                params.append(f"%{category}%")
+            if category_level:
+                sub.append("r.level = ? COLLATE NOCASE")
+                params.append(category_level)
+            filters.append(f"EXISTS (SELECT 1 FROM risk_categories r WHERE {' AND '.join(sub)})")
+
+        match = fts_query(query) if query else ""
+        with self._connect() as conn:
+            if match:
+                where = " AND ".join(["clauses_fts MATCH ?"] + filters)
+                # SQLite takes bare columns (c.position, c.heading, f.rowid) from the row that supplies MIN()
+                rows = conn.execute(
+                    "SELECT d.id, d.filename, d.pages, d.created_at, a.overall_risk_level, a.analyzed_at, "
+                    "MIN(f.rank) AS score, COUNT(*) AS clause_matches, f.rowid AS clause_id, c.position, c.heading "
+                    "FROM clauses_fts f JOIN clauses c ON c.id = f.rowid JOIN documents d ON d.id = c.document_id "
+                    f"LEFT JOIN analyses a ON a.document_id = d.id WHERE {where} "
+                    "GROUP BY d.id ORDER BY score LIMIT ?",
+                    [match] + params + [limit],
+                ).fetchall()
+                snippets = {row["id"]: self._snippet(conn, match, row["clause_id"]) for row in rows}
+            else:
+                where = " AND ".join(filters) or "1"
+                rows = conn.execute(
+                    "SELECT d.id, d.filename, d.pages, d.created_at, a.overall_risk_level, a.analyzed_at "
+                    f"FROM documents d LEFT JOIN analyses a ON a.document_id = d.id WHERE {where} "
+                    "ORDER BY COALESCE(a.analyzed_at, d.created_at) DESC LIMIT ?",
+                    params + [limit],
+                ).fetchall()
+                snippets = {}
+
+        results = []
+        for row in rows:
+            result = {
+                "document_id": row["id"],
+                "filename": row["filename"],
+                "pages": row["pages"],
+                "created_at": row["created_at"],
+                "overall_risk_level": row["overall_risk_level"],
+                "analyzed_at": row["analyzed_at"],
+            }
+            if match:
+                # FTS5 ranks are negated BM25 scores; report them as "higher is better"
+                result["score"] = round(-row["score"], 4)
+                result["clause_matches"] = row["clause_matches"]
+                result["best_match"] = {
+                    "position": row["position"], "heading": row["heading"], "snippet": snippets[row["id"]],
+                }
+            results.append(result)
+        return results
+
+    def _snippet(self, conn, match, clause_id):
+        # Looked up by rowid one at a time: FTS5 filters "rowid IN (...)" by scanning every match
+        row = conn.execute(
+            f"SELECT snippet(clauses_fts, 0, '[', ']', '...', {SNIPPET_TOKENS}) FROM clauses_fts "
+            "WHERE clauses_fts MATCH ? AND rowid = ?",
+            (match, clause_id),
+        ).fetchone()
+        return row[0] if row else ""
+
+
+_store = None
+_store_disabled = CONTRACT_STORE_PATH.lower() == "off"
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store at ``CONTRACT_STORE_PATH``, or ``None`` when disabled or unavailable."""
+    global _store, _store_disabled
+    if _store is None and not _store_disabled:
+        with _store_lock:
+            if _store is None and not _store_disabled:
+                try:
+                    _store = ContractStore(CONTRACT_STORE_PATH)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠️ Contract store disabled: {e}")
+                    _store_disabled = True
+    return _store
+
+
+def install_store_api(app, store):
+    """Add ``GET /search`` and ``GET /documents/{document_id}`` to a FastAPI app (no-op without a store)."""
+    if store is None:
+        return app
+    from fastapi.responses import JSONResponse
+
+    @app.get("/search")
+    async def search(q: str = "", risk_level: str = "", category: str = "", category_level: str = "",
+                     limit: int = SEARCH_LIMIT):
+        start = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(store.search, q, risk_level, category, category_level, limit)
+        except sqlite3.OperationalError as e:
+            return JSONResponse({"error": f"Invalid search query: {str(e)}"}, status_code=400)
+        return {
+            "query": q,
+            "results": results,
+            "took_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    @app.get("/documents/{doc_id}")
+    async def stored_document(doc_id: str):
+        document = await asyncio.to_thread(store.get_document, doc_id)
+        if document is None:
+            return JSONResponse({"error": "Unknown document ID."}, status_code=404)
+        return document
+
+    return app
@@ -0,0 +1,209 @@
+"""Typed, compact columns for tables parsed out of extracted text.
+
+Splitting lines into columns gives all-string columns. They sort
+lexicographically ("10" before "9"), compare slowly and take several times
+the memory of native types. ``infer_types`` converts each column in turn,
+with vectorized pandas string operations over the whole column, to the
+first type that every non-empty value parses as:
+
+1. ``integer`` / ``number`` / ``percent``: plain numbers. Thousands
+   separators are accepted, and so are decimal commas when the whole column
+   uses them. Negatives may be written ``-5`` or ``(5)``. Integers are
+   parsed exactly; a column with integers beyond the int64 range stays text.
+2. ``currency``: amounts with one currency (``$1,200.00``, ``EUR 75``).
+   They become exact decimals (``decimal128`` via pyarrow), or ``float64``
+   without pyarrow.
+3. ``date``: one of ``DATE_FORMATS``, the same one for the whole column.
+4. ``category``: text with few distinct values (``CATEGORY_MAX_SHARE``).
+5. ``text``: anything else, left as it was.
+
+Each distinct value is parsed once, and a sample of them is tried first so
+text columns are rejected quickly. Cells such as ``-``, ``n/a`` or empty
+are missing values. Any other value that does not parse keeps the column
+as text, so nothing is silently dropped. The schema report lists each
+column's type and how it was read.
+"""
+import importlib.util
+import re
+
+import numpy as np
+import pandas as pd
+
+NULL_TOKENS = {"", "-", "--", "–", "—", "n/a", "na", "nan", "null", "none", "nil"}
+
+# Text columns become categorical when distinct values are at most this share of the values...
+CATEGORY_MAX_SHARE = 0.5
+# ...and there are at least this many values
+CATEGORY_MIN_ROWS = 20
+
+# Tried in order; the first that parses the whole column wins (US month/day before day/month)
+DATE_FORMATS = (
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d",
+    "%m/%d/%Y", "%d/%m/%Y", "%m/%d/%y", "%d/%m/%y", "%d.%m.%Y", "%d-%m-%Y",
+    "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y", "%b. %d, %Y",
+)
+# Parsers are first tried on this many distinct values, then confirmed on all of them
+SAMPLE = 200
+
+CURRENCY_CODES = ("USD", "EUR", "GBP", "JPY", "CHF", "CAD", "AUD", "CNY", "INR")
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY"}
+_CURRENCY = "|".join([re.escape(symbol) for symbol in CURRENCY_SYMBOLS] + list(CURRENCY_CODES))
+_NUMBER = re.compile(
+    r"^(?P<open>\()?\s*(?P<sign>[-+−])?\s*(?P<pre>" + _CURRENCY + r")?\s*(?P<sign2>[-+−])?\s*"
+    r"(?P<body>\d[\d,.' ]*?)\s*(?P<post>" + _CURRENCY + r")?\s*(?P<pct>%)?\s*(?P<close>\))?$",
+    re.IGNORECASE,
+)
+# Digits with optional thousands separators and decimals, in each convention
+_POINT_DECIMAL = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+_COMMA_DECIMAL = r"\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+(?:,\d+)?"
+# Most numeric columns: no separators, signs in front, no symbols
+_PLAIN_NUMBER = r"-?(?:[1-9]\d*|0)(?:\.\d+)?"
+
+
+def _decimal_dtype(scale):
+    if importlib.util.find_spec("pyarrow") is None or not hasattr(pd, "ArrowDtype"):
+        return None
+    import pyarrow as pa
+
+    return pd.ArrowDtype(pa.decimal128(38, scale))
+
+
+def _numbers(present):
+    """``(values, info)`` if every value in ``present`` is a number or amount, else ``None``.
+
+    ``values`` are normalized strings (``-1234.50``) aligned with ``present``.
+    """
+    if present.str.fullmatch(_PLAIN_NUMBER).all():
+        decimals = present.str.partition(".")[2].str.len()
+        scale = int(decimals.max())
+        return present, {"scale": scale, "kind": "integer" if scale == 0 else "number"}
+    parts = present.str.extract(_NUMBER)
+    if parts["body"].isna().any():
+        return None
+    body = parts["body"].str.replace(r"[' ]", "", regex=True)
+    if body.str.match(r"0\d").any():
+        # Leading zeros are codes (account numbers, IDs), not quantities
+        return None
+    if body.str.fullmatch(_POINT_DECIMAL).all():
+        plain = body.str.replace(",", "", regex=False)
+    elif body.str.fullmatch(_COMMA_DECIMAL).all():
+        plain = body.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    else:
+        return None
+    negative = parts["open"].notna() | parts["sign"].isin(["-", "−"]) | parts["sign2"].isin(["-", "−"])
+    values = plain.where(~negative, "-" + plain)
+
+    currency = pd.concat([parts["pre"], parts["post"]]).dropna().str.strip().str.upper()
+    currencies = set(currency.map(lambda c: CURRENCY_SYMBOLS.get(c, c)))
+    if len(currencies) > 1:
+        # Amounts in different currencies are not one numeric column
+        return None
+    decimals = plain.str.partition(".")[2].str.len()
+    info = {"scale": int(decimals.max()) if len(decimals) else 0}
+    if currencies:
+        info["kind"], info["currency"] = "currency", currencies.pop()
+    elif parts["pct"].notna().any():
+        info["kind"] = "percent"
+    elif info["scale"] == 0:
+        info["kind"] = "integer"
+    else:
+        info["kind"] = "number"
+    return values, info
+
+
+def _to_number_column(values, info, index, missing):
+    """The typed column, or ``None`` when the numbers cannot be held exactly (keep it as text)."""
+    kind = info["kind"]
+    if kind == "currency":
+        dtype = _decimal_dtype(info["scale"])
+        if dtype is not None:
+            column = pd.Series(pd.NA, index=index, dtype="string")
+            column[values.index] = values
+            return column.astype(dtype)
+    if kind == "integer":
+        # Parsed straight to integers: through float64, values above 2**53 would change
+        integers = pd.to_numeric(values)
+        if integers.dtype.kind != "i":
+            # Beyond int64 (IDs rather than quantities)
+            return None
+        if missing.any():
+            column = pd.Series(pd.NA, index=index, dtype="Int64")
+            column[values.index] = integers
+            return column
+        return pd.to_numeric(integers.astype(np.int64), downcast="integer")
+    numbers = pd.Series(np.nan, index=index)
+    numbers[values.index] = pd.to_numeric(values)
+    return numbers
+
+
+def _date_format(present):
+    if not present.str.contains(r"[-/.,\s]|[A-Za-z]", regex=True).all():
+        return None
+    sample = present.iloc[:SAMPLE]
+    for fmt in DATE_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors="coerce").notna().all():
+            if pd.to_datetime(present, format=fmt, errors="coerce").notna().all():
+                return fmt
+    return None
+
+
+def _infer_column(column):
+    """``(typed column, schema entry)`` for one string column."""
+    text = column.astype("string").str.strip()
+    missing = text.isna() | text.str.lower().isin(NULL_TOKENS)
+    present = text[~missing]
+    entry = {"missing": int(missing.sum())}
+    if present.empty:
+        return column, dict(entry, kind="empty")
+    # Extracted tables repeat values a lot; parse each distinct one once and spread the result
+    codes, uniques = pd.factorize(present)
+    distinct = pd.Series(uniques, dtype="string")
+
+    def spread(parsed):
+        return pd.Series(parsed.to_numpy().take(codes), index=present.index, dtype=parsed.dtype)
+
+    parsed = (len(distinct) <= SAMPLE or _numbers(distinct.iloc[:SAMPLE])) and _numbers(distinct)
+    if parsed:
+        values, info = parsed
+        typed = _to_number_column(spread(values), info, column.index, missing)
+        if typed is not None:
+            return typed, dict(entry, **info)
+
+    fmt = _date_format(distinct)
+    if fmt is not None:
+        typed = pd.Series(pd.NaT, index=column.index, dtype="datetime64[ns]")
+        typed[present.index] = spread(pd.to_datetime(distinct, format=fmt))
+        return typed, dict(entry, kind="date", format=fmt)
+
+    distinct = len(uniques)
+    if len(present) >= CATEGORY_MIN_ROWS and distinct <= CATEGORY_MAX_SHARE * len(present):
+        return text.where(~missing).astype("category"), dict(entry, kind="category", categories=int(distinct))
+    return column, dict(entry, kind="text")
+
+
+def infer_types(df):
+    """``(typed DataFrame, schema)``: ``df`` with every column converted as described above.
+
+    ``schema`` has one entry per column: ``column``, ``dtype``, ``kind``,
+    ``missing`` and, depending on the kind, ``scale``, ``currency``,
+    ``format`` or ``categories``.
+    """
+    columns, schema = [], []
+    for position in range(df.shape[1]):
+        # By position: extracted headers can repeat a name
+        typed, entry = _infer_column(df.iloc[:, position])
+        columns.append(typed.rename(position))
+        schema.append(dict(column=str(df.columns[position]), dtype=str(typed.dtype), **entry))
+    typed_df = pd.concat(columns, axis=1) if columns else df.copy()
+    typed_df.columns = df.columns
+    return typed_df, schema
+
+
+def describe_schema(schema):
+    """One line per column, e.g. ``Amount: currency (USD, decimal128(38, 2)[pyarrow])``."""
+    lines = []
+    for entry in schema:
+        detail = entry.get("currency") or entry.get("format")
+        details = ", ".join(str(d) for d in (detail, entry["dtype"]) if d)
+        lines.append(f"{entry['column']}: {entry['kind']} ({details})")
+    return lines
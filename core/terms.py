@@ -0,0 +1,273 @@
+"""Local extraction of key contract terms: parties, dates, amounts, durations, percentages.
+
+Basic facts (the effective date, the contract value, the notice period)
+should not need an LLM round trip. ``extract_terms`` finds them with one
+pass of a single compiled regex over the extracted text (one alternative per
+kind of term, like ``core.normalize``) and normalizes each match:
+
+- ``parties``: company names with a legal suffix (``Acme Corp.``), and
+  people or companies introduced with a party role (``John Smith
+  ("Consultant")``), with that role when given;
+- ``dates``: ISO, numeric (``01/15/2024``: month first unless the first
+  number is over 12; day first with dots) and written (``January 15,
+  2024``, ``15th day of January, 2024``) dates, as ``YYYY-MM-DD``;
+- ``amounts``: money with its currency (``$1,200,000.00``, ``EUR 75k``,
+  ``5 million dollars``), as a number and an ISO currency code;
+- ``durations``: ``thirty (30) days``, ``12 months``, ``one-year``, as a
+  count, a unit and an ISO 8601 duration (``P30D``);
+- ``percentages``: ``5%``, ``five percent (5%)``.
+
+Every term carries ``text``, ``start`` and ``end`` (character offsets into
+the text) and, for dates, amounts, durations and percentages, a ``label``
+taken from the nearest keyword in the same sentence (``effective_date``,
+``notice_period``, ``liability_cap``, ...; ``None`` when nothing fits).
+``key_terms`` picks the first term of each label that dashboards ask for.
+"""
+import datetime
+import re
+
+from core.tables import CURRENCY_CODES, CURRENCY_SYMBOLS
+
+# Characters of the same sentence, on each side of a term, searched for label keywords
+CONTEXT_CHARS = 120
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+    "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+SCALES = {"thousand": 1e3, "k": 1e3, "million": 1e6, "m": 1e6, "mm": 1e6, "billion": 1e9, "bn": 1e9}
+CURRENCY_WORDS = {"dollar": "USD", "euro": "EUR", "pound": "GBP", "yen": "JPY"}
+
+# Roles that make a name in front of ``("Role")`` a party, not some other defined term
+PARTY_ROLES = {
+    "client", "customer", "provider", "service provider", "vendor", "supplier", "contractor",
+    "consultant", "company", "licensor", "licensee", "buyer", "seller", "purchaser", "landlord",
+    "tenant", "lessor", "lessee", "employer", "employee", "distributor", "reseller", "partner",
+    "agency", "disclosing party", "receiving party", "discloser", "recipient", "owner", "developer",
+}
+
+# Checked against the sentence around a term; the label with the nearest keyword wins
+LABELS = {
+    "dates": {
+        "effective_date": r"\beffective\b|\bcommenc|\bas of\b|\bentered into\b|\bstart date\b",
+        "expiration_date": r"\bexpir|\bterminat|\buntil\b|\bthrough\b|\bend date\b|\bends?\b",
+        "signature_date": r"\bsigned\b|\bexecuted\b|\bdated\b|\bsignature",
+    },
+    "amounts": {
+        "contract_value": r"\btotal\b|\bcontract (?:price|value|sum)\b|\bfees?\b|\bconsideration\b"
+                          r"|\bcompensation\b|\bpurchase price\b|\bpay\b|\bsum of\b",
+        "liability_cap": r"\bliabilit|\bcap(?:ped)?\b|\bexceed\b",
+    },
+    "durations": {
+        "notice_period": r"\bnotice\b",
+        "renewal_term": r"\brenew",
+        "payment_terms": r"\bpay|\binvoice",
+        "cure_period": r"\bcur(?:e|ed|ing)\b|\bremed",
+        "term": r"\bterm\b|\bperiod of\b|\bduration\b",
+    },
+    "percentages": {
+        "interest_rate": r"\binterest\b|\blate\b|\boverdue\b",
+        "discount": r"\bdiscount",
+        "price_increase": r"\bincrease|\bescalat|\badjust",
+    },
+}
+_LABELS = {kind: re.compile("|".join(f"(?P<{label}>{pattern})" for label, pattern in labels.items()))
+           for kind, labels in LABELS.items()}
+
+# Key term -> (kind, label)
+KEY_TERMS = {
+    "effective_date": ("dates", "effective_date"),
+    "expiration_date": ("dates", "expiration_date"),
+    "contract_value": ("amounts", "contract_value"),
+    "liability_cap": ("amounts", "liability_cap"),
+    "term": ("durations", "term"),
+    "renewal_term": ("durations", "renewal_term"),
+    "notice_period": ("durations", "notice_period"),
+    "payment_terms": ("durations", "payment_terms"),
+}
+
+_ISO_UNITS = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+
+_NUMBER_WORD = r"(?:" + "|".join(sorted(list(NUMBER_WORDS) + ["hundred", "thousand"], key=len, reverse=True)) + r")"
+_WORDS = rf"(?i:\b{_NUMBER_WORD}(?:[\s-]+(?:and[\s-]+)?{_NUMBER_WORD})*\b)"
+_MONTH = (r"(?i:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b\.?")
+_ORDINAL = r"(?:st|nd|rd|th)?"
+_CURRENCY = r"US\$|[" + "".join(re.escape(s) for s in CURRENCY_SYMBOLS) + r"]|\b(?:" + "|".join(CURRENCY_CODES) + r")\b"
+_CURRENCY_AFTER = r"\b(?:" + "|".join(CURRENCY_CODES) + r")\b|(?i:dollars?|euros?|pounds?(?: sterling)?|yen)\b"
+_AMOUNT = r"\d{1,3}(?:[,.']\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?"
+_SCALE = r"(?i:thousand|million|billion|mm|bn|[mk])\b"
+_SUFFIX = (r"(?:Inc|Incorporated|LLC|L\.L\.C|Ltd|Limited|Corp|Corporation|Company|Co|LLP|LP|PLC|plc|GmbH|AG"
+           r"|S\.A|SA|N\.V|NV|B\.V|BV|SARL|SAS|Pty(?:[ \t]+Ltd)?)")
+_STOP = r"(?:This|THIS|The|THE|Agreement|AGREEMENT|Between|BETWEEN|And|AND|By|BY|Whereas|WHEREAS)"
+_NAME_WORD = rf"(?!{_STOP}\b|{_SUFFIX}\b)[A-Z][\w&'’.-]*"
+
+
+def _role(group):
+    # Optional descriptor (", a Delaware corporation,") then ("Role") or (the "Role")
+    return (r"(?:,?\s+an?\s+[^()\"“”\n]{1,80}?)?[\s,]*\(\s*(?:the\s+|hereinafter\s+(?:referred\s+to\s+as\s+)?)?"
+            rf"[\"“](?P<{group}>[^\"”\n]{{1,40}})[\"”]\s*\)")
+
+
+_TERMS = re.compile(
+    # Every term starts a word (or is a currency symbol or "(30)"); checked once per position, not per alternative
+    r"(?<!\w)(?=[\w$€£¥(])(?:"
+    rf"(?P<org>(?P<org_name>{_NAME_WORD}(?:[ \t]+(?:&[ \t]+|of[ \t]+)?{_NAME_WORD}){{0,5}},?[ \t]+{_SUFFIX}\b\.?)"
+    rf"(?:{_role('org_role')})?)"
+    rf"|(?P<person>(?P<person_name>[A-Z][a-z]+(?:[ \t]+[A-Z][a-z.]*){{1,3}}){_role('person_role')})"
+    r"|(?P<iso>\b(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})\b)"
+    r"|(?P<numeric>\b(?P<num_a>\d{1,2})(?P<num_sep>[/.])(?P<num_b>\d{1,2})(?P=num_sep)(?P<num_y>\d{4}|\d{2})\b)"
+    rf"|(?P<mdy>\b(?P<mdy_m>{_MONTH})\s+(?P<mdy_d>\d{{1,2}}){_ORDINAL},?\s+(?P<mdy_y>\d{{4}})\b)"
+    rf"|(?P<dmy>\b(?P<dmy_d>\d{{1,2}}){_ORDINAL}(?i:\s+day\s+of)?\s+(?P<dmy_m>{_MONTH}),?\s+(?P<dmy_y>\d{{4}})\b)"
+    rf"|(?P<money_pre>(?P<cur_pre>{_CURRENCY})\s?(?P<amt_pre>{_AMOUNT})(?:\s*(?P<scale_pre>{_SCALE}))?)"
+    rf"|(?P<money_post>\b(?P<amt_post>{_AMOUNT})(?:\s*(?P<scale_post>{_SCALE}))?\s*(?P<cur_post>{_CURRENCY_AFTER}))"
+    rf"|(?P<percent>(?P<pct_words>{_WORDS})\s+(?i:per\s*cent)\b(?:\s*\(\s*(?P<pct_digits>\d+(?:\.\d+)?)\s*%\s*\))?"
+    r"|\b(?P<pct_num>\d+(?:\.\d+)?)\s*(?:%|(?i:per\s*cent)\b))"
+    rf"|(?P<duration>(?:(?P<dur_words>{_WORDS})\s*(?:\(\s*(?P<dur_digits>\d+)\s*\))?|\(?\b(?P<dur_num>\d+)\)?)"
+    r"[\s-]*(?P<dur_kind>(?i:business|calendar|working)\s+)?(?P<dur_unit>(?i:day|week|month|year))s?\b))"
+)
+_MONTHS = {name: number for number, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+_SENTENCE_END = re.compile(r"[.;]\s|\n\s*\n")
+
+
+def word_number(words):
+    """``"one hundred twenty"`` -> ``120``."""
+    total, current = 0, 0
+    for word in re.split(r"[\s-]+", words.lower()):
+        if word in NUMBER_WORDS:
+            current += NUMBER_WORDS[word]
+        elif word == "hundred":
+            current = max(current, 1) * 100
+        elif word == "thousand":
+            total += max(current, 1) * 1000
+            current = 0
+    return total + current
+
+
+def _amount(body, scale):
+    body = body.replace("'", "")
+    last = max(body.rfind(","), body.rfind("."))
+    if last >= 0 and len(body) - last - 1 <= 2:
+        # Decimals (1-2 digits after the last separator); the other separators group thousands
+        value = float(re.sub(r"[,.]", "", body[:last]) + "." + body[last + 1:])
+    else:
+        value = float(re.sub(r"[,.]", "", body))
+    if scale:
+        value *= SCALES[scale.lower()]
+    return round(value, 2)
+
+
+def _currency(symbol):
+    symbol = symbol.strip()
+    if symbol == "US$":
+        return "USD"
+    if symbol in CURRENCY_SYMBOLS:
+        return CURRENCY_SYMBOLS[symbol]
+    word = symbol.lower().split()[0].rstrip("s")
+    return CURRENCY_WORDS.get(word, symbol.upper())
+
+
+def _date(match):
+    kind = match.lastgroup
+    if kind == "iso":
+        year, month, day = int(match["iso_y"]), int(match["iso_m"]), int(match["iso_d"])
+    elif kind == "numeric":
+        first, second = int(match["num_a"]), int(match["num_b"])
+        # Dotted dates are day first; slashed ones month first unless that cannot be
+        day_first = match["num_sep"] == "." or first > 12
+        day, month = (first, second) if day_first else (second, first)
+        year = int(match["num_y"])
+        if year < 100:
+            year += 2000 if year < 70 else 1900
+    else:
+        prefix = "mdy" if kind == "mdy" else "dmy"
+        year, day = int(match[f"{prefix}_y"]), int(match[f"{prefix}_d"])
+        month = _MONTHS[match[f"{prefix}_m"][:3].lower()]
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _label(text, start, end, kind):
+    """The label of ``kind`` whose keyword is nearest the term, within its sentence."""
+    before = _SENTENCE_END.split(text[max(0, start - CONTEXT_CHARS):start])[-1].lower()
+    after = _SENTENCE_END.split(text[end:end + CONTEXT_CHARS])[0].lower()
+    best, nearest = None, CONTEXT_CHARS + 1
+    found = None
+    for found in _LABELS[kind].finditer(before):
+        pass
+    if found is not None:
+        best, nearest = found.lastgroup, len(before) - found.end()
+    found = _LABELS[kind].search(after)
+    if found is not None and found.start() < nearest:
+        best = found.lastgroup
+    return best
+
+
+def extract_terms(text):
+    """Key terms found in ``text``: ``{"parties", "dates", "amounts", "durations", "percentages", "key_terms"}``."""
+    terms = {"parties": [], "dates": [], "amounts": [], "durations": [], "percentages": []}
+    parties = {}
+    for match in _TERMS.finditer(text):
+        kind = match.lastgroup
+        start, end = match.span()
+        term = {"text": match.group(), "start": start, "end": end}
+        if kind in ("org", "person"):
+            role = match[f"{kind}_role"]
+            if kind == "person" and (role or "").strip().lower() not in PARTY_ROLES:
+                # A defined term ("Agreement", "Services"), not a party
+                continue
+            name = match[f"{kind}_name"].strip().rstrip(",")
+            key = name.lower().rstrip(".")
+            if key in parties:
+                # Same party again; keep the first mention, learn its role if it was missing
+                if role and not parties[key]["role"]:
+                    parties[key]["role"] = role.strip()
+                continue
+            parties[key] = dict(term, name=name, role=role.strip() if role else None)
+            terms["parties"].append(parties[key])
+            continue
+        if kind in ("iso", "numeric", "mdy", "dmy"):
+            value = _date(match)
+            if value is None:
+                continue
+            group, term["value"] = "dates", value
+        elif kind in ("money_pre", "money_post"):
+            side = "pre" if kind == "money_pre" else "post"
+            group = "amounts"
+            term["value"] = _amount(match[f"amt_{side}"], match[f"scale_{side}"])
+            term["currency"] = _currency(match[f"cur_{side}"])
+        elif kind == "percent":
+            digits = match["pct_digits"] or match["pct_num"]
+            group, term["value"] = "percentages", float(digits) if digits else float(word_number(match["pct_words"]))
+        else:
+            digits = match["dur_digits"] or match["dur_num"]
+            count = int(digits) if digits else word_number(match["dur_words"])
+            unit = match["dur_unit"].lower()
+            group = "durations"
+            term.update(value=count, unit=unit, iso=f"P{count}{_ISO_UNITS[unit]}",
+                        business=bool(match["dur_kind"]) and match["dur_kind"].strip().lower() != "calendar")
+        term["label"] = _label(text, start, end, group)
+        terms[group].append(term)
+    terms["key_terms"] = key_terms(terms)
+    return terms
+
+
+def key_terms(terms):
+    """The first term of each ``KEY_TERMS`` label (``None`` if absent), plus the party names."""
+    summary = {"parties": [party["name"] for party in terms["parties"]]}
+    for name, (group, label) in KEY_TERMS.items():
+        term = next((term for term in terms[group] if term["label"] == label), None)
+        if term is None:
+            summary[name] = None
+        elif group == "amounts":
+            summary[name] = {"value": term["value"], "currency": term["currency"]}
+        elif group == "durations":
+            summary[name] = {"value": term["value"], "unit": term["unit"], "iso": term["iso"]}
+        else:
+            summary[name] = term["value"]
+    return summary
@@ -0,0 +1,32 @@
+"""Per-stage wall-clock timing for the processing pipeline."""
+import time
+from contextlib import contextmanager
+
+from core import metrics, profiling
+
+
+@contextmanager
+def stage(name, timings=None):
+    """Time the block as processing stage ``name``.
+
+    Every run is observed in the ``contracts_stage_duration_seconds`` histogram.
+    When ``timings`` (a plain dict owned by the caller) is given, the elapsed
+    seconds are also added to ``timings[name]``. In a profiled request
+    (``core.profiling``) the run is added to the profile, and the thread is
+    sampled while the block runs.
+    """
+    profile = profiling.current()
+    ident = profile.enter() if profile else None
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe_stage(name, elapsed, failed=failed)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+        if profile:
+            profile.leave(ident)
+            profile.add_stage(name, start, elapsed, failed)
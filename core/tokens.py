@@ -0,0 +1,186 @@
+"""Token budgeting: estimate prompt size and fit documents into a budget.
+
+Every LLM call builds its prompt through ``fit_prompt``. When the document
+does not fit the endpoint's budget it is split into sections, the sections
+are ranked (by relevance to the question for chat, by risk-bearing terms for
+risk analysis) and the best ones are kept in their original order, with a
+marker wherever text was left out. The returned usage dict is surfaced in the
+response metadata.
+
+Token counts are estimated locally by default. ``TOKEN_COUNTER=provider``
+asks the LLM provider to count the final prompt instead (one extra round trip).
+When the provider's count is over the budget, the document is fitted again to
+a proportionally smaller budget and recounted, up to ``MAX_REFITS`` times.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+# Rough characters-per-token ratio for English prose
+CHARS_PER_TOKEN = 4
+
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "32000"))
+RISK_TOKEN_BUDGET = int(os.getenv("RISK_TOKEN_BUDGET", "64000"))
+TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "local").lower()
+
+OMISSION_MARKER = "[... {n} section(s) omitted to fit the token budget ...]"
+# Provider recounts after the first fit, when the estimate undercounted
+MAX_REFITS = 3
+# Refits aim this far under the budget, so the next count lands inside it
+REFIT_MARGIN = 0.97
+# Sections longer than this are split further so a single giant block
+# (e.g. OCR output without headings) can still be partially included.
+MAX_SECTION_CHARS = 6000
+
+_HEADING = re.compile(
+    r"^\s*(?:"
+    r"(?i:article|section|clause|schedule|exhibit|annex|appendix)\s+[\dIVXLC]+\b"  # ARTICLE 4, Section 12
+    r"|\d{1,3}\.(?:\d{1,3}\.?)*\s+\S"                                             # 7. / 7.2 / 7.2.1
+    r"|[A-Z][A-Z0-9 ,&/'()-]{3,80}$"                                                # ALL CAPS TITLE
+    r")"
+)
+_WORD = re.compile(r"[a-z][a-z0-9'-]+")
+
+RISK_TERMS = {
+    "liabilit": 3, "indemn": 3, "terminat": 3, "penalt": 3, "uncapped": 3, "unlimited": 3,
+    "payment": 2, "fee": 2, "interest": 2, "warrant": 2, "confidential": 2, "intellectual property": 2,
+    "governing law": 2, "jurisdiction": 2, "force majeure": 2, "personal data": 2, "data protection": 2,
+    "exclusiv": 2, "non-compete": 2, "breach": 2, "damages": 2, "insurance": 1, "assign": 1,
+    "renew": 1, "audit": 1, "notice": 1, "service level": 1, "publicity": 1,
+}
+STOPWORDS = frozenset(
+    "the a an and or of to in on for is are was be this that with what which who when where how "
+    "does do did can could should would will shall may any all there their its it as by at from "
+    "about under contract agreement document please tell me".split()
+)
+
+
+def estimate_tokens(text):
+    """Local token estimate (no network): about four characters per token."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_tokens(text, provider=None):
+    """Count with the provider when ``TOKEN_COUNTER=provider``, otherwise estimate locally.
+
+    Returns ``(tokens, counter_name)``. Provider failures fall back to the estimate.
+    """
+    if provider is not None and TOKEN_COUNTER == "provider":
+        try:
+            return provider.count_tokens(text), provider.name
+        except Exception:
+            pass
+    return estimate_tokens(text), "local"
+
+
+def split_sections(text):
+    """Split ``text`` into sections at clause headings, falling back to paragraphs."""
+    lines = text.splitlines(keepends=True)
+    sections, current = [], []
+    for line in lines:
+        if current and _HEADING.match(line):
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+    if len(sections) <= 1:
+        sections = [p for p in re.split(r"(?<=\n)\s*\n", text) if p.strip()] or [text]
+
+    result = []
+    for section in sections:
+        while len(section) > MAX_SECTION_CHARS:
+            cut = section.rfind("\n", 0, MAX_SECTION_CHARS)
+            cut = cut + 1 if cut > 0 else MAX_SECTION_CHARS
+            result.append(section[:cut])
+            section = section[cut:]
+        if section:
+            result.append(section)
+    return result
+
+
+def _risk_score(section):
+    lowered = section.lower()
+    return sum(weight * min(lowered.count(term), 3) for term, weight in RISK_TERMS.items())
+
+
+def _query_scores(sections, query):
+    terms = {w for w in _WORD.findall(query.lower()) if w not in STOPWORDS}
+    if not terms:
+        return [0.0] * len(sections)
+    counts = [Counter(_WORD.findall(s.lower())) for s in sections]
+    n = len(sections)
+    idf = {t: math.log(1 + n / (1 + sum(1 for c in counts if t in c))) for t in terms}
+    return [sum(min(c[t], 3) * idf[t] for t in terms) for c in counts]
+
+
+def fit_document(text, max_tokens, query=None):
+    """Return ``(fitted_text, report)`` with ``fitted_text`` within ``max_tokens`` (estimated).
+
+    With a ``query`` sections are ranked by relevance to it, otherwise by
+    risk-bearing terms. The first section (parties, recitals) is always kept
+    when it fits.
+    """
+    original = estimate_tokens(text)
+    if original <= max_tokens:
+        return text, {"original_document_tokens": original, "document_tokens": original,
+                      "sections_total": None, "sections_included": None, "fitted": False}
+
+    sections = split_sections(text)
+    sizes = [estimate_tokens(s) for s in sections]
+    if query:
+        scores = _query_scores(sections, query)
+    else:
+        scores = [_risk_score(s) for s in sections]
+    scores[0] = float("inf")
+
+    marker_tokens = estimate_tokens(OMISSION_MARKER.format(n=999)) + 1
+    remaining = max_tokens
+    keep = set()
+    for i in sorted(range(len(sections)), key=lambda i: (-scores[i], i)):
+        # Reserve room for one omission marker next to the kept section
+        if sizes[i] + marker_tokens <= remaining:
+            keep.add(i)
+            remaining -= sizes[i] + marker_tokens
+
+    parts, skipped = [], 0
+    for i, section in enumerate(sections):
+        if i in keep:
+            if skipped:
+                parts.append(OMISSION_MARKER.format(n=skipped) + "\n")
+                skipped = 0
+            parts.append(section if section.endswith("\n") else section + "\n")
+        else:
+            skipped += 1
+    if skipped:
+        parts.append(OMISSION_MARKER.format(n=skipped) + "\n")
+    fitted = "".join(parts)
+    return fitted, {"original_document_tokens": original, "document_tokens": estimate_tokens(fitted),
+                    "sections_total": len(sections), "sections_included": len(keep), "fitted": True}
+
+
+def fit_prompt(build_prompt, text, budget, query=None, provider=None):
+    """Fit ``text`` so that ``build_prompt(document)`` stays within ``budget`` tokens.
+
+    Returns ``(prompt, usage)`` where ``usage`` is the budget report for the
+    response metadata. Fitting uses the local estimate; with a provider
+    counter, a prompt the provider counts over ``budget`` is fitted again to
+    a document budget scaled down by the overshoot, and counted again.
+    """
+    overhead = estimate_tokens(build_prompt(""))
+    document_budget = max(budget - overhead, 0)
+    refits = 0
+    while True:
+        document, report = fit_document(text, document_budget, query=query)
+        prompt = build_prompt(document)
+        prompt_tokens, counter = count_tokens(prompt, provider)
+        if counter == "local" or prompt_tokens <= budget or refits == MAX_REFITS or document_budget == 0:
+            break
+        # The estimate undercounts this text; shrink the fitted document by the overshoot
+        fitted_tokens = min(document_budget, report["document_tokens"])
+        document_budget = int(fitted_tokens * budget / prompt_tokens * REFIT_MARGIN)
+        refits += 1
+    usage = {"budget": budget, "prompt_tokens": prompt_tokens, "counter": counter, "refits": refits}
+    usage.update(report)
+    return prompt, usage
@@ -1,14 +1,104 @@
 import sys
 import os
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QPushButton, QTextEdit, QVBoxLayout, QWidget, QFileDialog, QLabel, QHBoxLayout, QTableWidget, QTableWidgetItem, QSplitter, QLineEdit, QHeaderView, QToolBar, QAction, QMessageBox
+    QApplication, QMainWindow, QPushButton, QTextEdit, QVBoxLayout, QWidget, QFileDialog, QLabel, QHBoxLayout, QTableWidget, QTableWidgetItem, QSplitter, QLineEdit, QHeaderView, QToolBar, QAction, QMessageBox, QProgressDialog
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QIcon
 import requests
 import pandas as pd
 import io
 
+# `python desktop/main.py` only puts desktop/ on sys.path; the shared core package lives one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.export import ExportCancelled, available_formats, export_table
+from core.tables import describe_schema, infer_types
+
+EXPORT_FILTERS = {".xlsx": "Excel Files (*.xlsx)", ".csv": "CSV Files (*.csv)", ".parquet": "Parquet Files (*.parquet)"}
+
+
+class TableItem(QTableWidgetItem):
+    """A cell that shows text but sorts by its typed value: numbers numerically, dates in time order."""
+
+    def __init__(self, value):
+        missing = value is None or bool(pd.isna(value))
+        if missing:
+            text = ""
+        elif isinstance(value, pd.Timestamp):
+            text = value.strftime("%Y-%m-%d") if value == value.normalize() else str(value)
+        else:
+            text = str(value)
+        super().__init__(text)
+        # Missing values sort last
+        self.key = (1, "") if missing else (0, value)
+
+    def __lt__(self, other):
+        if isinstance(other, TableItem):
+            try:
+                return self.key < other.key
+            except TypeError:
+                return str(self.key[1]) < str(other.key[1])
+        return super().__lt__(other)
+
+
+class ExportThread(QThread):
+    """Writes the table (and the risk analysis) off the GUI thread, reporting rows written."""
+    progress = pyqtSignal(int, int)
+    finished_export = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, df, file_path, analysis=None, text=None):
+        super().__init__()
+        self.df = df
+        self.file_path = file_path
+        self.analysis = analysis
+        # Analyzed here first when there is no analysis yet
+        self.text = text
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def report(self, done, total):
+        if self._cancelled:
+            raise ExportCancelled()
+        self.progress.emit(done, total)
+
+    def run(self):
+        try:
+            analysis = self.analysis
+            if analysis is None and self.text:
+                resp = requests.post("http://127.0.0.1:8000/analyze-risks", json={"text": self.text})
+                if resp.status_code != 200:
+                    raise RuntimeError(f"Risk analysis failed: {resp.text}")
+                analysis = resp.json().get("analysis")
+                self.analysis = analysis
+            self.finished_export.emit(export_table(self.df, self.file_path, analysis, self.report))
+        except ExportCancelled:
+            self.failed.emit("Export cancelled.")
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class AnalyzeThread(QThread):
+    """Runs the risk analysis request off the GUI thread."""
+    finished_analysis = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+
+    def run(self):
+        try:
+            resp = requests.post("http://127.0.0.1:8000/analyze-risks", json={"text": self.text})
+            if resp.status_code != 200:
+                raise RuntimeError(resp.text)
+            self.finished_analysis.emit(resp.json().get("analysis"))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -18,9 +108,12 @@ class MainWindow(QMainWindow):
         # Toolbar
         toolbar = QToolBar("Main Toolbar")
         self.addToolBar(toolbar)
-        export_action = QAction(QIcon(), "Export to Excel", self)
-        export_action.triggered.connect(self.export_to_excel)
+        export_action = QAction(QIcon(), "Export...", self)
+        export_action.triggered.connect(self.export_table)
         toolbar.addAction(export_action)
+        self.analyze_action = QAction(QIcon(), "Analyze Risks", self)
+        self.analyze_action.triggered.connect(self.analyze_risks)
+        toolbar.addAction(self.analyze_action)
 
         # Main layout
         main_layout = QHBoxLayout()
@@ -69,7 +162,12 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(container)
 
         self.data_text = ""
+        self.chat_session_id = None
         self.df = None
+        self.schema = None
+        self.analysis = None
+        self.export_thread = None
+        self.analyze_thread = None
 
         # Modern stylesheet
         self.setStyleSheet("""
@@ -79,17 +177,82 @@ class MainWindow(QMainWindow):
             QLineEdit { font-size: 13px; padding: 4px; }
             QToolBar { background: #e0e0e0; border-bottom: 1px solid #b0b0b0; }
         """)
-    def export_to_excel(self):
-        if self.df is not None and not self.df.empty:
-            file_path, _ = QFileDialog.getSaveFileName(self, "Save Excel File", "", "Excel Files (*.xlsx)")
-            if file_path:
-                try:
-                    self.df.to_excel(file_path, index=False)
-                    QMessageBox.information(self, "Export Successful", f"Data exported to {file_path}")
-                except Exception as e:
-                    QMessageBox.critical(self, "Export Failed", str(e))
-        else:
+    def export_table(self):
+        if self.df is None or self.df.empty:
             QMessageBox.warning(self, "No Data", "No data to export.")
+            return
+        if self.export_thread is not None and self.export_thread.isRunning():
+            QMessageBox.information(self, "Export Running", "Wait for the current export to finish.")
+            return
+        formats = available_formats()
+        file_path, selected = QFileDialog.getSaveFileName(
+            self, "Export Data", "", ";;".join(EXPORT_FILTERS[suffix] for suffix in formats)
+        )
+        if not file_path:
+            return
+        if os.path.splitext(file_path)[1].lower() not in formats:
+            file_path += next((suffix for suffix in formats if EXPORT_FILTERS[suffix] == selected), formats[0])
+        text = None
+        if self.analysis is None and self.data_text:
+            answer = QMessageBox.question(
+                self, "Include Risk Analysis", "Run a risk analysis and export it alongside the table?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if answer == QMessageBox.Yes:
+                text = self.data_text
+
+        self.export_progress = QProgressDialog("Exporting...", "Cancel", 0, 0, self)
+        self.export_progress.setWindowTitle("Export")
+        self.export_progress.setWindowModality(Qt.WindowModal)
+        self.export_progress.setMinimumDuration(0)
+        self.export_thread = ExportThread(self.df, file_path, self.analysis, text)
+        self.export_thread.progress.connect(self.on_export_progress)
+        self.export_thread.finished_export.connect(self.on_export_finished)
+        self.export_thread.failed.connect(self.on_export_failed)
+        self.export_progress.canceled.connect(self.export_thread.cancel)
+        self.export_thread.start()
+
+    def on_export_progress(self, done, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(done)
+        self.export_progress.setLabelText(f"Exporting... {done:,} of {total:,} rows")
+
+    def on_export_finished(self, paths):
+        self.export_progress.reset()
+        if self.export_thread.analysis is not None:
+            self.analysis = self.export_thread.analysis
+        QMessageBox.information(self, "Export Successful", "Data exported to:\n" + "\n".join(paths))
+
+    def on_export_failed(self, message):
+        self.export_progress.reset()
+        QMessageBox.critical(self, "Export Failed", message)
+
+    def analyze_risks(self):
+        if not self.data_text:
+            QMessageBox.warning(self, "No Data", "No data loaded. Please upload a file first.")
+            return
+        if self.analyze_thread is not None and self.analyze_thread.isRunning():
+            return
+        self.analyze_action.setEnabled(False)
+        self.chat_display.append("Analyzing risks...")
+        self.analyze_thread = AnalyzeThread(self.data_text)
+        self.analyze_thread.finished_analysis.connect(self.on_analysis_finished)
+        self.analyze_thread.failed.connect(self.on_analysis_failed)
+        self.analyze_thread.start()
+
+    def on_analysis_finished(self, analysis):
+        if not isinstance(analysis, dict):
+            self.on_analysis_failed("The server returned no risk analysis.")
+            return
+        self.analyze_action.setEnabled(True)
+        self.analysis = analysis
+        level = self.analysis.get("overall_risk_level") or "unknown"
+        summary = self.analysis.get("summary", "")
+        self.chat_display.append(f"Risk analysis (overall risk: {level}): {summary}\n")
+
+    def on_analysis_failed(self, message):
+        self.analyze_action.setEnabled(True)
+        QMessageBox.critical(self, "Risk Analysis Failed", message)
 
     def open_file_dialog(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Open File", "", "PDF Files (*.pdf);;Word Files (*.docx)")
@@ -108,6 +271,8 @@ class MainWindow(QMainWindow):
                 if resp.status_code == 200:
                     data = resp.json()
                     self.data_text = data.get("text", "No text extracted.")
+                    self.chat_session_id = None
+                    self.analysis = None
                     self.display_table_from_text(self.data_text)
                 else:
                     self.table.setRowCount(0)
@@ -127,6 +292,7 @@ class MainWindow(QMainWindow):
             self.table.setColumnCount(1)
             self.table.setHorizontalHeaderLabels(["No Data"])
             self.df = None
+            self.schema = None
             return
         # Try to parse as table with header
         try:
@@ -134,23 +300,31 @@ class MainWindow(QMainWindow):
             data = [l.split() for l in lines[1:]]
             # Check if all rows have the same number of columns as header
             if all(len(row) == len(header) for row in data):
-                self.df = pd.DataFrame(data, columns=header)
-                self.table.setColumnCount(len(header))
-                self.table.setHorizontalHeaderLabels(header)
-                self.table.setRowCount(len(data))
-                for row_idx, row in enumerate(data):
-                    for col_idx, value in enumerate(row):
-                        self.table.setItem(row_idx, col_idx, QTableWidgetItem(value))
+                # Numbers, amounts and dates get native dtypes, so they sort and export as such
+                self.df, self.schema = infer_types(pd.DataFrame(data, columns=header))
+                self.fill_table(self.df)
+                for col_idx, line in enumerate(describe_schema(self.schema)):
+                    self.table.horizontalHeaderItem(col_idx).setToolTip(line)
+                self.statusBar().showMessage("Column types: " + "; ".join(describe_schema(self.schema)))
                 return
         except Exception:
             pass
         # Fallback: show as single column
         self.df = pd.DataFrame({'Extracted Data': lines})
-        self.table.setColumnCount(1)
-        self.table.setHorizontalHeaderLabels(["Extracted Data"])
-        self.table.setRowCount(len(lines))
-        for row_idx, value in enumerate(lines):
-            self.table.setItem(row_idx, 0, QTableWidgetItem(value))
+        self.schema = None
+        self.fill_table(self.df)
+        self.statusBar().clearMessage()
+
+    def fill_table(self, df):
+        # Sorting while filling would move rows under the loop
+        self.table.setSortingEnabled(False)
+        self.table.setColumnCount(df.shape[1])
+        self.table.setHorizontalHeaderLabels([str(c) for c in df.columns])
+        self.table.setRowCount(len(df))
+        for col_idx in range(df.shape[1]):
+            for row_idx, value in enumerate(df.iloc[:, col_idx].tolist()):
+                self.table.setItem(row_idx, col_idx, TableItem(value))
+        self.table.setSortingEnabled(True)
 
     def send_chat(self):
         question = self.chat_input.text().strip()
@@ -160,10 +334,14 @@ class MainWindow(QMainWindow):
         if self.data_text:
             try:
                 url = "http://127.0.0.1:8000/chat"
-                payload = {"text": self.data_text, "question": question}
+                # The server keeps the conversation; send its session ID back to continue it
+                payload = {"text": self.data_text, "question": question, "session_id": self.chat_session_id}
                 resp = requests.post(url, json=payload)
                 if resp.status_code == 200:
                     answer = resp.json().get("answer", "No answer from AI.")
+                    self.chat_session_id = resp.json().get("session_id")
+                    if (resp.json().get("route") or {}).get("path") == "local":
+                        answer += "\n(Answered from the document, without an AI call.)"
                 else:
                     answer = f"Error: {resp.text}"
             except Exception as e:
@@ -1,4 +1,6 @@
 let extractedText = '';
+// Server-side chat session; sent back with each question so follow-ups keep their context
+let chatSessionId = null;
 
 // DOM elements
 const uploadForm = document.getElementById('uploadForm');
@@ -39,10 +41,79 @@ uploadForm.addEventListener('submit', async (e) => {
     
     formData.append('file', file);
     
-    // Show loading with progress bar
-    showProgress(0, 'Preparing to extract text from document...');
+    showProgress(0, 'Uploading document...');
     
-    // Simulate progress during upload
+    try {
+        const result = await extractDocument(formData);
+        
+        updateProgress(100, 'Text extraction completed!');
+        extractedText = result.text;
+        chatSessionId = null;
+        
+        setTimeout(() => {
+            hideProgress();
+            showStatus(`✅ Successfully extracted text from ${file.name}`, 'success');
+        }, 500);
+        
+        showTextPreview(extractedText);
+        
+        // Enable chat
+        enableChat();
+        
+        // Show risk analysis button
+        riskAnalysisSection.style.display = 'block';
+        
+        // Show unload button
+        unloadFileBtn.style.display = 'block';
+    } catch (error) {
+        hideProgress();
+        showStatus(`❌ Error: ${error.message}`, 'danger');
+    }
+});
+
+function showTextPreview(text) {
+    extractedTextEl.textContent = text.substring(0, 300) + '...';
+    textPreview.style.display = 'block';
+}
+
+// Extraction runs as a background job so large scanned PDFs don't hit request timeouts;
+// deployments without the jobs API (Vercel) fall back to the synchronous /extract.
+// The first page comes back with the submit response, so the preview shows before the
+// rest of the document is done.
+async function extractDocument(formData) {
+    const response = await fetch('/extract/jobs?preview_pages=1', {
+        method: 'POST',
+        body: formData
+    });
+    
+    if (response.status === 404 || response.status === 405) {
+        return extractSynchronously(formData);
+    }
+    
+    const job = await response.json();
+    if (!response.ok) {
+        throw new Error(job.error);
+    }
+    
+    if (job.preview) {
+        showTextPreview(job.preview.text);
+    }
+    updateProgress(0, 'Waiting for an extraction worker...');
+    const finished = await followJob(job);
+    if (finished.status === 'failed') {
+        throw new Error(finished.error);
+    }
+    
+    const resultResponse = await fetch(job.status_url);
+    const result = await resultResponse.json();
+    if (!resultResponse.ok) {
+        throw new Error(result.error);
+    }
+    return result;
+}
+
+async function extractSynchronously(formData) {
+    // No real progress is available here, so estimate it
     let progress = 0;
     const progressInterval = setInterval(() => {
         progress += Math.random() * 15;
@@ -55,42 +126,80 @@ uploadForm.addEventListener('submit', async (e) => {
             method: 'POST',
             body: formData
         });
-        
-        clearInterval(progressInterval);
         const result = await response.json();
-        
-        if (response.ok) {
-            updateProgress(100, 'Text extraction completed!');
-            extractedText = result.text;
-            
-            setTimeout(() => {
-                hideProgress();
-                showStatus(`✅ Successfully extracted text from ${file.name}`, 'success');
-            }, 500);
-            
-            // Show text preview
-            extractedTextEl.textContent = extractedText.substring(0, 300) + '...';
-            textPreview.style.display = 'block';
-            
-            // Enable chat
-            enableChat();
-            
-            // Show risk analysis button
-            riskAnalysisSection.style.display = 'block';
-            
-            // Show unload button
-            unloadFileBtn.style.display = 'block';
-            
-        } else {
-            hideProgress();
-            showStatus(`❌ Error: ${result.error}`, 'danger');
+        if (!response.ok) {
+            throw new Error(result.error);
         }
-    } catch (error) {
+        return result;
+    } finally {
         clearInterval(progressInterval);
-        hideProgress();
-        showStatus(`❌ Error uploading file: ${error.message}`, 'danger');
     }
-});
+}
+
+// Resolves with the job status once it is done or failed. Uses Server-Sent Events and
+// falls back to polling the status URL if the stream breaks.
+function followJob(job) {
+    return new Promise((resolve) => {
+        const source = new EventSource(job.events_url);
+        const finish = (event) => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        };
+        source.addEventListener('progress', (event) => showJobProgress(JSON.parse(event.data)));
+        source.addEventListener('done', finish);
+        source.addEventListener('failed', finish);
+        // The stream ends with 'timeout' on long jobs; polling takes over as it does on errors
+        source.addEventListener('timeout', () => {
+            source.onerror = null;
+            source.close();
+            pollJob(job.status_url).then(resolve);
+        });
+        source.onerror = () => {
+            source.close();
+            pollJob(job.status_url).then(resolve);
+        };
+    });
+}
+
+async function pollJob(statusUrl) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const status = await response.json();
+        if (!response.ok) {
+            return { status: 'failed', error: status.error };
+        }
+        if (status.status === 'done' || status.status === 'failed') {
+            return status;
+        }
+        showJobProgress(status);
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+const STAGE_LABELS = {
+    pdf_text: 'Reading text layer',
+    ocr_rasterize: 'Rendering scanned pages',
+    ocr_page: 'Running OCR',
+    ocr_retry: 'Re-reading unclear pages at higher resolution',
+    docx_paragraphs: 'Reading Word document',
+    text_decode: 'Reading text file',
+    rtf_text: 'Reading RTF document'
+};
+
+function showJobProgress(status) {
+    if (status.status === 'queued') {
+        updateProgress(0, 'Waiting for an extraction worker...');
+        return;
+    }
+    const current = status.stage && status.progress[status.stage];
+    if (!current) {
+        updateProgress(0, 'Extracting text from document...');
+        return;
+    }
+    const label = STAGE_LABELS[status.stage] || status.stage;
+    const unit = status.stage === 'ocr_rasterize' ? '' : `: page ${current.done} of ${current.total}`;
+    updateProgress(100 * current.done / Math.max(current.total, 1), `${label}${unit}`);
+}
 
 // Chat form handler
 chatForm.addEventListener('submit', async (e) => {
@@ -118,7 +227,8 @@ chatForm.addEventListener('submit', async (e) => {
             },
             body: JSON.stringify({
                 text: extractedText,
-                question: question
+                question: question,
+                session_id: chatSessionId
             })
         });
         
@@ -128,12 +238,17 @@ chatForm.addEventListener('submit', async (e) => {
         document.getElementById(thinkingId).remove();
         
         if (response.ok) {
-            addMessage(result.answer, 'ai');
+            chatSessionId = result.session_id;
+            // Lookups answered from the document itself say so
+            const source = result.route && result.route.path === 'local'
+                ? '<div class="small text-muted mt-1"><i class="fas fa-bolt"></i> Answered from the document, without an AI call.</div>'
+                : '';
+            addMessage(result.answer + source, 'ai');
         } else {
             // Handle different error types with appropriate styling
             let errorClass = 'danger';
-            if (response.status === 429) {
-                errorClass = 'warning'; // Rate limit - use warning style
+            if (response.status === 429 || response.status === 503) {
+                errorClass = 'warning'; // Rate limit or server busy - use warning style
             }
             addMessage(`<div class="alert alert-${errorClass} mb-0">${result.error}</div>`, 'ai');
         }
@@ -151,6 +266,7 @@ chatForm.addEventListener('submit', async (e) => {
 
 // Clear chat handler
 clearChatBtn.addEventListener('click', () => {
+    chatSessionId = null;
     chatMessages.innerHTML = '<div class="alert alert-info"><i class="fas fa-info-circle"></i> Chat cleared. Ask a new question about your document.</div>';
 });
 
@@ -183,18 +299,19 @@ analyzeRisksBtn.addEventListener('click', async () => {
     }, 300);
     
     try {
-        const response = await fetch('/analyze-risks', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                text: extractedText
-            })
+        // Categories render as soon as the model finishes each one
+        const categories = [];
+        const response = await analyzeRisks(extractedText, (category) => {
+            categories.push(category);
+            clearInterval(progressInterval);
+            updateProgress(Math.max(progress, 90), `Received ${categories.length} risk ${categories.length === 1 ? 'category' : 'categories'}...`);
+            displayPartialRiskAnalysis(categories);
+            riskAnalysisResults.style.display = 'block';
+            riskAnalysisPlaceholder.style.display = 'none';
         });
         
         clearInterval(progressInterval);
-        const result = await response.json();
+        const result = response.result;
         
         if (response.ok) {
             updateProgress(100, 'Risk analysis completed!');
@@ -208,7 +325,7 @@ analyzeRisksBtn.addEventListener('click', async () => {
         } else {
             hideProgress();
             let errorClass = 'danger';
-            if (response.status === 429) {
+            if (response.status === 429 || response.status === 503) {
                 errorClass = 'warning';
             }
             showStatus(`<div class="alert alert-${errorClass} mb-0">${result.error}</div>`, errorClass);
@@ -224,6 +341,56 @@ analyzeRisksBtn.addEventListener('click', async () => {
     analyzeRisksBtn.innerHTML = '<i class="fas fa-exclamation-triangle"></i> Analyze Contract Risks';
 });
 
+// Streams /analyze-risks/stream (Server-Sent Events over a POST, so read with fetch rather
+// than EventSource) and falls back to /analyze-risks where the streaming route is unavailable.
+async function analyzeRisks(text, onCategory) {
+    const request = {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            text: text
+        })
+    };
+    const response = await fetch('/analyze-risks/stream', request);
+    
+    if (response.status === 404 || response.status === 405 || !response.body) {
+        const fallback = await fetch('/analyze-risks', request);
+        return { ok: fallback.ok, status: fallback.status, result: await fallback.json() };
+    }
+    if (!response.ok) {
+        return { ok: false, status: response.status, result: await response.json() };
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            throw new Error('The risk analysis stream ended unexpectedly.');
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = (message.match(/^event: (.*)$/m) || [])[1];
+            const data = JSON.parse((message.match(/^data: (.*)$/m) || [])[1] || 'null');
+            if (event === 'category') {
+                onCategory(data);
+            } else if (event === 'analysis') {
+                reader.cancel();
+                return { ok: true, status: 200, result: data };
+            } else if (event === 'error') {
+                reader.cancel();
+                return { ok: false, status: data.status, result: data };
+            }
+        }
+    }
+}
+
 // Close risk analysis handler
 closeRiskAnalysis.addEventListener('click', () => {
     riskAnalysisResults.style.display = 'none';
@@ -247,6 +414,7 @@ unloadFileBtn.addEventListener('click', () => {
 function resetApplication() {
     // Clear extracted text
     extractedText = '';
+    chatSessionId = null;
     
     // Reset file input
     document.getElementById('file').value = '';
@@ -353,36 +521,7 @@ function displayRiskAnalysis(analysis) {
         
         if (analysis.risk_categories && analysis.risk_categories.length > 0) {
             html += '<h6><i class="fas fa-list"></i> Risk Categories</h6>';
-            analysis.risk_categories.forEach(category => {
-                const categoryClass = getRiskLevelClass(category.level);
-                html += `
-                    <div class="card mb-3">
-                        <div class="card-header">
-                            <h6 class="mb-0">
-                                <span class="badge bg-${categoryClass}">${category.level || 'Unknown'}</span>
-                                ${category.category || 'Unknown Category'}
-                            </h6>
-                        </div>
-                        <div class="card-body">
-                            <p>${category.description || 'No description available'}</p>
-                            
-                            ${category.specific_clauses && category.specific_clauses.length > 0 ? `
-                                <h6>Specific Clauses:</h6>
-                                <ul>
-                                    ${category.specific_clauses.map(clause => `<li><small>${clause}</small></li>`).join('')}
-                                </ul>
-                            ` : ''}
-                            
-                            ${category.recommendations && category.recommendations.length > 0 ? `
-                                <h6>Recommendations:</h6>
-                                <ul class="text-success">
-                                    ${category.recommendations.map(rec => `<li><small>${rec}</small></li>`).join('')}
-                                </ul>
-                            ` : ''}
-                        </div>
-                    </div>
-                `;
-            });
+            html += analysis.risk_categories.map(renderRiskCategory).join('');
         }
         
         if (analysis.missing_protections && analysis.missing_protections.length > 0) {
@@ -409,6 +548,46 @@ function displayRiskAnalysis(analysis) {
     riskAnalysisContent.innerHTML = html;
 }
 
+function renderRiskCategory(category) {
+    const categoryClass = getRiskLevelClass(category.level);
+    return `
+        <div class="card mb-3">
+            <div class="card-header">
+                <h6 class="mb-0">
+                    <span class="badge bg-${categoryClass}">${category.level || 'Unknown'}</span>
+                    ${category.category || 'Unknown Category'}
+                </h6>
+            </div>
+            <div class="card-body">
+                <p>${category.description || 'No description available'}</p>
+                
+                ${category.specific_clauses && category.specific_clauses.length > 0 ? `
+                    <h6>Specific Clauses:</h6>
+                    <ul>
+                        ${category.specific_clauses.map(clause => `<li><small>${clause}</small></li>`).join('')}
+                    </ul>
+                ` : ''}
+                
+                ${category.recommendations && category.recommendations.length > 0 ? `
+                    <h6>Recommendations:</h6>
+                    <ul class="text-success">
+                        ${category.recommendations.map(rec => `<li><small>${rec}</small></li>`).join('')}
+                    </ul>
+                ` : ''}
+            </div>
+        </div>
+    `;
+}
+
+function displayPartialRiskAnalysis(categories) {
+    riskAnalysisContent.innerHTML = `
+        <div class="alert alert-info">
+            <i class="fas fa-spinner fa-spin"></i> Analysis in progress...
+        </div>
+        <h6><i class="fas fa-list"></i> Risk Categories</h6>
+    ` + categories.map(renderRiskCategory).join('');
+}
+
 function getRiskLevelClass(level) {
     if (!level) return 'secondary';
     switch (level.toLowerCase()) {